@@ -8,9 +8,9 @@
  * Ablauf:
  *  1. ?collab=<room> aus URL lesen
  *  2. Socket.IO verbinden via /uml/collab/
- *  3. Room joinen, aktuellen Diagram-Stand empfangen
- *  4. Änderungen im PlantUML-Textarea abfangen & broadcasten
- *  5. Eingehende Updates in den Editor schreiben
+ *  3. Room joinen, Snapshot (Text + Revision) empfangen
+ *  4. Änderungen im PlantUML-Textarea als Patch gegen die Revision senden
+ *  5. Eingehende Patches in den Editor einarbeiten (bei Lücken: Resync per Snapshot)
  *  6. Share-Button + Status-Anzeige ins DOM injizieren
  */
 
@@ -25,6 +25,11 @@
         socketPath: '/uml/collab/socket.io',
         // Debounce: Wie lange nach letzter Eingabe warten bevor Update gesendet wird (ms)
         debounceMs: 300,
+        // Patches ab dieser JSON-Größe komprimiert senden (wenn der Server deflate-raw bestätigt)
+        compressMin: 1024,
+        // Wie lange auf fehlende Revisionen gewartet wird, bevor ein Resync angefordert wird (ms).
+        // Mehrere Worker senden ihre Broadcast-Fenster unabhängig, Patches können daher überholen
+        gapWaitMs: 1000,
         // URL-Parameter Name für Room-ID
         roomParam: 'collab',
         // CSS-Klassen Prefix
@@ -116,6 +121,32 @@
         let debounceTimer = null;
         let editor = null;
 
+        // Revisions-Sync: shadow ist der Server-Text bei rev (inkl. bestätigter eigener Patches),
+        // inflight der gesendete, noch unbestätigte Patch. Pro Client ist höchstens einer unterwegs.
+        let rev = null;
+        let shadow = '';
+        let inflight = null;
+        // Vorausgeeilte Patches {rev: patch}, bis die Lücke davor geschlossen ist
+        let ahead = new Map();
+        let gapTimer = null;
+        // true, sobald der Server Renderings pusht: dann rendert dieser Client Remote-Änderungen nicht selbst
+        let serverRender = false;
+        // Server hat deflate-raw bestätigt: große Patches komprimiert senden
+        let sendCompressed = false;
+        // Zustands-Events werden asynchron entpackt; die Kette hält ihre Reihenfolge
+        let inbox = Promise.resolve();
+
+        function onState(event, handler) {
+            socket.on(event, function (data) {
+                inbox = inbox.then(function () {
+                    return unpackPayload(data);
+                }).then(handler).catch(function (err) {
+                    console.error('[EMPC4 Collab] ' + event + ' nicht lesbar: ' + err);
+                    requestResync();
+                });
+            });
+        }
+
         // ------------------------------
         // Socket.IO Events
         // ------------------------------
@@ -124,8 +155,16 @@
             console.log('[EMPC4 Collab] Verbunden. SID: ' + socket.id);
             setStatus('connected', 'Verbunden · Room: ' + roomId);
 
-            // Room joinen
-            socket.emit('join', { room: roomId });
+            // Room joinen - Server antwortet mit diagram_snapshot
+            rev = null;
+            inflight = null;
+            resetAhead();
+            sendCompressed = false;
+            socket.emit('join', {
+                room: roomId,
+                protocol: 'patch',
+                compression: CAN_DEFLATE ? ['deflate-raw'] : [],
+            });
         });
 
         socket.on('disconnect', function (reason) {
@@ -152,23 +191,178 @@
             setUserCount(data.users_count);
         });
 
-        // Diagram-Update vom Server empfangen
-        socket.on('diagram_update', function (data) {
+        // Vollständiger Stand: beim Join und nach Konflikten/Lücken
+        onState('diagram_snapshot', function (data) {
             if (!editor) {
                 editor = findEditor();
             }
+            shadow = data.text;
+            rev = data.rev;
+            inflight = null;
+            if (data.compression) {
+                sendCompressed = data.compression === 'deflate-raw';
+            }
+            console.log('[EMPC4 Collab] Snapshot empfangen: Rev ' + rev + ', ' + data.text.length + ' Zeichen'
+                + (data.reason ? ' (' + data.reason + ')' : ''));
+            if (!editor) return;
+
+            if (rev === 0 && !data.text) {
+                // Leerer, neuer Room: lokalen Editor-Inhalt als Startstand senden
+                sendPatch();
+                return;
+            }
+            setEditorText(data.text, null);
+            // Schon eingetroffene neuere Patches direkt anwenden
+            drainAhead();
+        });
+
+        // Alle Patches eines Broadcast-Fensters in Sequenz-Reihenfolge;
+        // der eigene Eintrag (from_sid === socket.id) ist die Bestätigung des gesendeten Patches
+        onState('diagram_patches', function (data) {
+            if (rev === null) return;
+            if (!editor) {
+                editor = findEditor();
+            }
+            for (const patch of data.patches) {
+                if (patch.rev > rev) ahead.set(patch.rev, patch);  // ältere sind schon im Snapshot enthalten
+            }
+            drainAhead();
+        });
+
+        // Patches lückenlos ab rev + 1 anwenden; bei einer Lücke kurz auf den fehlenden warten
+        function drainAhead() {
+            for (const known of ahead.keys()) {
+                if (known <= rev) ahead.delete(known);
+            }
+            const before = rev;
+            while (ahead.has(rev + 1)) {
+                const patch = ahead.get(rev + 1);
+                ahead.delete(rev + 1);
+                if (patch.from_sid === socket.id && inflight) {
+                    shadow = applyPatch(shadow, patch);
+                    rev = patch.rev;
+                    inflight = null;
+                } else {
+                    applyRemotePatch(patch);
+                }
+            }
+            if (ahead.size === 0 || rev !== before) {
+                // Fortschritt: Wartezeit für eine verbleibende Lücke neu beginnen
+                clearTimeout(gapTimer);
+                gapTimer = null;
+            }
+            if (ahead.size > 0 && gapTimer === null) {
+                gapTimer = setTimeout(function () {
+                    gapTimer = null;
+                    if (ahead.size === 0 || rev === null) return;
+                    console.warn('[EMPC4 Collab] Revisionslücke nach Rev ' + rev + ', Resync');
+                    requestResync();
+                }, CONFIG.gapWaitMs);
+            }
+            // Während des Wartens getippte Änderungen hinterherschicken
+            sendPatch();
+        }
+
+        function resetAhead() {
+            ahead.clear();
+            clearTimeout(gapTimer);
+            gapTimer = null;
+        }
+
+        // Eingangs-Limit des Servers erreicht: Patch verworfen, später mit neueren Änderungen erneut senden
+        socket.on('patch_nack', function (data) {
+            inflight = null;
+            setTimeout(sendPatch, data.retry_ms || 100);
+        });
+
+        // Delta eines anderen Clients
+        function applyRemotePatch(patch) {
+            // Lokale, noch nicht bestätigte Änderungen relativ zum alten Schatten-Text
+            const local = editor ? diffText(shadow, editor.value) : null;
+            shadow = applyPatch(shadow, patch);
+            rev = patch.rev;
             if (!editor) return;
 
-            console.log('[EMPC4 Collab] Update empfangen: ' + data.text.length + ' Zeichen');
+            if (!local) {
+                setEditorText(shadow, patch);
+                return;
+            }
+            const rebased = transformPatch(patch, local);
+            if (rebased === null) {
+                // Gleiche Stelle bearbeitet: Server-Stand gewinnt, Server lehnt unseren Patch ab
+                console.warn('[EMPC4 Collab] Konflikt mit Patch von ' + patch.from_sid + ', übernehme Server-Stand');
+                setEditorText(shadow, null);
+                return;
+            }
+            setEditorText(applyPatch(editor.value, rebased), rebased);
+        }
+
+        // Serverseitiges Rendering des Room-Texts (einmal pro Edit-Burst für alle Zuschauer)
+        socket.on('diagram_render', function (data) {
+            if (rev !== null && data.rev < rev) return;  // veraltet, neueres Rendering folgt
+            const preview = findPreview();
+            if (!preview) {
+                serverRender = false;
+                return;
+            }
+            serverRender = true;
+            preview.onerror = function () {
+                // Nicht mehr im Cache (verdrängt/abgelaufen): wieder lokal rendern
+                serverRender = false;
+                preview.onerror = null;
+                if (editor) triggerEditorUpdate(editor);
+            };
+            preview.src = data.url;
+        });
+
+        function requestResync() {
+            rev = null;
+            inflight = null;
+            resetAhead();
+            socket.emit('resync', { room: roomId });
+        }
+
+        function sendPatch() {
+            if (!editor || rev === null || inflight) return;
+            const patch = diffText(shadow, editor.value);
+            if (!patch) return;
+            inflight = patch;
+            const payload = {
+                room: roomId,
+                base_rev: rev,
+                pos: patch.pos,
+                del: patch.del,
+                ins: patch.ins,
+                cursor: editor.selectionStart,
+            };
+            if (sendCompressed && patch.ins.length >= CONFIG.compressMin) {
+                // z.B. eingefügter Diagramm-Text: als binärer deflate-raw Frame
+                packPayload(payload).then(function (packed) {
+                    socket.emit('diagram_patch', packed);
+                });
+            } else {
+                socket.emit('diagram_patch', payload);
+            }
+            console.log('[EMPC4 Collab] Patch gesendet: Rev ' + rev + ', -' + patch.del + '/+' + patch.ins.length + ' Zeichen');
+        }
 
+        function setEditorText(text, patch) {
+            const start = editor.selectionStart;
+            const end = editor.selectionEnd;
             // Setze Flag damit eigener input-Listener nicht reagiert
             isRemoteUpdate = true;
-            editor.value = data.text;
+            editor.value = text;
+            if (patch && document.activeElement === editor) {
+                // Cursor hinter eingefügtem Text bleibt an seiner Stelle im Dokument
+                editor.setSelectionRange(shiftPosition(start, patch), shiftPosition(end, patch));
+            }
+            // PlantUML-interne Events auslösen damit Vorschau aktualisiert wird -
+            // außer der Server pusht das Rendering ohnehin (diagram_render)
+            if (!serverRender) {
+                triggerEditorUpdate(editor);
+            }
             isRemoteUpdate = false;
-
-            // PlantUML-interne Events auslösen damit Vorschau aktualisiert wird
-            triggerEditorUpdate(editor);
-        });
+        }
 
         // ------------------------------
         // Editor-Hook: Änderungen abfangen
@@ -199,14 +393,7 @@
                 if (isRemoteUpdate) return;
 
                 clearTimeout(debounceTimer);
-                debounceTimer = setTimeout(function () {
-                    socket.emit('diagram_update', {
-                        room: roomId,
-                        text: textarea.value,
-                        cursor: textarea.selectionStart,
-                    });
-                    console.log('[EMPC4 Collab] Update gesendet: ' + textarea.value.length + ' Zeichen');
-                }, CONFIG.debounceMs);
+                debounceTimer = setTimeout(sendPatch, CONFIG.debounceMs);
             });
 
             // Auch keyup für ältere Browser
@@ -217,6 +404,75 @@
         }
     }
 
+    // -------------------------------------------------------
+    // Text-Patches: ein Splice {pos, del, ins} (Positionen in UTF-16 Code Units,
+    // wie plantuml-sync/textpatch.py)
+    // -------------------------------------------------------
+    function diffText(oldText, newText) {
+        if (oldText === newText) return null;
+        const limit = Math.min(oldText.length, newText.length);
+        let start = 0;
+        while (start < limit && oldText.charCodeAt(start) === newText.charCodeAt(start)) start++;
+        let end = 0;
+        while (end < limit - start
+            && oldText.charCodeAt(oldText.length - 1 - end) === newText.charCodeAt(newText.length - 1 - end)) end++;
+        return {
+            pos: start,
+            del: oldText.length - end - start,
+            ins: newText.substring(start, newText.length - end),
+        };
+    }
+
+    function applyPatch(text, patch) {
+        return text.substring(0, patch.pos) + patch.ins + text.substring(patch.pos + patch.del);
+    }
+
+    // patch (gegen den Text vor applied) hinter applied verschieben; null bei Überlappung
+    function transformPatch(patch, applied) {
+        const end = patch.pos + patch.del;
+        const appliedEnd = applied.pos + applied.del;
+        if (patch.pos === applied.pos && patch.del === 0 && applied.del === 0) {
+            return { pos: patch.pos + applied.ins.length, del: 0, ins: patch.ins };
+        }
+        if (end <= applied.pos) return patch;
+        if (patch.pos >= appliedEnd) {
+            return { pos: patch.pos + applied.ins.length - applied.del, del: patch.del, ins: patch.ins };
+        }
+        return null;
+    }
+
+    function shiftPosition(position, patch) {
+        if (position <= patch.pos) return position;
+        if (position >= patch.pos + patch.del) return position + patch.ins.length - patch.del;
+        return patch.pos + patch.ins.length;
+    }
+
+    // -------------------------------------------------------
+    // Komprimierte Payloads: JSON, raw-deflated (wie die PlantUML-URL-Kodierung)
+    // -------------------------------------------------------
+    const CAN_DEFLATE = (function () {
+        try {
+            new DecompressionStream('deflate-raw');
+            new CompressionStream('deflate-raw');
+            return true;
+        } catch (e) {
+            return false;
+        }
+    })();
+
+    function unpackPayload(data) {
+        if (!data || !data.deflate) return Promise.resolve(data);
+        const stream = new Blob([data.deflate]).stream().pipeThrough(new DecompressionStream('deflate-raw'));
+        return new Response(stream).text().then(JSON.parse);
+    }
+
+    function packPayload(payload) {
+        const stream = new Blob([JSON.stringify(payload)]).stream().pipeThrough(new CompressionStream('deflate-raw'));
+        return new Response(stream).arrayBuffer().then(function (buffer) {
+            return { room: payload.room, deflate: buffer };
+        });
+    }
+
     // -------------------------------------------------------
     // PlantUML interne Vorschau aktualisieren
     // Jetty PlantUML hat einen Submit-Button oder Auto-Refresh
@@ -251,6 +507,23 @@
         }
     }
 
+    function findPreview() {
+        // Vorschau-Bild der PlantUML-Seite (Selektoren wie bei findEditor)
+        const selectors = [
+            'img#diagram-png',
+            'img#diagram',
+            '#diagram img',
+            'img[src*="/png/"]',
+            'img[src*="/svg/"]',
+        ];
+
+        for (const selector of selectors) {
+            const el = document.querySelector(selector);
+            if (el) return el;
+        }
+        return null;
+    }
+
     // -------------------------------------------------------
     // UI: Status-Badge + Share-Button injizieren
     // -------------------------------------------------------
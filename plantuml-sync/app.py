@@ -7,10 +7,23 @@ Synchronizes PlantUML diagram text between multiple clients via WebSocket
 import eventlet
 eventlet.monkey_patch()  # Muss VOR allen anderen Imports stehen - patcht stdlib fuer async WebSocket
 
-from flask import Flask, request
+from eventlet import tpool
+from flask import Flask, Response, request
 from flask_socketio import SocketIO, emit, join_room, leave_room, Namespace
+import atexit
+import functools
 import logging
+import os
 import sys
+import time
+
+from compression import ENCODING, PayloadError, TrafficCounter, pack, unpack, wire_size
+from fanout import RateLimiter, RoomFanout
+from metrics import CONTENT_TYPE, FANOUT_BUCKETS, SIZE_BUCKETS, MetricsRegistry, SampledLog
+from render import RenderCache, RoomRenderer, SharedRenderCache
+from rooms import RedisRoomRegistry, RoomRegistry
+from snapshots import SnapshotStore
+from textpatch import PatchError, apply_patch, make_patch, transform, validate
 
 # Configure logging
 logging.basicConfig(
@@ -22,84 +35,433 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Gemeinsamer Zustand für mehrere Worker/Replicas: Redis (oder kompatibel) als
+# Socket.IO message_queue und Room-Store. Leer = alles im Prozess (ein Worker)
+REDIS_URL = os.environ.get('SYNC_REDIS_URL', '')
+REDIS_PREFIX = os.environ.get('SYNC_REDIS_PREFIX', 'plantuml-sync:')
+# Weitere Worker auf demselben Host brauchen eigene Ports
+PORT = int(os.environ.get('SYNC_PORT', '5001'))
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'plantuml-collab-secret-2026'
 socketio = SocketIO(
     app,
     cors_allowed_origins="*",
     async_mode='eventlet',
-    logger=True,
+    message_queue=REDIS_URL or None,
+    channel=f'{REDIS_PREFIX}socketio',
+    # logger=True loggt jedes emit auf INFO - pro Tastendruck zu laut, nur zur Fehlersuche
+    logger=os.environ.get('SYNC_SOCKETIO_LOG', '') == '1',
     engineio_logger=False  # Too verbose
 )
 
-# Store diagram state per room
-# Structure: {room_id: {'text': str, 'users': set}}
-rooms_data = {}
+# Anzahl der letzten Patches pro Room, gegen die verspätete Client-Patches rebased werden
+PATCH_HISTORY = 200
+
+# Dauerhafte Room-Snapshots (SQLite, write-behind). Leer = Rooms verschwinden mit dem letzten User
+SNAPSHOT_DB = os.environ.get('SYNC_SNAPSHOT_DB', '')
+SNAPSHOT_FLUSH_S = float(os.environ.get('SYNC_SNAPSHOT_FLUSH_S', '2'))
+# Rooms ohne Änderung seit so vielen Sekunden werden aus dem Speicher ausgelagert (0 = nie)
+PAGE_OUT_S = int(os.environ.get('SYNC_PAGE_OUT_S', '600'))
+
+# SQLite-Zugriffe in echten Threads (tpool), damit Flush und Cold-Load den Hub nicht blockieren
+snapshots = SnapshotStore(SNAPSHOT_DB, offload=tpool.execute) if SNAPSHOT_DB else None
+
+# Diagram state and membership per room, indexed room → sids and sid → rooms
+if REDIS_URL:
+    registry = RedisRoomRegistry(REDIS_URL, history=PATCH_HISTORY, prefix=REDIS_PREFIX,
+                                 loader=snapshots.load if snapshots else None)
+else:
+    registry = RoomRegistry(history=PATCH_HISTORY, loader=snapshots.load if snapshots else None)
+
+# Broadcast-Fenster: Updates innerhalb dieses Zeitraums gehen als ein Broadcast raus
+COALESCE_MS = int(os.environ.get('SYNC_COALESCE_MS', '40'))
+# Eingehende Updates pro Client (Patches, Volltext, Cursor) - Token Bucket
+RATE_LIMIT = float(os.environ.get('SYNC_RATE_LIMIT', '30'))
+RATE_BURST = int(os.environ.get('SYNC_RATE_BURST', '60'))
+# Ab so vielen wartenden Paketen gilt ein Client als langsam und wird übersprungen
+SLOW_QUEUE = int(os.environ.get('SYNC_SLOW_QUEUE', '64'))
+
+# Komprimierte Payloads für Clients, die 'deflate-raw' aushandeln: ab dieser JSON-Größe (0 = aus)
+COMPRESS_MIN = int(os.environ.get('SYNC_COMPRESS_MIN', '1024'))
+# Obergrenze für entpackte Client-Payloads
+MAX_PAYLOAD = int(os.environ.get('SYNC_MAX_PAYLOAD', str(4 * 1024 * 1024)))
+
+# Serverseitiges Rendern: einmal pro Edit-Burst statt einmal pro Zuschauer. Leer = aus
+RENDER_URL = os.environ.get('SYNC_RENDER_URL', '')
+RENDER_DEBOUNCE_MS = int(os.environ.get('SYNC_RENDER_DEBOUNCE_MS', '300'))
+RENDER_CACHE_MB = int(os.environ.get('SYNC_RENDER_CACHE_MB', '32'))
+# Mit SYNC_REDIS_URL liegen die SVGs zusätzlich in Redis, damit jeder Worker jede Render-URL ausliefert
+RENDER_TTL_S = int(os.environ.get('SYNC_RENDER_TTL_S', str(24 * 3600)))
+# Pfad, unter dem Browser /<hash>.svg abrufen (über nginx/Traefik)
+RENDER_PUBLIC_PATH = os.environ.get('SYNC_RENDER_PUBLIC_PATH', '/plantuml-sync/render')
+
+
+# Socket.IO-Unterräume je Protokoll: Patch-Clients bekommen nur Deltas (komprimierend oder nicht),
+# Full-Text-Clients (Jetty sync.js) weiterhin den ganzen Text
+def _patch_room(room, compressed=False):
+    return f'{room}\0patch-z' if compressed else f'{room}\0patch'
+
+def _text_room(room):
+    return f'{room}\0text'
+
+def _sub_rooms(room):
+    return [(_patch_room(room), False), (_patch_room(room, True), True)], _text_room(room)
+
+
+traffic = TrafficCounter()
+
+# Prometheus-Metriken (/metrics); Zähler aus Registry, Fanout usw. werden erst beim Scrape gelesen
+metrics = MetricsRegistry('plantuml_sync_')
+events_total = metrics.counter('events_total', 'Inbound Socket.IO events', ('namespace', 'event'))
+handler_seconds = metrics.histogram('handler_seconds', 'Handler latency per event', ('namespace', 'event'))
+payload_bytes = metrics.histogram('payload_bytes', 'Payload size on the wire per event',
+                                  ('direction', 'event'), SIZE_BUCKETS)
+fanout_receivers = metrics.histogram('fanout_receivers', 'Receivers per emit', ('event',), FANOUT_BUCKETS)
+hub_lag_seconds = metrics.histogram('hub_lag_seconds', 'Eventlet hub loop lag (late wake-ups of a timer)')
+
+# Hot Path (Updates, Joins, Leaves): Summe pro Intervall auf INFO, Einzelereignisse nur auf DEBUG
+LOG_INTERVAL_S = float(os.environ.get('SYNC_LOG_INTERVAL_S', '60'))
+hot_log = SampledLog(logger, LOG_INTERVAL_S)
+# Wie oft der Hub-Monitor aufwacht; jede Verspätung ist Zeit, in der kein Handler lief
+HUB_PROBE_S = 0.5
+
+def _pack(payload):
+    return pack(payload, COMPRESS_MIN)
+
+def _emit(event, data, to, namespace, skip_sid=None, room=None):
+    """socketio.emit, counting the bytes sent per diagram room"""
+    socketio.emit(event, data, to=to, namespace=namespace, skip_sid=skip_sid)
+    try:
+        receivers = len(socketio.server.manager.rooms[namespace][to])
+    except (KeyError, TypeError):
+        return
+    if skip_sid:
+        receivers -= 1 if isinstance(skip_sid, str) else len(skip_sid)
+    if receivers > 0:
+        wire, raw = wire_size(data)
+        traffic.add_out(room or to.split('\0', 1)[0], wire, raw, receivers)
+        payload_bytes.observe(wire, direction='out', event=event)
+        fanout_receivers.observe(receivers, event=event)
+
+def _count_in(room, event, data):
+    if isinstance(data, dict) and isinstance(data.get('deflate'), (bytes, bytearray)):
+        size = len(data['deflate'])
+    else:
+        size = wire_size(data)[0]
+    traffic.add_in(room, size)
+    payload_bytes.observe(size, direction='in', event=event)
+
+def _send_snapshot(namespace, sid, room, compressed, reason=None):
+    """Full state to one patch client, deflated if it negotiated compression"""
+    text, rev = registry.snapshot(room)
+    payload = {'text': text, 'rev': rev}
+    if reason:
+        payload['reason'] = reason
+    if compressed:
+        payload['compression'] = ENCODING
+        payload = _pack(payload)
+    _emit('diagram_snapshot', payload, to=sid, namespace=namespace, room=room)
+
+
+def _queue_size(sid, namespace):
+    """Packets waiting in the Engine.IO queue of a client, None if unknown"""
+    try:
+        eio_sid = socketio.server.manager.eio_sid_from_sid(sid, namespace)
+        return socketio.server.eio.sockets[eio_sid].queue.qsize()
+    except (KeyError, AttributeError, TypeError):
+        return None
+
+def _resync_client(namespace, room, sid):
+    """Full current state to one client that skipped broadcasts"""
+    joined = socketio.server.manager.get_rooms(sid, namespace)
+    if _patch_room(room) in joined or _patch_room(room, True) in joined:
+        _send_snapshot(namespace, sid, room, _patch_room(room, True) in joined, 'slow consumer')
+    else:
+        text, rev = registry.snapshot(room)
+        _emit('diagram_update', {'text': text, 'cursor': None}, to=sid, namespace=namespace, room=room)
+
+fanout = RoomFanout(
+    _emit,
+    eventlet.spawn_after,
+    _queue_size,
+    registry.members,
+    _resync_client,
+    _sub_rooms,
+    window=COALESCE_MS / 1000,
+    max_queue=SLOW_QUEUE,
+    pack=_pack,
+)
+limiter = RateLimiter(RATE_LIMIT, RATE_BURST)
+renderer = RoomRenderer(
+    RENDER_URL,
+    _emit,
+    eventlet.spawn_after,
+    registry.snapshot,
+    public_path=RENDER_PUBLIC_PATH,
+    debounce=RENDER_DEBOUNCE_MS / 1000,
+    cache=(SharedRenderCache(REDIS_URL, RENDER_CACHE_MB * 1024 * 1024, prefix=REDIS_PREFIX, ttl=RENDER_TTL_S)
+           if REDIS_URL else RenderCache(RENDER_CACHE_MB * 1024 * 1024)),
+) if RENDER_URL else None
+# Gedrosselte Volltext-Updates: {(namespace, sid): (room, text, cursor)} - nur das letzte zählt
+deferred_updates = {}
 
 
 # ============================================================================
 # Shared handler logic (used by both namespaces)
 # ============================================================================
 
+def _instrumented(event):
+    """Count the event per namespace and record the handler latency"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args):
+            namespace = request.namespace
+            events_total.inc(namespace=namespace, event=event)
+            started = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                handler_seconds.observe(time.perf_counter() - started, namespace=namespace, event=event)
+        return wrapper
+    return decorator
+
+@_instrumented('connect')
 def _on_connect():
-    logger.info(f"Client connected: {request.sid}")
+    hot_log.event('connect', None, f"[{request.namespace}] Client connected: {request.sid}")
     emit('connected', {'sid': request.sid})
 
+@_instrumented('disconnect')
 def _on_disconnect():
-    logger.info(f"Client disconnected: {request.sid}")
-    for room_id, room_data in list(rooms_data.items()):
-        if request.sid in room_data.get('users', set()):
-            room_data['users'].discard(request.sid)
-            logger.info(f"Removed {request.sid} from room {room_id}")
-            emit('user_left', {'sid': request.sid}, room=room_id)
-            if len(room_data['users']) == 0:
-                del rooms_data[room_id]
-                logger.info(f"Removed empty room: {room_id}")
+    hot_log.event('disconnect', None, f"[{request.namespace}] Client disconnected: {request.sid}")
+    limiter.forget(request.sid)
+    fanout.forget(request.namespace, request.sid)
+    deferred_updates.pop((request.namespace, request.sid), None)
+    for room, remaining in registry.leave_all(request.sid):
+        logger.debug(f"Removed {request.sid} from room {room}")
+        emit('user_left', {'sid': request.sid, 'users_count': remaining}, room=room)
+        if remaining == 0:
+            _room_removed(room)
+
+def _room_removed(room):
+    hot_log.event('room_removed', room, f"Removed empty room: {room}")
+    if renderer:
+        renderer.forget(room)
+    traffic.forget(room)
+
+def _join(room, patch_protocol, compressed=False):
+    """Registry und Socket.IO-Rooms gemeinsam pflegen"""
+    join_room(room)
+    join_room(_patch_room(room, compressed) if patch_protocol else _text_room(room))
+    return registry.join(room, request.sid)
 
+@_instrumented('join')
 def _on_join(data):
     room = data.get('room', 'default')
-    join_room(room)
-    if room not in rooms_data:
-        rooms_data[room] = {'text': '', 'users': set()}
-    rooms_data[room]['users'].add(request.sid)
-    logger.info(f"Client {request.sid} joined room: {room} ({len(rooms_data[room]['users'])} users)")
-    if rooms_data[room]['text']:
-        emit('diagram_update', {'text': rooms_data[room]['text'], 'cursor': None})
+    patch_protocol = data.get('protocol') == 'patch'
+    # Kompression nur für Patch-Clients, die sie anbieten (sync.js kennt sie nicht)
+    compressed = patch_protocol and bool(COMPRESS_MIN) and ENCODING in (data.get('compression') or ())
+    users_count = _join(room, patch_protocol, compressed)
+    text, rev = registry.snapshot(room)
+    hot_log.event('join', room, f"Client {request.sid} joined room: {room} ({users_count} users)")
+    if patch_protocol:
+        # Patch-Clients brauchen die Revision, auch bei leerem Text
+        _send_snapshot(request.namespace, request.sid, room, compressed)
+    elif text:
+        _emit('diagram_update', {'text': text, 'cursor': None}, to=request.sid,
+              namespace=request.namespace, room=room)
+    render = renderer.current(text, rev) if renderer else None
+    if render:
+        emit('diagram_render', render)
     emit('user_joined', {
         'sid': request.sid,
-        'users_count': len(rooms_data[room]['users'])
+        'users_count': users_count
     }, room=room, skip_sid=request.sid)
 
+@_instrumented('leave')
 def _on_leave(data):
     room = data.get('room', 'default')
     leave_room(room)
-    if room in rooms_data:
-        rooms_data[room]['users'].discard(request.sid)
-        users_remaining = len(rooms_data[room]['users'])
-        logger.info(f"Client {request.sid} left room: {room} ({users_remaining} users remaining)")
-        emit('user_left', {'sid': request.sid, 'users_count': users_remaining}, room=room)
-        if users_remaining == 0:
-            del rooms_data[room]
-            logger.info(f"Removed empty room: {room}")
-
+    leave_room(_patch_room(room))
+    leave_room(_patch_room(room, True))
+    leave_room(_text_room(room))
+    users_remaining = registry.leave(room, request.sid)
+    if users_remaining is None:
+        return
+    hot_log.event('leave', room, f"Client {request.sid} left room: {room} ({users_remaining} users remaining)")
+    emit('user_left', {'sid': request.sid, 'users_count': users_remaining}, room=room)
+    if users_remaining == 0:
+        _room_removed(room)
+
+def _ensure_member(room, patch_protocol=False):
+    """Room anlegen und Client nachträglich aufnehmen, falls sein join verloren ging"""
+    if not registry.is_member(room, request.sid):
+        logger.warning(f"[{request.namespace}] Auto-join {request.sid} into room '{room}' (missed join event)")
+        # Ohne join keine ausgehandelte Kompression: Patch-Clients landen im unkomprimierten Unterraum
+        _join(room, patch_protocol)
+
+def _commit(namespace, sid, room, change, cursor, base_rev=None, text_sid=None):
+    """Sequence a change through the registry and queue it for the room's next broadcast"""
+    committed = registry.update(room, change, base_rev)
+    if committed is None:
+        return False
+    rev, patch, text = committed
+    fanout.add_patch(namespace, room, rev, patch, cursor, sid, text, text_sid)
+    if snapshots:
+        snapshots.mark(room, text, rev)
+    if renderer:
+        renderer.schedule(namespace, room)
+    return True
+
+def _apply_text(namespace, sid, room, text, cursor):
+    def change(current, newer):
+        patch = make_patch(current, text)
+        return (text, patch) if patch is not None else None
+    if not _commit(namespace, sid, room, change, cursor, text_sid=sid):
+        # Unveränderter Text: nur den Cursor weiterreichen
+        fanout.add_cursor(namespace, room, sid, cursor)
+
+def _apply_deferred(namespace, sid):
+    key = (namespace, sid)
+    if key not in deferred_updates:
+        return
+    if not limiter.allow(sid):
+        # Nachgereichte Updates kosten ebenfalls ein Token - sonst umgehen sie das Limit
+        eventlet.spawn_after(limiter.retry_after(sid), _apply_deferred, namespace, sid)
+        return
+    room, text, cursor = deferred_updates.pop(key)
+    if registry.is_member(room, sid):
+        _apply_text(namespace, sid, room, text, cursor)
+
+@_instrumented('diagram_update')
 def _on_diagram_update(data):
+    """Full-text update (Jetty sync.js / old clients): diffed once against the room text"""
     room = data.get('room', 'default')
     text = data.get('text', '')
     cursor = data.get('cursor')
-    if room not in rooms_data:
-        rooms_data[room] = {'text': '', 'users': set()}
-    rooms_data[room]['text'] = text
-    logger.info(f"Room {room} update from {request.sid}: {len(text)} chars")
-    emit('diagram_update', {
-        'text': text,
-        'cursor': cursor,
-        'from_sid': request.sid
-    }, room=room, skip_sid=request.sid)
+    _ensure_member(room)
+    _count_in(room, 'diagram_update', data)
+    hot_log.event('diagram_update', room, f"Room {room} update from {request.sid}: {len(text)} chars")
+    key = (request.namespace, request.sid)
+    if key in deferred_updates or not limiter.allow(request.sid):
+        # Gedrosselt: nur den letzten Text merken und nachreichen, sobald wieder Tokens da sind
+        if key not in deferred_updates:
+            eventlet.spawn_after(limiter.retry_after(request.sid), _apply_deferred, *key)
+        deferred_updates[key] = (room, text, cursor)
+        return
+    _apply_text(request.namespace, request.sid, room, text, cursor)
+
+def _resync(room, reason=None):
+    compressed = _patch_room(room, True) in socketio.server.manager.get_rooms(request.sid, request.namespace)
+    _send_snapshot(request.namespace, request.sid, room, compressed, reason)
+
+def _rebase(patch):
+    """Change function for registry.update: rebase patch over the newer log entries and apply it"""
+    def change(text, newer):
+        rebased = patch
+        for rev, applied in newer:
+            rebased = transform(rebased, applied)
+            if rebased is None:
+                raise PatchError('conflict')
+        return apply_patch(text, rebased), rebased
+    return change
+
+@_instrumented('diagram_patch')
+def _on_diagram_patch(data):
+    """
+    Delta update against revision base_rev. Patches based on an older revision
+    are rebased over the ones sequenced since; overlaps or gaps → snapshot resync.
+    """
+    room = data.get('room', 'default')
+    _ensure_member(room, patch_protocol=True)
+    _count_in(room, 'diagram_patch', data)
+    if not limiter.allow(request.sid):
+        # Client hält seinen Patch und schickt ihn (mit neueren Änderungen) nach retry_ms erneut
+        emit('patch_nack', {'reason': 'rate limited',
+                            'retry_ms': int(limiter.retry_after(request.sid) * 1000) + 1})
+        return
+    try:
+        data = unpack(data, MAX_PAYLOAD)
+        patch = validate(data)
+        base_rev = int(data.get('base_rev', -1))
+    except (PatchError, PayloadError, TypeError, ValueError) as e:
+        _resync(room, str(e))
+        return
+    try:
+        # Bestätigung kommt mit dem Broadcast: der eigene Eintrag in diagram_patches
+        _commit(request.namespace, request.sid, room, _rebase(patch), data.get('cursor'), base_rev)
+    except PatchError as e:
+        _resync(room, str(e))
+
+@_instrumented('resync')
+def _on_resync(data):
+    room = data.get('room', 'default')
+    _ensure_member(room, patch_protocol=True)
+    _resync(room, 'requested')
 
+@_instrumented('cursor_update')
 def _on_cursor_update(data):
     room = data.get('room', 'default')
-    cursor = data.get('cursor')
-    emit('cursor_update', {'cursor': cursor, 'from_sid': request.sid}, room=room, skip_sid=request.sid)
+    _count_in(room, 'cursor_update', data)
+    # Cursor-Updates über dem Limit verwerfen - der nächste überholt sie ohnehin
+    if limiter.allow(request.sid):
+        fanout.add_cursor(request.namespace, room, request.sid, data.get('cursor'))
+
+
+def _snapshot_loop():
+    """Write-behind: dirty rooms in batches to SQLite, then page out idle rooms"""
+    while True:
+        eventlet.sleep(SNAPSHOT_FLUSH_S)
+        written = snapshots.flush()
+        if written:
+            logger.debug(f"Persisted {written} room snapshot(s)")
+        if PAGE_OUT_S and isinstance(registry, RoomRegistry):
+            paged = registry.page_out(PAGE_OUT_S)
+            if paged:
+                logger.info(f"Paged out {paged} idle room(s)")
+
+if snapshots:
+    eventlet.spawn(_snapshot_loop)
+    atexit.register(snapshots.close)
+
+def _hub_monitor():
+    """Measure how late the hub wakes a sleeping greenlet (blocking handlers, CPU saturation)"""
+    while True:
+        started = time.monotonic()
+        eventlet.sleep(HUB_PROBE_S)
+        hub_lag_seconds.observe(max(0.0, time.monotonic() - started - HUB_PROBE_S))
+        hot_log.tick()
+
+eventlet.spawn(_hub_monitor)
+
+def _sids_per_transport():
+    counts = {('polling',): 0, ('websocket',): 0}
+    for socket in list(socketio.server.eio.sockets.values()):
+        if not socket.closed:
+            counts[('websocket',) if socket.upgraded else ('polling',)] += 1
+    return counts
+
+def _registry_gauges():
+    stats = registry.stats()
+    return {(key,): stats[key] for key in ('active_rooms', 'total_users', 'sessions', 'resident') if key in stats}
+
+metrics.collector('connected_sids', 'Connected Engine.IO sessions per transport', _sids_per_transport, ('transport',))
+metrics.collector('rooms', 'Room registry (rooms, memberships, sessions, resident texts)', _registry_gauges, ('kind',))
+metrics.collector('broadcasts_total', 'Coalesced broadcasts sent', lambda: {(): fanout.broadcasts}, kind='counter')
+metrics.collector('coalesced_total', 'Updates merged into a broadcast', lambda: {(): fanout.coalesced}, kind='counter')
+metrics.collector('skipped_slow_total', 'Broadcasts skipped for slow consumers', lambda: {(): fanout.skipped}, kind='counter')
+metrics.collector('rate_limited_total', 'Inbound updates over the rate limit', lambda: {(): limiter.limited}, kind='counter')
+metrics.collector('traffic_bytes_total', 'Payload bytes in/out (bytes_saved = avoided by compression)',
+                  lambda: {(key,): value for key, value in traffic.stats().items()}, ('kind',), kind='counter')
+if renderer:
+    metrics.collector('render_total', 'Server-side renders, cache hits and errors',
+                      lambda: {(key,): renderer.stats()[key] for key in ('renders', 'cache_hits', 'errors')},
+                      ('kind',), kind='counter')
+if snapshots:
+    metrics.collector('snapshot_writes_total', 'Room snapshots written to SQLite',
+                      lambda: {(): snapshots.writes}, kind='counter')
+    metrics.collector('snapshot_dirty', 'Rooms waiting for the next snapshot flush',
+                      lambda: {(): len(snapshots.dirty)})
 
 
 # ============================================================================
@@ -111,7 +473,7 @@ def handle_connect():
     _on_connect()
 
 @socketio.on('disconnect')
-def handle_disconnect():
+def handle_disconnect(*args):
     _on_disconnect()
 
 @socketio.on('join')
@@ -126,6 +488,14 @@ def handle_leave(data):
 def handle_diagram_update(data):
     _on_diagram_update(data)
 
+@socketio.on('diagram_patch')
+def handle_diagram_patch(data):
+    _on_diagram_patch(data)
+
+@socketio.on('resync')
+def handle_resync(data):
+    _on_resync(data)
+
 @socketio.on('cursor_update')
 def handle_cursor_update(data):
     _on_cursor_update(data)
@@ -136,58 +506,35 @@ def handle_cursor_update(data):
 # ============================================================================
 
 class PlantUMLSyncNamespace(Namespace):
+    # Alle Handler laufen über die gemeinsame Logik und die Registry oben
+
     def on_connect(self):
-        logger.info(f"[/plantuml-sync] Client connected: {request.sid}")
-        # Sofort in Room joinen basierend auf aktuellem State
         # sync.js sendet 'join' nach 'connected' Event - aber falls das nicht kommt,
-        # auto-join als Fallback (Room wird spaeter durch diagram_update korrekt gesetzt)
-        emit('connected', {'sid': request.sid})
+        # auto-join als Fallback in _ensure_member (Room kommt mit diagram_update)
+        _on_connect()
 
     def on_disconnect(self, *args):
-        logger.info(f"[/plantuml-sync] Client disconnected: {request.sid}")
         _on_disconnect()
 
     def on_join(self, data):
-        logger.info(f"[/plantuml-sync] Join from {request.sid}: {data}")
-        room = data.get('room', 'default')
-        join_room(room)
-        if room not in rooms_data:
-            rooms_data[room] = {'text': '', 'users': set()}
-        rooms_data[room]['users'].add(request.sid)
-        logger.info(f"[/plantuml-sync] {request.sid} joined room '{room}' ({len(rooms_data[room]['users'])} users)")
-        if rooms_data[room]['text']:
-            self.emit('diagram_update', {'text': rooms_data[room]['text'], 'cursor': None})
-        socketio.emit('user_joined', {
-            'sid': request.sid,
-            'users_count': len(rooms_data[room]['users'])
-        }, room=room, skip_sid=request.sid, namespace='/plantuml-sync')
+        logger.debug(f"[/plantuml-sync] Join from {request.sid}: {data}")
+        _on_join(data)
 
     def on_leave(self, data):
         _on_leave(data)
 
     def on_diagram_update(self, data):
-        room = data.get('room', 'default')
-        text = data.get('text', '')
-        cursor = data.get('cursor')
-        # Auto-join falls Client keinen join gesendet hat
-        if room not in rooms_data:
-            rooms_data[room] = {'text': '', 'users': set()}
-        if request.sid not in rooms_data[room]['users']:
-            logger.warning(f"[/plantuml-sync] Auto-join {request.sid} into room '{room}' (missed join event)")
-            join_room(room)
-            rooms_data[room]['users'].add(request.sid)
-        rooms_data[room]['text'] = text
-        logger.info(f"[/plantuml-sync] diagram_update from {request.sid} in room '{room}': {len(text)} chars, {len(rooms_data[room]['users'])} users")
-        socketio.emit('diagram_update', {
-            'text': text,
-            'cursor': cursor,
-            'from_sid': request.sid
-        }, room=room, skip_sid=request.sid, namespace='/plantuml-sync')
+        # Auto-join falls Client keinen join gesendet hat (in _ensure_member)
+        _on_diagram_update(data)
+
+    def on_diagram_patch(self, data):
+        _on_diagram_patch(data)
+
+    def on_resync(self, data):
+        _on_resync(data)
 
     def on_cursor_update(self, data):
-        room = data.get('room', 'default')
-        cursor = data.get('cursor')
-        socketio.emit('cursor_update', {'cursor': cursor, 'from_sid': request.sid}, room=room, skip_sid=request.sid, namespace='/plantuml-sync')
+        _on_cursor_update(data)
 
 socketio.on_namespace(PlantUMLSyncNamespace('/plantuml-sync'))
 
@@ -200,10 +547,39 @@ socketio.on_namespace(PlantUMLSyncNamespace('/plantuml-sync'))
 def health():
     return {
         'status': 'ok',
-        'active_rooms': len(rooms_data),
-        'total_users': sum(len(room['users']) for room in rooms_data.values())
+        **registry.stats(),
+        'broadcasts': fanout.broadcasts,
+        'coalesced': fanout.coalesced,
+        'skipped_slow': fanout.skipped,
+        'rate_limited': limiter.limited,
+        'render': renderer.stats() if renderer else None,
+        'snapshots': snapshots.stats() if snapshots else None,
+        **traffic.stats(),
     }, 200
 
+@app.route('/traffic', methods=['GET'])
+def traffic_per_room():
+    """Bytes in/out per room (top rooms by outbound traffic)"""
+    return {'compress_min': COMPRESS_MIN, **traffic.stats(), 'rooms': traffic.top()}, 200
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text format (events, latencies, payload sizes, fan-out, hub lag, transports)"""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+@app.route('/render/<digest>.svg')
+@app.route('/plantuml-sync/render/<digest>.svg')
+def render_svg(digest):
+    """Cached server-side render, addressed by the SHA-256 of the diagram text"""
+    svg = renderer.cache.get(digest) if renderer else None
+    if svg is None:
+        # Nur für verdrängte/abgelaufene Hashes - der Client rendert dann selbst
+        return 'not found', 404
+    return Response(svg, mimetype='image/svg+xml', headers={
+        'Cache-Control': 'public, max-age=31536000, immutable',
+        'ETag': f'"{digest}"',
+    })
+
 @app.route('/ping', methods=['GET', 'HEAD'])
 def ping():
     return 'pong', 200
@@ -231,17 +607,21 @@ if __name__ == '__main__':
     logger.info("=" * 60)
     logger.info("PlantUML Collaboration Server")
     logger.info("=" * 60)
-    logger.info("Starting on 0.0.0.0:5001")
+    logger.info(f"Starting on 0.0.0.0:{PORT}")
     logger.info("CORS: Enabled (all origins)")
     logger.info("Transport: WebSocket + Polling")
     logger.info("Namespaces: / and /plantuml-sync")
+    logger.info(f"Room store: {'Redis ' + REDIS_URL if REDIS_URL else 'in-memory (single worker)'}")
+    logger.info(f"Server-side render: {RENDER_URL or 'off'}")
+    logger.info(f"Room snapshots: {SNAPSHOT_DB or 'off'}")
     logger.info("=" * 60)
 
     socketio.run(
         app,
         host='0.0.0.0',
-        port=5001,
+        port=PORT,
         debug=False,
         use_reloader=False,
-        log_output=True
+        # Access-Log: bei Polling eine Zeile pro Update - nur bei Bedarf einschalten
+        log_output=os.environ.get('SYNC_ACCESS_LOG', '') == '1'
     )
@@ -0,0 +1,123 @@
+"""
+Compressed payloads and traffic counters for diagram sync
+Clients that negotiate 'deflate-raw' on join get large state payloads
+(snapshots, patch batches) as {'deflate': <bytes>}: the JSON payload,
+raw-deflated like the PlantUML URL encoding and sent as a binary Socket.IO
+attachment. Payloads below the threshold, or that do not shrink, stay
+plain JSON. Clients may compress diagram_patch the same way.
+"""
+
+import json
+import zlib
+
+ENCODING = 'deflate-raw'
+
+
+class PayloadError(ValueError):
+    """Compressed payload cannot be decoded."""
+    pass
+
+
+class Packed(dict):
+    """Wire payload that remembers its size (wire) and the JSON size before compression (raw)"""
+
+    def __init__(self, payload, wire, raw):
+        super().__init__(payload)
+        self.wire = wire
+        self.raw = raw
+
+
+def _json(payload):
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def deflate(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def inflate(data, limit):
+    """Raw inflate, PayloadError beyond limit bytes (kein Zip-Bomb-Schutz ohne Obergrenze)"""
+    decompressor = zlib.decompressobj(-15)
+    try:
+        result = decompressor.decompress(data, limit)
+    except zlib.error as e:
+        raise PayloadError(f'invalid deflate data: {e}') from e
+    if decompressor.unconsumed_tail:
+        raise PayloadError(f'payload exceeds {limit} bytes')
+    return result
+
+
+def pack(payload, threshold):
+    """Payload → Packed, deflated if its JSON is at least threshold bytes and gets smaller"""
+    raw = _json(payload)
+    if threshold and len(raw) >= threshold:
+        compressed = deflate(raw)
+        if len(compressed) < len(raw):
+            return Packed({'deflate': compressed}, len(compressed), len(raw))
+    return Packed(payload, len(raw), len(raw))
+
+
+def unpack(data, limit):
+    """Inbound payload → dict, inflating {'deflate': bytes}"""
+    if not isinstance(data, dict) or 'deflate' not in data:
+        return data
+    if not isinstance(data['deflate'], (bytes, bytearray)):
+        raise PayloadError('deflate payload must be binary')
+    try:
+        payload = json.loads(inflate(bytes(data['deflate']), limit))
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise PayloadError(f'invalid payload: {e}') from e
+    if not isinstance(payload, dict):
+        raise PayloadError('payload must be an object')
+    return payload
+
+
+def wire_size(payload):
+    """Bytes on the wire (binary attachment or JSON)"""
+    if isinstance(payload, Packed):
+        return payload.wire, payload.raw
+    size = len(_json(payload))
+    return size, size
+
+
+class TrafficCounter:
+    """Bytes in/out per room; raw_out is what the same traffic would be uncompressed"""
+
+    def __init__(self):
+        self.rooms = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.raw_out = 0
+
+    def _room(self, room):
+        counters = self.rooms.get(room)
+        if counters is None:
+            counters = self.rooms[room] = {'bytes_in': 0, 'bytes_out': 0, 'raw_out': 0}
+        return counters
+
+    def add_in(self, room, size):
+        self._room(room)['bytes_in'] += size
+        self.bytes_in += size
+
+    def add_out(self, room, wire, raw, receivers=1):
+        counters = self._room(room)
+        counters['bytes_out'] += wire * receivers
+        counters['raw_out'] += raw * receivers
+        self.bytes_out += wire * receivers
+        self.raw_out += raw * receivers
+
+    def forget(self, room):
+        self.rooms.pop(room, None)
+
+    def top(self, limit=50):
+        """Rooms with the most outbound traffic"""
+        ranked = sorted(self.rooms.items(), key=lambda item: item[1]['bytes_out'], reverse=True)
+        return dict(ranked[:limit])
+
+    def stats(self):
+        return {
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'bytes_saved': self.raw_out - self.bytes_out,
+        }
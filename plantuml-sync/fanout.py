@@ -0,0 +1,185 @@
+"""
+Per-room broadcast coalescing and inbound rate limiting
+Updates arriving within a short window are collected per room and sent as
+one broadcast when the window closes: all patches of the window in one
+event, only the latest full text and the latest cursor per sender.
+Clients whose outbound queue is backed up are skipped and resynced from a
+snapshot once they have caught up.
+"""
+
+import time
+
+
+class TokenBucket:
+    """rate events per second, bursts up to burst"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def allow(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def retry_after(self):
+        """Seconds until the next event is allowed"""
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """One TokenBucket per sid"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.limited = 0
+
+    def allow(self, sid):
+        bucket = self.buckets.get(sid)
+        if bucket is None:
+            bucket = self.buckets[sid] = TokenBucket(self.rate, self.burst)
+        if bucket.allow():
+            return True
+        self.limited += 1
+        return False
+
+    def retry_after(self, sid):
+        bucket = self.buckets.get(sid)
+        return bucket.retry_after() if bucket else 0.0
+
+    def forget(self, sid):
+        self.buckets.pop(sid, None)
+
+
+class _Pending:
+    __slots__ = ('patches', 'rev', 'text', 'text_sid', 'cursors', 'cursor_updates')
+
+    def __init__(self):
+        # [(rev, patch, cursor, sid)] in Eingangs-Reihenfolge, beim Flush nach rev sortiert
+        self.patches = []
+        # Volltext der höchsten Revision für Full-Text-Clients und wer ihn geschrieben hat (None = Patch)
+        self.rev = -1
+        self.text = None
+        self.text_sid = None
+        # {sid: cursor} - nur der letzte Cursor pro Sender zählt
+        self.cursors = {}
+        self.cursor_updates = 0
+
+
+class RoomFanout:
+    """
+    Collects the updates of a (namespace, room) for `window` seconds and
+    flushes them with one emit per audience.
+    emit:          socketio.emit
+    spawn_after:   spawn_after(seconds, fn, *args) greenlet timer
+    queue_size:    queue_size(sid, namespace) → packets waiting for a client, None if unknown
+    members:       members(room) → sids in the room
+    resync:        resync(namespace, room, sid) sends a client the full current state
+    rooms:         rooms(room) → ([(patch_room, compressed)], text_room) Socket.IO sub-room names
+    pack:          pack(payload) → wire payload for compressed patch rooms
+    """
+
+    def __init__(self, emit, spawn_after, queue_size, members, resync, rooms, window=0.04, max_queue=64,
+                 pack=None):
+        self.emit = emit
+        self.spawn_after = spawn_after
+        self.queue_size = queue_size
+        self.members = members
+        self.resync = resync
+        self.rooms = rooms
+        self.window = window
+        self.max_queue = max_queue
+        self.pack = pack or (lambda payload: payload)
+        self.pending = {}
+        # {(namespace, sid)}: übersprungene Clients, die beim Aufholen den vollen Stand bekommen
+        self.stale = set()
+        self.broadcasts = 0
+        self.coalesced = 0
+        self.skipped = 0
+
+    def _pending(self, namespace, room):
+        key = (namespace, room)
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self.pending[key] = _Pending()
+            self.spawn_after(self.window, self.flush, namespace, room)
+        return pending
+
+    def add_patch(self, namespace, room, rev, patch, cursor, sid, text, text_sid=None):
+        """
+        A sequenced patch. text is the room text after it (for full-text clients),
+        text_sid the full-text client it came from (it does not get its own text back)
+        """
+        pending = self._pending(namespace, room)
+        pending.patches.append((rev, patch, cursor, sid))
+        # Mit Redis kann ein Greenlet mit kleinerer Revision nach einem mit größerer ankommen
+        if rev > pending.rev:
+            pending.rev = rev
+            pending.text = text
+            pending.text_sid = text_sid
+        pending.cursors.pop(sid, None)
+
+    def add_cursor(self, namespace, room, sid, cursor):
+        pending = self._pending(namespace, room)
+        pending.cursors[sid] = cursor
+        pending.cursor_updates += 1
+
+    def _split(self, namespace, room):
+        """Members → (ready, slow): slow clients get nothing until their queue drained"""
+        ready, slow = [], []
+        for sid in self.members(room):
+            size = self.queue_size(sid, namespace)
+            (slow if size is not None and size > self.max_queue else ready).append(sid)
+        return ready, slow
+
+    def flush(self, namespace, room):
+        pending = self.pending.pop((namespace, room), None)
+        if pending is None:
+            return
+        ready, slow = self._split(namespace, room)
+        for sid in slow:
+            self.stale.add((namespace, sid))
+        self.skipped += len(slow)
+        # Aufgeholte Clients: voller Stand statt der verpassten Updates
+        caught_up = [sid for sid in ready if (namespace, sid) in self.stale]
+        for sid in caught_up:
+            self.stale.discard((namespace, sid))
+            self.resync(namespace, room, sid)
+        skip = slow + caught_up
+        patch_rooms, text_room = self.rooms(room)
+        if pending.patches:
+            # Clients wenden Patches lückenlos nach rev an; Lücken (Revisionen anderer Worker)
+            # überbrückt der Client, indem er kurz auf den fehlenden Broadcast wartet
+            patches = sorted(pending.patches, key=lambda entry: entry[0])
+            last_sid = patches[-1][3]
+            # Alle Patches des Fensters in einem Event; eigene Einträge gelten beim Sender als Bestätigung
+            payload = {
+                'patches': [dict(patch, rev=rev, cursor=cursor, from_sid=sid)
+                            for rev, patch, cursor, sid in patches],
+            }
+            for patch_room, compressed in patch_rooms:
+                self.emit('diagram_patches', self.pack(payload) if compressed else payload,
+                          to=patch_room, skip_sid=skip or None, namespace=namespace)
+            self.emit('diagram_update', {
+                'text': pending.text,
+                'cursor': patches[-1][2],
+                'from_sid': last_sid,
+            }, to=text_room, skip_sid=skip + ([pending.text_sid] if pending.text_sid else []) or None,
+                namespace=namespace)
+            self.broadcasts += len(patch_rooms) + 1
+        for sid, cursor in pending.cursors.items():
+            self.emit('cursor_update', {'cursor': cursor, 'from_sid': sid}, to=room,
+                      skip_sid=[sid] + skip, namespace=namespace)
+            self.broadcasts += 1
+        self.coalesced += max(0, len(pending.patches) - 1) + max(0, pending.cursor_updates - len(pending.cursors))
+
+    def forget(self, namespace, sid):
+        self.stale.discard((namespace, sid))
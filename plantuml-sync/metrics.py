@@ -0,0 +1,168 @@
+"""
+Minimal Prometheus metrics for the sync server
+Counters and histograms with labels, rendered in the Prometheus text
+exposition format (0.0.4) - without depending on prometheus_client.
+Gauges and values that already live elsewhere (registry, fanout, limiter)
+are read at scrape time through collector callbacks instead of being mirrored.
+"""
+
+import bisect
+import logging
+import time
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bytes: 64 B … 1 MiB; Sekunden: 0,1 ms … 2,5 s; Empfänger pro Broadcast: 1 … 256
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+FANOUT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{_labels(self.label_names, key)} {_number(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            # [Zähler pro Bucket (nicht kumuliert) + Überlauf, Summe, Anzahl]
+            state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f'{self.name}_bucket{_labels(self.label_names, key, [le])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.label_names, key)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.label_names, key)} {count}')
+        return lines
+
+
+class Collector(Metric):
+    """Values read at scrape time: collect() → {label values tuple: value}"""
+
+    def __init__(self, name, documentation, collect, labels=(), kind='gauge'):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+        self.kind = kind
+
+    def render(self):
+        self.values = self.collect()
+        return super().render()
+
+
+class MetricsRegistry:
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(self.prefix + name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, documentation, labels, buckets))
+
+    def collector(self, name, documentation, collect, labels=(), kind='gauge'):
+        return self._add(Collector(self.prefix + name, documentation, collect, labels, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class SampledLog:
+    """
+    Aggregated hot-path logging: events are only counted, one INFO line per
+    interval sums them up ("Last 60s: diagram_update: 412 (3 room(s)), ..."),
+    single events are logged at DEBUG.
+    """
+
+    def __init__(self, logger, interval=60.0):
+        self.logger = logger
+        self.interval = interval
+        self.counts = {}
+        self.rooms = {}
+        self.started = time.monotonic()
+
+    def event(self, event, room, message):
+        self.counts[event] = self.counts.get(event, 0) + 1
+        if room is not None:
+            self.rooms.setdefault(event, set()).add(room)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug(message)
+
+    def tick(self):
+        """Log the summary if the interval is over (called periodically)"""
+        if time.monotonic() - self.started >= self.interval:
+            self.flush()
+
+    def flush(self):
+        elapsed = time.monotonic() - self.started
+        if self.counts:
+            summary = ', '.join(f"{event}: {count}" + (f" ({len(self.rooms[event])} room(s))" if event in self.rooms else '')
+                                for event, count in sorted(self.counts.items()))
+            self.logger.info(f"Last {elapsed:.0f}s: {summary}")
+        self.counts = {}
+        self.rooms = {}
+        self.started = time.monotonic()
@@ -0,0 +1,189 @@
+"""
+Server-side rendering for collaborative rooms
+Renders the latest text of a room once per edit burst (debounced) instead
+of once per viewer, and pushes a cache URL to all members. SVGs are kept
+in an LRU cache keyed by the SHA-256 of the source, so identical text in
+different rooms - or after an undo - is rendered only once.
+With several workers (SYNC_REDIS_URL) the SVGs are also stored in Redis,
+so a render URL pushed by one worker resolves on every other worker.
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+
+import requests
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class RenderCache:
+    """LRU of {digest: svg bytes}, bounded by total size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries = OrderedDict()
+
+    def get(self, digest):
+        svg = self.entries.get(digest)
+        if svg is not None:
+            self.entries.move_to_end(digest)
+        return svg
+
+    def put(self, digest, svg):
+        if digest in self.entries or len(svg) > self.max_bytes:
+            return
+        self.entries[digest] = svg
+        self.bytes += len(svg)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted)
+
+
+class SharedRenderCache(RenderCache):
+    """
+    Local LRU in front of Redis ({prefix}render:{digest}, expires after `ttl`
+    seconds): misses are read through from Redis, renders are written to both.
+    """
+
+    def __init__(self, url, max_bytes, prefix='plantuml-sync:', ttl=24 * 3600):
+        if redis is None:
+            raise RuntimeError("Shared render cache needs the 'redis' package (pip install redis)")
+        super().__init__(max_bytes)
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, digest):
+        return f'{self.prefix}render:{digest}'
+
+    def get(self, digest):
+        svg = super().get(digest)
+        if svg is None:
+            # Von einem anderen Worker gerendert
+            svg = self.redis.get(self._key(digest))
+            if svg is not None:
+                super().put(digest, svg)
+        return svg
+
+    def put(self, digest, svg):
+        super().put(digest, svg)
+        self.redis.set(self._key(digest), svg, ex=self.ttl)
+
+
+class RoomRenderer:
+    """
+    url:          PlantUML server incl. context, e.g. http://plantuml-backend:8080/uml
+    emit:         socketio.emit
+    spawn_after:  spawn_after(seconds, fn, *args) → timer with cancel()
+    snapshot:     snapshot(room) → (text, rev)
+    public_path:  path prefix under which clients fetch /<digest>.svg
+    cache:        RenderCache/SharedRenderCache, default a local LRU of cache_bytes
+    """
+
+    def __init__(self, url, emit, spawn_after, snapshot, public_path='/plantuml-sync/render',
+                 debounce=0.3, cache_bytes=32 * 1024 * 1024, timeout=30, cache=None):
+        self.url = url.rstrip('/')
+        self.emit = emit
+        self.spawn_after = spawn_after
+        self.snapshot = snapshot
+        self.public_path = public_path.rstrip('/')
+        self.debounce = debounce
+        self.timeout = timeout
+        self.cache = cache if cache is not None else RenderCache(cache_bytes)
+        self.session = requests.Session()
+        self.timers = {}
+        # {digest: [waiting (namespace, room, rev)]} - gleicher Text wird nur einmal gerendert
+        self.inflight = {}
+        self.renders = 0
+        self.hits = 0
+        self.errors = 0
+
+    @staticmethod
+    def digest(text):
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def schedule(self, namespace, room):
+        """(Re)start the debounce timer of a room after a commit"""
+        timer = self.timers.pop((namespace, room), None)
+        if timer is not None:
+            timer.cancel()
+        self.timers[(namespace, room)] = self.spawn_after(self.debounce, self._run, namespace, room)
+
+    def _run(self, namespace, room):
+        self.timers.pop((namespace, room), None)
+        text, rev = self.snapshot(room)
+        if not text.strip():
+            return
+        digest = self.digest(text)
+        if self.cache.get(digest) is not None:
+            self.hits += 1
+            self._publish(namespace, room, rev, digest)
+            return
+        waiting = self.inflight.get(digest)
+        if waiting is not None:
+            # Läuft bereits (anderer Room, gleicher Text): nur mitbenachrichtigen
+            waiting.append((namespace, room, rev))
+            self.hits += 1
+            return
+        waiting = self.inflight[digest] = [(namespace, room, rev)]
+        try:
+            svg = self._render(text)
+        finally:
+            del self.inflight[digest]
+        if svg is None:
+            return
+        self.cache.put(digest, svg)
+        for namespace, room, rev in waiting:
+            self._publish(namespace, room, rev, digest)
+
+    def _render(self, text):
+        self.renders += 1
+        try:
+            response = self.session.post(f'{self.url}/svg', data=text.encode('utf-8'),
+                                         headers={'Content-Type': 'text/plain; charset=utf-8'},
+                                         timeout=self.timeout)
+        except requests.RequestException as e:
+            self.errors += 1
+            logger.warning(f"Render failed: {e}")
+            return None
+        # 400 = Syntaxfehler, PlantUML liefert trotzdem ein SVG mit der Fehlermeldung
+        if response.status_code not in (200, 400) or not response.content:
+            self.errors += 1
+            logger.warning(f"Render failed: HTTP {response.status_code}")
+            return None
+        return response.content
+
+    def _payload(self, rev, digest):
+        return {'rev': rev, 'hash': digest, 'url': f'{self.public_path}/{digest}.svg'}
+
+    def _publish(self, namespace, room, rev, digest):
+        self.emit('diagram_render', self._payload(rev, digest), to=room, namespace=namespace)
+
+    def current(self, text, rev):
+        """Render of a room text at rev if it is cached (on any worker), else None"""
+        if not text.strip():
+            return None
+        digest = self.digest(text)
+        if self.cache.get(digest) is None:
+            return None
+        return self._payload(rev, digest)
+
+    def forget(self, room):
+        for key in [key for key in self.timers if key[1] == room]:
+            self.timers.pop(key).cancel()
+
+    def stats(self):
+        return {
+            'renders': self.renders,
+            'cache_hits': self.hits,
+            'errors': self.errors,
+            'cached': len(self.cache.entries),
+            'cache_bytes': self.cache.bytes,
+        }
@@ -0,0 +1,302 @@
+"""
+Room registry for the sync server
+Keeps membership indexed in both directions (room → sids, sid → rooms), so
+joins, leaves and disconnects cost O(rooms of that client) instead of a
+scan over every room. Room state (text, rev, patch log) lives next to the
+membership and is dropped with the last member; an optional loader
+(snapshot store) restores it when the room is used again.
+
+Two backends with the same API:
+  RoomRegistry        in-process dicts (one worker)
+  RedisRoomRegistry   Redis hashes/lists/sets, shared by all workers
+"""
+
+import itertools
+import json
+import time
+from collections import deque
+
+from textpatch import PatchError
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def _newer(rev, base_rev, available):
+    """Number of log entries after base_rev, PatchError if outside the log window"""
+    if base_rev > rev or rev - base_rev > available:
+        raise PatchError('unknown revision')
+    return rev - base_rev
+
+
+class RoomRegistry:
+    """
+    rooms:    {room: {'text', 'rev', 'log', 'users', 'used'}}; text None = paged out
+    sessions: {sid: set of rooms}
+    loader:   loader(room) → (text, rev) or None, restores persisted rooms
+    """
+
+    def __init__(self, history=200, loader=None):
+        self.history = history
+        self.loader = loader
+        self.rooms = {}
+        self.sessions = {}
+        # Summe aller Mitgliedschaften (ein Client in zwei Rooms zählt doppelt, wie bisher in /health)
+        self.memberships = 0
+        self.paged_out = 0
+        # Rooms mit Text im Speicher (nicht ausgelagert)
+        self.resident = 0
+
+    def _new_room(self):
+        return {'text': None, 'rev': 0, 'log': deque(maxlen=self.history), 'users': set(),
+                'used': time.monotonic()}
+
+    def _room(self, room):
+        """Room state, created on first use and (re)loaded if paged out"""
+        room_data = self.rooms.get(room)
+        if room_data is None:
+            room_data = self.rooms[room] = self._new_room()
+        if room_data['text'] is None:
+            state = self.loader(room) if self.loader else None
+            room_data['text'], room_data['rev'] = state or ('', room_data['rev'])
+            self.resident += 1
+        room_data['used'] = time.monotonic()
+        return room_data
+
+    def page_out(self, idle_seconds):
+        """
+        Drop text and patch log of rooms unused for idle_seconds (the loader
+        must be able to restore them). Returns the number of rooms paged out.
+        """
+        if self.loader is None:
+            return 0
+        cutoff = time.monotonic() - idle_seconds
+        count = 0
+        for room_data in self.rooms.values():
+            if room_data['text'] is not None and room_data['used'] < cutoff:
+                room_data['text'] = None
+                room_data['log'].clear()
+                count += 1
+        self.paged_out += count
+        self.resident -= count
+        return count
+
+    def __contains__(self, room):
+        return room in self.rooms
+
+    def is_member(self, room, sid):
+        return room in self.sessions.get(sid, ())
+
+    def members(self, room):
+        room_data = self.rooms.get(room)
+        return list(room_data['users']) if room_data else []
+
+    def rooms_of(self, sid):
+        return list(self.sessions.get(sid, ()))
+
+    def snapshot(self, room):
+        """(text, rev) of a room, ('', 0) if it does not exist"""
+        if room not in self.rooms:
+            return ('', 0)
+        room_data = self._room(room)
+        return room_data['text'], room_data['rev']
+
+    def update(self, room, change, base_rev=None):
+        """
+        Sequence one change atomically. change(text, newer) gets the current
+        text and the (rev, patch) entries after base_rev and returns
+        (new_text, patch), or None for no change. Returns (rev, patch, text)
+        of the commit or None; PatchError from change or an unknown base_rev
+        propagates.
+        """
+        room_data = self._room(room)
+        newer = []
+        if base_rev is not None:
+            count = _newer(room_data['rev'], base_rev, len(room_data['log']))
+            newer = list(itertools.islice(reversed(room_data['log']), count))[::-1]
+        result = change(room_data['text'], newer)
+        if result is None:
+            return None
+        room_data['text'], patch = result
+        room_data['rev'] += 1
+        room_data['log'].append((room_data['rev'], patch))
+        return room_data['rev'], patch, room_data['text']
+
+    def join(self, room, sid):
+        """Add sid to room (created on first join), returns the member count"""
+        room_data = self._room(room)
+        if sid not in room_data['users']:
+            room_data['users'].add(sid)
+            self.sessions.setdefault(sid, set()).add(room)
+            self.memberships += 1
+        return len(room_data['users'])
+
+    def leave(self, room, sid):
+        """
+        Remove sid from room. Returns the remaining member count, None if sid
+        was not a member; an emptied room is dropped.
+        """
+        room_data = self.rooms.get(room)
+        if room_data is None or sid not in room_data['users']:
+            return None
+        room_data['users'].discard(sid)
+        self.memberships -= 1
+        joined = self.sessions.get(sid)
+        if joined is not None:
+            joined.discard(room)
+            if not joined:
+                del self.sessions[sid]
+        remaining = len(room_data['users'])
+        if remaining == 0:
+            if room_data['text'] is not None:
+                self.resident -= 1
+            del self.rooms[room]
+        return remaining
+
+    def leave_all(self, sid):
+        """Remove sid from all its rooms → [(room, remaining)]"""
+        return [(room, self.leave(room, sid)) for room in self.rooms_of(sid)]
+
+    def stats(self):
+        return {
+            'active_rooms': len(self.rooms),
+            'total_users': self.memberships,
+            'sessions': len(self.sessions),
+            'paged_out': self.paged_out,
+            'resident': self.resident,
+            'backend': 'memory',
+        }
+
+
+class RedisRoomRegistry:
+    """
+    Same API, state in Redis so every worker sees the same rooms:
+      {prefix}room:{room}        hash text, rev
+      {prefix}room:{room}:log    list of JSON [rev, patch], last `history` entries
+      {prefix}room:{room}:users  set of sids
+      {prefix}sid:{sid}          set of rooms
+      {prefix}rooms              set of active rooms
+      {prefix}memberships        counter
+    Commits and leaves use WATCH/MULTI, so concurrent workers never
+    sequence two patches onto the same revision.
+    """
+
+    def __init__(self, url, history=200, prefix='plantuml-sync:', loader=None):
+        if redis is None:
+            raise RuntimeError("Redis backend needs the 'redis' package (pip install redis)")
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.history = history
+        self.prefix = prefix
+        self.loader = loader
+
+    def _room_key(self, room):
+        return f'{self.prefix}room:{room}'
+
+    def _sid_key(self, sid):
+        return f'{self.prefix}sid:{sid}'
+
+    def __contains__(self, room):
+        return bool(self.redis.sismember(f'{self.prefix}rooms', room))
+
+    def is_member(self, room, sid):
+        return bool(self.redis.sismember(self._sid_key(sid), room))
+
+    def members(self, room):
+        return list(self.redis.smembers(self._room_key(room) + ':users'))
+
+    def rooms_of(self, sid):
+        return list(self.redis.smembers(self._sid_key(sid)))
+
+    def snapshot(self, room):
+        text, rev = self.redis.hmget(self._room_key(room), 'text', 'rev')
+        return text or '', int(rev or 0)
+
+    def update(self, room, change, base_rev=None):
+        key = self._room_key(room)
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    text, rev = pipe.hmget(key, 'text', 'rev')
+                    text, rev = text or '', int(rev or 0)
+                    newer = []
+                    if base_rev is not None:
+                        count = _newer(rev, base_rev, self.history)
+                        if count:
+                            newer = [tuple(json.loads(entry)) for entry in pipe.lrange(key + ':log', -count, -1)]
+                            if len(newer) < count:
+                                raise PatchError('unknown revision')
+                    result = change(text, newer)
+                    if result is None:
+                        pipe.unwatch()
+                        return None
+                    text, patch = result
+                    pipe.multi()
+                    pipe.hset(key, mapping={'text': text, 'rev': rev + 1})
+                    pipe.rpush(key + ':log', json.dumps([rev + 1, patch]))
+                    pipe.ltrim(key + ':log', -self.history, -1)
+                    pipe.execute()
+                    return rev + 1, patch, text
+                except redis.WatchError:
+                    # Anderer Worker hat zwischendurch committet → mit dem neuen Stand wiederholen
+                    continue
+
+    def join(self, room, sid):
+        users_key = self._room_key(room) + ':users'
+        pipe = self.redis.pipeline()
+        pipe.sadd(users_key, sid)
+        pipe.sadd(self._sid_key(sid), room)
+        pipe.sadd(f'{self.prefix}rooms', room)
+        pipe.scard(users_key)
+        added, _, _, count = pipe.execute()
+        if added:
+            self.redis.incrby(f'{self.prefix}memberships', 1)
+        if count == 1 and self.loader and not self.redis.exists(self._room_key(room)):
+            state = self.loader(room)
+            if state:
+                # HSETNX: hat ein anderer Worker inzwischen committet, gewinnt dessen Stand
+                pipe = self.redis.pipeline()
+                pipe.hsetnx(self._room_key(room), 'text', state[0])
+                pipe.hsetnx(self._room_key(room), 'rev', state[1])
+                pipe.execute()
+        return count
+
+    def leave(self, room, sid):
+        key = self._room_key(room)
+        users_key = key + ':users'
+        with self.redis.pipeline() as pipe:
+            while True:
+                try:
+                    # WATCH auf die Mitglieder: ein gleichzeitiger Join verhindert das Löschen des Rooms
+                    pipe.watch(users_key)
+                    if not pipe.sismember(users_key, sid):
+                        pipe.unwatch()
+                        return None
+                    remaining = pipe.scard(users_key) - 1
+                    pipe.multi()
+                    pipe.srem(users_key, sid)
+                    pipe.srem(self._sid_key(sid), room)
+                    pipe.incrby(f'{self.prefix}memberships', -1)
+                    if remaining == 0:
+                        pipe.delete(key, key + ':log')
+                        pipe.srem(f'{self.prefix}rooms', room)
+                    pipe.execute()
+                    return remaining
+                except redis.WatchError:
+                    continue
+
+    def leave_all(self, sid):
+        return [(room, self.leave(room, sid)) for room in self.rooms_of(sid)]
+
+    def stats(self):
+        pipe = self.redis.pipeline()
+        pipe.scard(f'{self.prefix}rooms')
+        pipe.get(f'{self.prefix}memberships')
+        rooms, memberships = pipe.execute()
+        return {
+            'active_rooms': rooms,
+            'total_users': int(memberships or 0),
+            'backend': 'redis',
+        }
@@ -0,0 +1,116 @@
+"""
+Durable room snapshots with write-behind persistence
+Commits only mark a room dirty in memory (latest text wins); a background
+greenlet writes all dirty rooms in one SQLite transaction every few
+seconds, so a burst of edits costs one small write instead of one per patch.
+Rooms are read back lazily - when someone joins a room that is not in
+memory, or touches one that was paged out while idle.
+SQLite calls go through offload (tpool.execute in app.py), so a commit or
+a cold read never blocks the eventlet hub.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room    TEXT PRIMARY KEY,
+    text    TEXT NOT NULL,
+    rev     INTEGER NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class SnapshotStore:
+    """
+    Room snapshots in a SQLite file (WAL, one row per room)
+    offload:  offload(fn, *args) runs blocking calls in a real thread; None = inline
+    """
+
+    def __init__(self, path, offload=None):
+        self.path = path
+        self.offload = offload
+        # Verbindung wird aus Worker-Threads benutzt, der Lock serialisiert die Zugriffe
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # WAL + NORMAL: ein Batch kostet ein fsync am Checkpoint statt pro Commit
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(SCHEMA)
+        self._db.commit()
+        # {room: (text, rev)} - noch nicht geschriebene Stände
+        self.dirty = {}
+        # Batch, der gerade geschrieben wird - für load() bis zum Commit noch maßgeblich
+        self.flushing = {}
+        self.writes = 0
+        self.batches = 0
+        self.loads = 0
+
+    def mark(self, room, text, rev):
+        self.dirty[room] = (text, rev)
+
+    def _call(self, fn, *args):
+        # Lock im aufrufenden Greenlet nehmen, nicht im Worker-Thread (grüne Locks dort unsicher)
+        with self._lock:
+            return self.offload(fn, *args) if self.offload else fn(*args)
+
+    def _read(self, room):
+        return self._db.execute('SELECT text, rev FROM rooms WHERE room = ?', (room,)).fetchone()
+
+    def _write(self, rows):
+        with self._db:
+            self._db.executemany(
+                'INSERT INTO rooms (room, text, rev, updated) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(room) DO UPDATE SET text = excluded.text, rev = excluded.rev, '
+                'updated = excluded.updated WHERE excluded.rev >= rooms.rev',
+                rows)
+
+    def load(self, room):
+        """(text, rev) of a persisted room, None if unknown"""
+        pending = self.dirty.get(room) or self.flushing.get(room)
+        if pending is not None:
+            return pending
+        self.loads += 1
+        row = self._call(self._read, room)
+        return (row[0], row[1]) if row else None
+
+    def flush(self):
+        """Write all dirty rooms in one transaction, returns the number written"""
+        if not self.dirty:
+            return 0
+        batch, self.dirty = self.dirty, {}
+        self.flushing = batch
+        now = time.time()
+        rows = [(room, text, rev, now) for room, (text, rev) in batch.items()]
+        try:
+            self._call(self._write, rows)
+        except sqlite3.Error as e:
+            logger.error(f"Snapshot flush failed ({len(rows)} rooms): {e}")
+            # Beim nächsten Flush erneut versuchen, ohne neuere Stände zu überschreiben
+            for room, state in batch.items():
+                self.dirty.setdefault(room, state)
+            return 0
+        finally:
+            self.flushing = {}
+        self.writes += len(rows)
+        self.batches += 1
+        return len(rows)
+
+    def stats(self):
+        return {
+            'dirty': len(self.dirty),
+            'writes': self.writes,
+            'batches': self.batches,
+            'loads': self.loads,
+        }
+
+    def close(self):
+        # Beim Beenden läuft der Hub evtl. nicht mehr: letzter Flush direkt
+        self.offload = None
+        self.flush()
+        self._db.close()
@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Module liegen flach neben app.py (kein Paket)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from rooms import RedisRoomRegistry, RoomRegistry
+from stub_redis import StubRedis
+
+
+@pytest.fixture
+def redis_stub():
+    with StubRedis() as stub:
+        yield stub
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def registry(request):
+    """Both registry backends behind the same API"""
+    if request.param == 'memory':
+        yield RoomRegistry(history=5)
+        return
+    pytest.importorskip('redis')
+    with StubRedis() as stub:
+        yield RedisRoomRegistry(stub.url, history=5, prefix='test:')
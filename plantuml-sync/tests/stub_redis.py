@@ -0,0 +1,371 @@
+"""
+Local stand-in for a Redis server
+Speaks RESP2 and RESP3 (HELLO 3) and implements the commands the sync
+server uses: strings, hashes, lists, sets, WATCH/MULTI/EXEC and
+PUBLISH/SUBSCRIBE. Data lives in memory only, so several plantuml-sync
+workers can be run against it without a real Redis.
+
+    python tests/stub_redis.py --port 16379
+    SYNC_REDIS_URL=redis://127.0.0.1:16379/0 python app.py
+"""
+
+import argparse
+import socketserver
+import threading
+
+
+class RespError(Exception):
+    pass
+
+
+class Push(list):
+    """Out-of-band message (pub/sub) - RESP3 push type"""
+    pass
+
+
+def _encode(value, resp3=False):
+    """Python value → RESP2/RESP3 reply"""
+    if value is None:
+        return b'_\r\n' if resp3 else b'$-1\r\n'
+    if isinstance(value, RespError):
+        return b'-' + str(value).encode('utf-8') + b'\r\n'
+    if isinstance(value, bool):
+        return b':%d\r\n' % int(value)
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, str):
+        # Status-Antworten (OK, QUEUED, PONG) als Simple String
+        return b'+' + value.encode('utf-8') + b'\r\n'
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    if isinstance(value, dict):
+        if not resp3:
+            return _encode([item for pair in value.items() for item in pair])
+        return b'%%%d\r\n' % len(value) + b''.join(_encode(k, True) + _encode(v, True) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        kind = b'>' if resp3 and isinstance(value, Push) else b'*'
+        return kind + b'%d\r\n' % len(value) + b''.join(_encode(v, resp3) for v in value)
+    raise TypeError(f'cannot encode {type(value).__name__}')
+
+
+def _read_command(rfile):
+    """One command as list of bytes, None on EOF (arrays and inline commands)"""
+    line = rfile.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.split()
+    args = []
+    for _ in range(int(line[1:])):
+        length = int(rfile.readline()[1:])
+        args.append(rfile.read(length + 2)[:-2])
+    return args
+
+
+class StubRedis:
+    """
+    Threaded stub server. Usage:
+        with StubRedis() as stub:
+            client = redis.Redis.from_url(stub.url)
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        self.data = {}
+        # Schlüssel-Versionen für WATCH: jede Schreiboperation erhöht die Version
+        self.versions = {}
+        self.channels = {}
+        self.commands = 0
+        self.lock = threading.RLock()
+        self.server = socketserver.ThreadingTCPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'redis://{host}:{port}/0'
+
+    # ------------------------------------------------------------------
+    # Datenzugriff
+    # ------------------------------------------------------------------
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key, kind):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise RespError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def _container(self, key, kind):
+        value = self._get(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        self._touch(key)
+        return value
+
+    def _drop_empty(self, key):
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+
+    def execute(self, args):
+        name = args[0].decode('ascii').upper()
+        handler = getattr(self, f'cmd_{name.lower()}', None)
+        if handler is None:
+            return RespError(f"ERR unknown command '{name}'")
+        with self.lock:
+            self.commands += 1
+            try:
+                return handler(*args[1:])
+            except RespError as e:
+                return e
+            except (TypeError, ValueError):
+                return RespError(f"ERR wrong arguments for '{name.lower()}' command")
+
+    def cmd_ping(self, message=None):
+        return message if message is not None else 'PONG'
+
+    def cmd_select(self, db):
+        return 'OK'
+
+    def cmd_client(self, *args):
+        return 'OK'
+
+    def cmd_exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    def cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                self._touch(key)
+                removed += 1
+        return removed
+
+    def cmd_get(self, key):
+        return self._get(key, bytes)
+
+    def cmd_set(self, key, value, *options):
+        self.data[key] = value
+        self._touch(key)
+        return 'OK'
+
+    def cmd_incrby(self, key, amount):
+        value = int(self._get(key, bytes) or 0) + int(amount)
+        self.data[key] = str(value).encode('ascii')
+        self._touch(key)
+        return value
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b'1')
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hmget(self, key, *fields):
+        hash_ = self._get(key, dict) or {}
+        return [hash_.get(field) for field in fields]
+
+    def cmd_hgetall(self, key):
+        return [item for pair in (self._get(key, dict) or {}).items() for item in pair]
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise ValueError('odd number of arguments')
+        hash_ = self._container(key, dict)
+        added = sum(1 for field in pairs[::2] if field not in hash_)
+        hash_.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hsetnx(self, key, field, value):
+        hash_ = self._get(key, dict)
+        if hash_ is not None and field in hash_:
+            return 0
+        self._container(key, dict)[field] = value
+        return 1
+
+    def cmd_rpush(self, key, *values):
+        items = self._container(key, list)
+        items.extend(values)
+        return len(items)
+
+    @staticmethod
+    def _range(items, start, stop):
+        """Redis-Indizes (inklusiv, negativ vom Ende) → Slice"""
+        start, stop = int(start), int(stop)
+        if start < 0:
+            start = max(0, len(items) + start)
+        if stop < 0:
+            stop += len(items)
+        return items[start:stop + 1]
+
+    def cmd_lrange(self, key, start, stop):
+        return self._range(self._get(key, list) or [], start, stop)
+
+    def cmd_ltrim(self, key, start, stop):
+        items = self._get(key, list)
+        if items is not None:
+            self.data[key] = self._range(items, start, stop)
+            self._touch(key)
+            self._drop_empty(key)
+        return 'OK'
+
+    def cmd_sadd(self, key, *members):
+        members_ = self._container(key, set)
+        added = len(set(members) - members_)
+        members_.update(members)
+        return added
+
+    def cmd_srem(self, key, *members):
+        members_ = self._get(key, set)
+        if members_ is None:
+            return 0
+        removed = len(set(members) & members_)
+        members_.difference_update(members)
+        self._touch(key)
+        self._drop_empty(key)
+        return removed
+
+    def cmd_smembers(self, key):
+        return sorted(self._get(key, set) or ())
+
+    def cmd_sismember(self, key, member):
+        return member in (self._get(key, set) or ())
+
+    def cmd_scard(self, key):
+        return len(self._get(key, set) or ())
+
+    def cmd_publish(self, channel, message):
+        receivers = list(self.channels.get(channel, ()))
+        for connection in receivers:
+            connection.push(Push([b'message', channel, message]))
+        return len(receivers)
+
+    # ------------------------------------------------------------------
+    # Verbindungen
+    # ------------------------------------------------------------------
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                self.write_lock = threading.Lock()
+                self.watched = None
+                self.queued = None
+                self.subscribed = set()
+                self.resp3 = False
+
+            def push(self, reply):
+                with self.write_lock:
+                    try:
+                        self.wfile.write(_encode(reply, self.resp3))
+                        self.wfile.flush()
+                    except OSError:
+                        pass
+
+            def handle(self):
+                try:
+                    while True:
+                        args = _read_command(self.rfile)
+                        if args is None:
+                            return
+                        if args:
+                            self.push(self._dispatch(args))
+                except (OSError, ValueError):
+                    return
+                finally:
+                    with stub.lock:
+                        for channel in self.subscribed:
+                            stub.channels.get(channel, set()).discard(self)
+
+            def _dispatch(self, args):
+                name = args[0].decode('ascii', errors='replace').upper()
+                if name == 'HELLO':
+                    if len(args) > 1:
+                        if args[1] not in (b'2', b'3'):
+                            return RespError('NOPROTO unsupported protocol version')
+                        self.resp3 = args[1] == b'3'
+                    return {b'server': b'redis', b'version': b'7.2.0-stub', b'proto': 3 if self.resp3 else 2,
+                            b'id': id(self) & 0xffff, b'mode': b'standalone', b'role': b'master', b'modules': []}
+                if name in ('SUBSCRIBE', 'UNSUBSCRIBE'):
+                    return self._subscription(name, args[1:])
+                if name == 'WATCH':
+                    with stub.lock:
+                        self.watched = self.watched or {}
+                        for key in args[1:]:
+                            self.watched[key] = stub.versions.get(key, 0)
+                    return 'OK'
+                if name == 'UNWATCH':
+                    self.watched = None
+                    return 'OK'
+                if name == 'MULTI':
+                    self.queued = []
+                    return 'OK'
+                if name == 'DISCARD':
+                    self.queued = self.watched = None
+                    return 'OK'
+                if name == 'EXEC':
+                    return self._exec()
+                if self.queued is not None:
+                    self.queued.append(args)
+                    return 'QUEUED'
+                return stub.execute(args)
+
+            def _exec(self):
+                if self.queued is None:
+                    return RespError('ERR EXEC without MULTI')
+                queued, watched = self.queued, self.watched
+                self.queued = self.watched = None
+                with stub.lock:
+                    # Ein beobachteter Schlüssel wurde verändert → Transaktion verwerfen (Null-Array)
+                    if watched and any(stub.versions.get(key, 0) != version for key, version in watched.items()):
+                        return None
+                    return [stub.execute(args) for args in queued]
+
+            def _subscription(self, name, channels):
+                replies = []
+                with stub.lock:
+                    for channel in channels:
+                        if name == 'SUBSCRIBE':
+                            self.subscribed.add(channel)
+                            stub.channels.setdefault(channel, set()).add(self)
+                        else:
+                            self.subscribed.discard(channel)
+                            stub.channels.get(channel, set()).discard(self)
+                        replies.append(Push([name.lower().encode('ascii'), channel, len(self.subscribed)]))
+                for reply in replies[:-1]:
+                    self.push(reply)
+                return replies[-1] if replies else Push([name.lower().encode('ascii'), None, len(self.subscribed)])
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Redis stand-in for plantuml-sync')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=16379)
+    options = parser.parse_args()
+    stub = StubRedis(options.host, options.port)
+    print(f'Redis stub listening on {stub.url}')
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
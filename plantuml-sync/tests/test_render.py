@@ -0,0 +1,76 @@
+import pytest
+
+from render import RenderCache, RoomRenderer, SharedRenderCache
+
+SVG = b'<svg>rendered</svg>'
+
+
+class Worker:
+    """RoomRenderer without timers and backend: renders run immediately and are counted"""
+
+    def __init__(self, rooms, cache):
+        self.emitted = []
+        self.renderer = RoomRenderer('http://backend/uml', self.emit, self.spawn_after, rooms.get, cache=cache)
+        self.renderer._render = self.render
+        self.rendered = []
+
+    def emit(self, event, payload, to, namespace):
+        self.emitted.append((event, payload, to))
+
+    @staticmethod
+    def spawn_after(seconds, fn, *args):
+        fn(*args)
+
+    def render(self, text):
+        self.rendered.append(text)
+        return SVG
+
+
+def test_same_text_is_rendered_once_across_rooms():
+    rooms = {'a': ('@startuml\nA -> B\n@enduml', 3), 'b': ('@startuml\nA -> B\n@enduml', 7)}
+    worker = Worker(rooms, RenderCache(1024))
+    worker.renderer.schedule('/', 'a')
+    worker.renderer.schedule('/', 'b')
+    assert len(worker.rendered) == 1
+    digest = RoomRenderer.digest(rooms['a'][0])
+    assert worker.emitted == [
+        ('diagram_render', {'rev': 3, 'hash': digest, 'url': f'/plantuml-sync/render/{digest}.svg'}, 'a'),
+        ('diagram_render', {'rev': 7, 'hash': digest, 'url': f'/plantuml-sync/render/{digest}.svg'}, 'b'),
+    ]
+    assert worker.renderer.stats()['cache_hits'] == 1
+
+
+def test_current_only_for_cached_text():
+    rooms = {'a': ('@startuml\nA -> B\n@enduml', 3)}
+    worker = Worker(rooms, RenderCache(1024))
+    assert worker.renderer.current(*rooms['a']) is None
+    assert worker.renderer.current('  ', 0) is None
+    worker.renderer.schedule('/', 'a')
+    assert worker.renderer.current(*rooms['a'])['rev'] == 3
+
+
+def test_render_cache_evicts_least_recently_used():
+    cache = RenderCache(10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234'
+    assert cache.bytes == 8
+
+
+def test_render_urls_resolve_on_every_worker(redis_stub):
+    pytest.importorskip('redis')
+    rooms = {'a': ('@startuml\nA -> B\n@enduml', 3)}
+    first = Worker(rooms, SharedRenderCache(redis_stub.url, 1024, prefix='test:'))
+    second = Worker(rooms, SharedRenderCache(redis_stub.url, 1024, prefix='test:'))
+    first.renderer.schedule('/', 'a')
+    digest = first.emitted[0][1]['hash']
+    # Render-Route des anderen Workers findet das SVG
+    assert second.renderer.cache.get(digest) == SVG
+    # Beitritt auf dem anderen Worker bekommt das Rendering, ein Commit dort rendert nicht neu
+    assert second.renderer.current(*rooms['a'])['hash'] == digest
+    second.renderer.schedule('/', 'a')
+    assert second.rendered == []
+    assert first.rendered == [rooms['a'][0]]
@@ -0,0 +1,140 @@
+import pytest
+
+from rooms import RedisRoomRegistry
+from textpatch import PatchError, apply_patch, make_patch, transform
+
+
+def set_text(text):
+    """Change function like a full-text update in app.py"""
+    def change(current, newer):
+        patch = make_patch(current, text)
+        return (text, patch) if patch is not None else None
+    return change
+
+
+def rebase(patch):
+    """Change function like a diagram_patch in app.py: rebase over newer entries, then apply"""
+    def change(text, newer):
+        rebased = patch
+        for _, applied in newer:
+            rebased = transform(rebased, applied)
+            if rebased is None:
+                raise PatchError('conflict')
+        return apply_patch(text, rebased), rebased
+    return change
+
+
+def test_join_and_leave_track_members(registry):
+    assert registry.join('r', 'a') == 1
+    assert registry.join('r', 'b') == 2
+    # Doppelter Join zählt nicht
+    assert registry.join('r', 'b') == 2
+    assert registry.is_member('r', 'a')
+    assert sorted(registry.members('r')) == ['a', 'b']
+    assert registry.rooms_of('a') == ['r']
+    assert registry.stats()['total_users'] == 2
+
+    assert registry.leave('r', 'a') == 1
+    assert registry.leave('r', 'a') is None
+    assert not registry.is_member('r', 'a')
+    assert 'r' in registry
+    assert registry.leave('r', 'b') == 0
+    assert 'r' not in registry
+    assert registry.stats()['active_rooms'] == 0
+    assert registry.stats()['total_users'] == 0
+
+
+def test_last_leave_drops_room_state(registry):
+    registry.join('r', 'a')
+    registry.update('r', set_text('hello'))
+    registry.leave('r', 'a')
+    registry.join('r', 'b')
+    assert registry.snapshot('r') == ('', 0)
+
+
+def test_leave_all(registry):
+    registry.join('r1', 'a')
+    registry.join('r2', 'a')
+    registry.join('r2', 'b')
+    assert sorted(registry.leave_all('a')) == [('r1', 0), ('r2', 1)]
+    assert registry.rooms_of('a') == []
+    assert 'r1' not in registry
+    assert registry.members('r2') == ['b']
+    assert registry.stats()['total_users'] == 1
+
+
+def test_update_sequences_revisions(registry):
+    registry.join('r', 'a')
+    assert registry.update('r', set_text('hello')) == (1, {'pos': 0, 'del': 0, 'ins': 'hello'}, 'hello')
+    rev, patch, text = registry.update('r', set_text('hello world'))
+    assert (rev, text) == (2, 'hello world')
+    # Unveränderter Text: kein Commit
+    assert registry.update('r', set_text('hello world')) is None
+    assert registry.snapshot('r') == ('hello world', 2)
+
+
+def test_update_rebases_over_newer_revisions(registry):
+    registry.join('r', 'a')
+    registry.update('r', set_text('hello'))
+    # Anderer Client fügt vorne ein (rev 2), unser Patch basiert noch auf rev 1
+    registry.update('r', rebase({'pos': 0, 'del': 0, 'ins': '> '}), base_rev=1)
+    rev, patch, text = registry.update('r', rebase({'pos': 5, 'del': 0, 'ins': '!'}), base_rev=1)
+    assert (rev, text) == (3, '> hello!')
+    assert patch == {'pos': 7, 'del': 0, 'ins': '!'}
+
+
+def test_update_rejects_conflicts_and_unknown_revisions(registry):
+    registry.join('r', 'a')
+    registry.update('r', set_text('hello'))
+    registry.update('r', rebase({'pos': 0, 'del': 5, 'ins': 'bye'}), base_rev=1)
+    with pytest.raises(PatchError):
+        registry.update('r', rebase({'pos': 1, 'del': 2, 'ins': 'x'}), base_rev=1)
+    with pytest.raises(PatchError, match='unknown revision'):
+        registry.update('r', rebase({'pos': 0, 'del': 0, 'ins': 'x'}), base_rev=9)
+    # Älter als das Log (history=5)
+    for n in range(6):
+        registry.update('r', set_text(f'text {n}'))
+    with pytest.raises(PatchError, match='unknown revision'):
+        registry.update('r', rebase({'pos': 0, 'del': 0, 'ins': 'x'}), base_rev=1)
+    assert registry.snapshot('r') == ('text 5', 8)
+
+
+def test_workers_share_rooms(redis_stub):
+    pytest.importorskip('redis')
+    first = RedisRoomRegistry(redis_stub.url, prefix='test:')
+    second = RedisRoomRegistry(redis_stub.url, prefix='test:')
+    first.join('r', 'a')
+    assert second.join('r', 'b') == 2
+    first.update('r', set_text('from first'))
+    assert second.snapshot('r') == ('from first', 1)
+    assert second.rooms_of('a') == ['r']
+
+
+def test_concurrent_commit_is_retried_after_watch_conflict(redis_stub):
+    pytest.importorskip('redis')
+    first = RedisRoomRegistry(redis_stub.url, prefix='test:')
+    second = RedisRoomRegistry(redis_stub.url, prefix='test:')
+    first.join('r', 'a')
+    first.update('r', set_text('hello'))
+    calls = []
+
+    def change(text, newer):
+        calls.append((text, list(newer)))
+        if len(calls) == 1:
+            # Anderer Worker committet zwischen WATCH und EXEC → EXEC schlägt fehl
+            second.update('r', rebase({'pos': 0, 'del': 0, 'ins': '> '}), base_rev=1)
+        return rebase({'pos': 5, 'del': 0, 'ins': '!'})(text, newer)
+
+    rev, patch, text = first.update('r', change, base_rev=1)
+    assert len(calls) == 2
+    # Zweiter Versuch sieht den fremden Commit und rebased darüber
+    assert calls[1] == ('> hello', [(2, {'pos': 0, 'del': 0, 'ins': '> '})])
+    assert (rev, text, patch) == (3, '> hello!', {'pos': 7, 'del': 0, 'ins': '!'})
+    assert second.snapshot('r') == ('> hello!', 3)
+
+
+def test_join_restores_persisted_room(redis_stub):
+    pytest.importorskip('redis')
+    registry = RedisRoomRegistry(redis_stub.url, prefix='test:', loader={'r': ('saved', 7)}.get)
+    registry.join('r', 'a')
+    assert registry.snapshot('r') == ('saved', 7)
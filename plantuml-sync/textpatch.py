@@ -0,0 +1,91 @@
+"""
+Text patches for revision-based diagram sync
+A patch is a single splice {'pos', 'del', 'ins'}: at position pos remove
+del characters and insert ins. Positions count UTF-16 code units, i.e.
+JavaScript string indices as sent by collab-client.js.
+"""
+
+import re
+
+# Zeichen außerhalb der BMP belegen in JavaScript zwei Code Units
+_ASTRAL_RE = re.compile('[\U00010000-\U0010FFFF]')
+
+
+class PatchError(ValueError):
+    """Patch does not fit the text it is applied to."""
+    pass
+
+
+def _js_length(text):
+    return len(text) + len(_ASTRAL_RE.findall(text))
+
+
+def _to_index(text, pos):
+    """UTF-16 position → Python index (identity for BMP-only text)"""
+    if not _ASTRAL_RE.search(text):
+        return pos
+    units = 0
+    for index, ch in enumerate(text):
+        if units >= pos:
+            if units > pos:
+                raise PatchError(f"position {pos} splits a surrogate pair")
+            return index
+        units += 2 if ord(ch) > 0xFFFF else 1
+    if units != pos:
+        raise PatchError(f"position {pos} out of range")
+    return len(text)
+
+
+def make_patch(old, new):
+    """Smallest single splice turning old into new, None if both are equal"""
+    if old == new:
+        return None
+    limit = min(len(old), len(new))
+    start = 0
+    while start < limit and old[start] == new[start]:
+        start += 1
+    end = 0
+    while end < limit - start and old[-1 - end] == new[-1 - end]:
+        end += 1
+    return {
+        'pos': _js_length(old[:start]),
+        'del': _js_length(old[start:len(old) - end]),
+        'ins': new[start:len(new) - end],
+    }
+
+
+def validate(data):
+    """Patch fields from a client payload, PatchError if malformed"""
+    try:
+        patch = {'pos': int(data['pos']), 'del': int(data['del']), 'ins': str(data.get('ins', ''))}
+    except (KeyError, TypeError, ValueError) as e:
+        raise PatchError(f"malformed patch: {e}") from e
+    if patch['pos'] < 0 or patch['del'] < 0:
+        raise PatchError('negative position or length')
+    return patch
+
+
+def apply_patch(text, patch):
+    start = _to_index(text, patch['pos'])
+    end = _to_index(text, patch['pos'] + patch['del'])
+    if end > len(text):
+        raise PatchError('patch exceeds text length')
+    return text[:start] + patch['ins'] + text[end:]
+
+
+def transform(patch, applied):
+    """
+    Rebase patch (made against the text before `applied`) onto the text
+    after it. Returns the shifted patch, or None when both touch the same
+    range - the client then resyncs from a snapshot.
+    """
+    pos, end = patch['pos'], patch['pos'] + patch['del']
+    applied_pos, applied_end = applied['pos'], applied['pos'] + applied['del']
+    if pos == applied_pos and patch['del'] == 0 and applied['del'] == 0:
+        # Zwei Einfügungen an derselben Stelle: die zuerst sequenzierte steht vorne
+        return dict(patch, pos=pos + _js_length(applied['ins']))
+    if end <= applied_pos:
+        return patch
+    if pos >= applied_end:
+        return dict(patch, pos=pos + _js_length(applied['ins']) - applied['del'])
+    return None
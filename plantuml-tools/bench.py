@@ -0,0 +1,126 @@
+"""
+Render latency benchmark for the PlantUML backend
+Replays a corpus (existing .puml files plus synthetic diagrams of growing
+size) at several concurrency levels and reports throughput, latency
+percentiles and error rates as JSON, so runs can be compared over time
+and JAVA_TOOL_OPTIONS / mem_limit can be sized from data.
+"""
+
+import math
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import plantuml_codec
+from render_client import RenderClient, RenderError
+
+
+def synthetic_diagram(elements):
+    """
+    Component graph with n elements and ~2n relations (no remote includes):
+    each element is called by a random earlier one and reads from another,
+    so the layout is a branching graph rather than a star. Seeded with n,
+    the same size always yields the same diagram.
+    """
+    rng = random.Random(elements)
+    lines = ['@startuml', 'skinparam componentStyle rectangle']
+    for i in range(elements):
+        lines.append(f'component "Service {i}" as s{i}')
+    for i in range(1, elements):
+        lines.append(f's{rng.randrange(i)} --> s{i} : calls')
+        if i > 2:
+            lines.append(f's{i} ..> s{rng.randrange(i)} : reads')
+    lines.append('@enduml')
+    return '\n'.join(lines) + '\n'
+
+
+def build_corpus(paths=(), synthetic_sizes=()):
+    """List of (name, text) from .puml files/directories and synthetic sizes"""
+    corpus = []
+    for path in (Path(p) for p in paths):
+        files = sorted(path.rglob('*.puml')) if path.is_dir() else [path]
+        corpus.extend((f.name, f.read_text()) for f in files)
+    corpus.extend((f'synthetic-{n}', synthetic_diagram(n)) for n in synthetic_sizes)
+    return corpus
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def latency_summary(latencies):
+    values = sorted(latencies)
+    if not values:
+        return None
+    return {
+        'p50': round(percentile(values, 50) * 1000, 2),
+        'p95': round(percentile(values, 95) * 1000, 2),
+        'p99': round(percentile(values, 99) * 1000, 2),
+        'mean': round(statistics.fmean(values) * 1000, 2),
+        'max': round(values[-1] * 1000, 2),
+    }
+
+
+def timed_render(client, name, text, encoded, fmt):
+    """One request: (name, seconds, error or None, bytes)"""
+    start = time.perf_counter()
+    try:
+        size = len(client.render_text(text, fmt, encoded=encoded))
+        return name, time.perf_counter() - start, None, size
+    except RenderError as e:
+        return name, time.perf_counter() - start, str(e), 0
+
+
+def run_level(base_url, corpus, concurrency, rounds, fmt):
+    """Replay the corpus `rounds` times with `concurrency` parallel requests"""
+    # Encoding vorab, damit nur Backend-Zeit gemessen wird
+    prepared = [(name, text, plantuml_codec.encode(text)) for name, text in corpus]
+    work = prepared * rounds
+    latencies = []
+    per_diagram = {}
+    errors = {}
+    # Ohne Retries und mit festem Limit, sonst misst der Benchmark die Flow Control statt des Backends
+    with RenderClient(base_url, pool_size=concurrency, retries=0, flow_control=False) as client, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda item: timed_render(client, *item, fmt), work))
+        duration = time.perf_counter() - start
+    for name, seconds, error, _ in results:
+        if error is None:
+            latencies.append(seconds)
+            per_diagram.setdefault(name, []).append(seconds)
+        else:
+            errors[error] = errors.get(error, 0) + 1
+    failed = sum(errors.values())
+    return {
+        'concurrency': concurrency,
+        'requests': len(work),
+        'errors': failed,
+        'error_rate': round(failed / len(work), 4) if work else 0.0,
+        'error_types': errors,
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(latencies) / duration, 2) if duration else None,
+        'latency_ms': latency_summary(latencies),
+        'per_diagram_p50_ms': {name: latency_summary(values)['p50'] for name, values in per_diagram.items()},
+    }
+
+
+def run_bench(base_url, corpus, levels, rounds=3, fmt='svg', warmup=1):
+    """Full benchmark run as JSON-serializable dict"""
+    if warmup:
+        # Ein Durchlauf vorweg, damit JIT/Stdlib-Caches nicht die erste Stufe verzerren
+        run_level(base_url, corpus, max(levels), warmup, fmt)
+    return {
+        'backend': base_url,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'format': fmt,
+        'rounds': rounds,
+        'corpus': [{'name': name, 'bytes': len(text.encode('utf-8'))} for name, text in corpus],
+        'levels': [run_level(base_url, corpus, c, rounds, fmt) for c in levels],
+    }
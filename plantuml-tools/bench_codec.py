@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: plantuml_codec vs. plantuml.deflate_and_encode
+Usage: python plantuml-tools/bench_codec.py [--repeat N] [files...]
+
+Measures module import time (fresh interpreter) and encode throughput on
+synthetic diagrams of growing size plus any given .puml files, in memory
+(encode) and streamed from disk (encode_file vs. read_text + encode).
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import plantuml_codec
+
+try:
+    from plantuml import deflate_and_encode
+except ImportError:
+    deflate_and_encode = None
+
+
+def synthetic_diagram(relations):
+    """Sequence diagram with n messages between a handful of participants"""
+    lines = ['@startuml']
+    for i in range(relations):
+        lines.append(f'Service{i % 17} -> Service{(i * 7) % 23} : request {i} with payload size {i * 31 % 997}')
+    lines.append('@enduml')
+    return '\n'.join(lines) + '\n'
+
+
+def import_time(module):
+    """Median wall time of 'import module' in a fresh interpreter (minus bare start-up)"""
+    def _run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).resolve().parent, check=True)
+        return time.perf_counter() - start
+    baseline = statistics.median(_run('pass') for _ in range(5))
+    return statistics.median(_run(f'import {module}') for _ in range(5)) - baseline
+
+
+def bench(func, text, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(text)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('files', nargs='*', type=Path, help='Additional .puml files to benchmark')
+    parser.add_argument('--repeat', type=int, default=20, help='Runs per input (median is reported)')
+    args = parser.parse_args()
+
+    inputs = [(f'synthetic {n} rel', synthetic_diagram(n)) for n in (10, 1000, 20000, 100000)]
+    inputs += [(f.name, f.read_text()) for f in args.files]
+
+    print("Import time (fresh interpreter):")
+    print(f"  plantuml_codec: {import_time('plantuml_codec') * 1000:7.1f} ms")
+    if deflate_and_encode is not None:
+        print(f"  plantuml:       {import_time('plantuml') * 1000:7.1f} ms")
+    else:
+        print("  plantuml:       not installed (pip install plantuml) - only codec is measured")
+
+    print(f"\n{'Input':<22} {'Size':>10} {'codec':>10} {'library':>10} {'MB/s':>8} {'same':>5}"
+          f" {'read+enc':>10} {'stream':>10}")
+    tmp_dir = tempfile.TemporaryDirectory()
+    for index, (name, text) in enumerate(inputs):
+        size = len(text.encode('utf-8'))
+        codec_time = bench(plantuml_codec.encode, text, args.repeat)
+        roundtrip = plantuml_codec.decode(plantuml_codec.encode(text)) == text
+        if deflate_and_encode is not None:
+            lib_time = bench(deflate_and_encode, text, args.repeat)
+            same = plantuml_codec.encode(text) == deflate_and_encode(text)
+            lib_col = f"{lib_time * 1000:8.2f}ms"
+        else:
+            same = roundtrip
+            lib_col = f"{'-':>10}"
+        # Dateipfad: ganze Datei lesen + encode gegen den Streaming-Encoder (liest in 64-KiB-Blöcken)
+        path = Path(tmp_dir.name) / f'{index}.puml'
+        path.write_text(text)
+        read_time = bench(lambda p: plantuml_codec.encode(p.read_text()), path, args.repeat)
+        stream_time = bench(plantuml_codec.encode_file, path, args.repeat)
+        same = same and plantuml_codec.encode_file(path) == plantuml_codec.encode(text)
+        mb_s = size / codec_time / 1024 / 1024 if codec_time else float('inf')
+        print(f"{name:<22} {size:>10} {codec_time * 1000:8.2f}ms {lib_col} {mb_s:8.1f} {'✓' if same and roundtrip else '✗':>5}"
+              f" {read_time * 1000:8.2f}ms {stream_time * 1000:8.2f}ms")
+    tmp_dir.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,268 @@
+"""
+C4 model element index
+Parses the C4-PlantUML macros (Person, System, Container, ContainerDb,
+Component, *_Boundary, Deployment_Node, Rel/BiRel and their variants) of
+all diagrams below a directory into a JSON index: which elements exist,
+their labels, the relations between them and which diagrams show them
+(directly or through local includes). Only files whose hash changed are
+parsed again on update.
+"""
+
+import json
+import re
+from pathlib import Path
+
+from includes import file_hash, parse_includes, resolve_local
+from render_cache import atomic_write
+
+INDEX_NAME = '.plantuml-index.json'
+INDEX_VERSION = 1
+SOURCE_PATTERNS = ('*.puml', '*.iuml', '*.pu', '*.plantuml')
+DIAGRAM_SUFFIX = '.puml'
+
+ELEMENT_MACROS = {
+    f'{base}{variant}{ext}'
+    for base in ('System', 'Container', 'Component')
+    for variant in ('', 'Db', 'Queue')
+    for ext in ('', '_Ext')
+} | {'Person', 'Person_Ext'} | {
+    f'{base}{side}' for base in ('Deployment_Node', 'Node') for side in ('', '_L', '_R')
+}
+BOUNDARY_MACROS = {'Boundary', 'Enterprise_Boundary', 'System_Boundary', 'Container_Boundary'}
+# Rel, Rel_U, Rel_Back, Rel_Neighbor, BiRel_R, ... (Lay_* sind nur Layout-Hinweise)
+REL_RE = re.compile(r'^(Bi)?Rel(_[A-Za-z]+)*$')
+CALL_RE = re.compile(r'^\s*([A-Za-z_][A-Za-z0-9_]*)\s*\(')
+
+
+def _split_args(line, start):
+    """Top-level arguments of a macro call starting after '(' (quotes and nested parentheses respected)"""
+    args = []
+    current = []
+    depth = 0
+    quote = False
+    for ch in line[start:]:
+        if quote:
+            current.append(ch)
+            if ch == '"':
+                quote = False
+            continue
+        if ch == '"':
+            quote = True
+            current.append(ch)
+        elif ch == '(':
+            depth += 1
+            current.append(ch)
+        elif ch == ')':
+            if depth == 0:
+                break
+            depth -= 1
+            current.append(ch)
+        elif ch == ',' and depth == 0:
+            args.append(''.join(current))
+            current = []
+        else:
+            current.append(ch)
+    args.append(''.join(current))
+    # Benannte Argumente ($tags="...", $link=...) tragen keine Struktur
+    return [arg.strip().strip('"') for arg in args if not arg.strip().startswith('$')]
+
+
+def _arg(args, i):
+    return args[i] if len(args) > i and args[i] else None
+
+
+def parse_c4(text):
+    """Elements and relations declared in one file (without its includes)"""
+    elements = {}
+    relations = []
+    parents = []
+    in_comment = False
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if in_comment:
+            in_comment = "'/" not in stripped
+            continue
+        if stripped.startswith("/'"):
+            in_comment = "'/" not in stripped[2:]
+            continue
+        if not stripped or stripped.startswith("'"):
+            continue
+        if stripped.startswith('}'):
+            if parents:
+                parents.pop()
+            continue
+        match = CALL_RE.match(line)
+        macro = match.group(1) if match else None
+        if macro not in ELEMENT_MACROS and macro not in BOUNDARY_MACROS and not (macro and REL_RE.match(macro)):
+            if stripped.endswith('{'):
+                # Andere Blöcke (skinparam, note, ...) nur für die Klammer-Bilanz merken
+                parents.append(None)
+            continue
+        args = _split_args(line, match.end())
+        if REL_RE.match(macro):
+            if len(args) >= 2:
+                relations.append({
+                    'macro': macro,
+                    'from': args[0],
+                    'to': args[1],
+                    'label': _arg(args, 2),
+                    'technology': _arg(args, 3),
+                })
+            continue
+        alias = _arg(args, 0)
+        if alias is None:
+            continue
+        technology = description = None
+        if macro.startswith(('Container', 'Component', 'Deployment_Node', 'Node')) and macro not in BOUNDARY_MACROS:
+            # (alias, label, technology/type, description)
+            technology, description = _arg(args, 2), _arg(args, 3)
+        elif macro not in BOUNDARY_MACROS:
+            # Person/System: (alias, label, description)
+            description = _arg(args, 2)
+        elements[alias] = {
+            'macro': macro,
+            'label': _arg(args, 1),
+            'technology': technology,
+            'description': description,
+            'parent': next((p for p in reversed(parents) if p), None),
+        }
+        if stripped.endswith('{'):
+            parents.append(alias)
+    return elements, relations
+
+
+class C4Index:
+    """Persistent element → diagrams / relations / labels index for one directory tree"""
+
+    def __init__(self, root):
+        self.root = Path(root).resolve()
+        self.path = self.root / INDEX_NAME
+        self.files = {}
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get('version') == INDEX_VERSION:
+                self.files = data.get('files', {})
+        except (FileNotFoundError, ValueError):
+            pass
+
+    def key(self, path):
+        """Index key: path relative to the root, absolute for includes outside of it"""
+        path = Path(path).resolve()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _path(self, key):
+        return Path(key) if Path(key).is_absolute() else self.root / key
+
+    def update(self):
+        """Re-parse new/changed files, drop deleted ones. Returns (parsed, removed)"""
+        queue = [path for pattern in SOURCE_PATTERNS for path in self.root.rglob(pattern)
+                 if not any(part.startswith('.') for part in path.relative_to(self.root).parts)]
+        seen = set()
+        parsed = 0
+        while queue:
+            path = queue.pop()
+            key = self.key(path)
+            if key in seen:
+                continue
+            seen.add(key)
+            try:
+                digest = file_hash(path)
+            except (FileNotFoundError, UnicodeDecodeError):
+                self.files.pop(key, None)
+                continue
+            entry = self.files.get(key)
+            if entry is None or entry.get('hash') != digest:
+                text = path.read_text()
+                elements, relations = parse_c4(text)
+                includes = []
+                for _, target in parse_includes(text):
+                    local = resolve_local(target, path)
+                    if local is not None:
+                        includes.append(self.key(local))
+                entry = self.files[key] = {
+                    'hash': digest,
+                    'elements': elements,
+                    'relations': relations,
+                    'includes': includes,
+                }
+                parsed += 1
+            # Includes außerhalb des Verzeichnisses mit indexieren
+            queue.extend(self._path(inc) for inc in entry['includes'] if inc not in seen)
+        removed = [key for key in self.files if key not in seen]
+        for key in removed:
+            del self.files[key]
+        return parsed, len(removed)
+
+    def _closure(self, key):
+        """key plus all transitively included files"""
+        result = []
+        stack = [key]
+        while stack:
+            current = stack.pop()
+            if current in result or current not in self.files:
+                continue
+            result.append(current)
+            stack.extend(self.files[current]['includes'])
+        return result
+
+    def _mentions(self, key, element):
+        entry = self.files[key]
+        return element in entry['elements'] or any(
+            element in (rel['from'], rel['to']) for rel in entry['relations'])
+
+    def diagrams_for(self, element):
+        """Diagrams (.puml keys) that declare or relate element, directly or via includes"""
+        return sorted(
+            key for key in self.files
+            if key.endswith(DIAGRAM_SUFFIX) and any(self._mentions(k, element) for k in self._closure(key))
+        )
+
+    def elements(self):
+        """{element id: [(file key, declaration), ...]}"""
+        result = {}
+        for key, entry in self.files.items():
+            for alias, decl in entry['elements'].items():
+                result.setdefault(alias, []).append((key, decl))
+        return result
+
+    def element(self, element):
+        """Everything known about one element id, or None"""
+        declarations = self.elements().get(element, [])
+        relations = [dict(rel, file=key) for key, entry in sorted(self.files.items())
+                     for rel in entry['relations'] if element in (rel['from'], rel['to'])]
+        if not declarations and not relations:
+            return None
+        return {
+            'id': element,
+            'macros': sorted({decl['macro'] for _, decl in declarations}),
+            'labels': sorted({decl['label'] for _, decl in declarations if decl['label']}),
+            'declared_in': sorted(key for key, _ in declarations),
+            'diagrams': self.diagrams_for(element),
+            'relations': relations,
+        }
+
+    def search(self, text):
+        """Element ids whose id or label contains text (case-insensitive)"""
+        needle = text.lower()
+        return sorted(
+            alias for alias, decls in self.elements().items()
+            if needle in alias.lower() or any(needle in (decl['label'] or '').lower() for _, decl in decls)
+        )
+
+    def save(self):
+        # Invertierter Index mit abspeichern, damit andere Tools ihn ohne Parser lesen können
+        by_element = {
+            alias: {
+                'labels': sorted({decl['label'] for _, decl in decls if decl['label']}),
+                'diagrams': self.diagrams_for(alias),
+            }
+            for alias, decls in self.elements().items()
+        }
+        atomic_write(self.path, json.dumps({
+            'version': INDEX_VERSION,
+            'files': self.files,
+            'elements': by_element,
+        }, indent=2, sort_keys=True, ensure_ascii=False).encode('utf-8'))
@@ -0,0 +1,258 @@
+"""
+Flow control for requests against the render backends
+AdaptiveLimiter caps the number of in-flight requests per backend and moves
+the cap AIMD style: one more slot per window of healthy responses, half the
+slots on 5xx/timeouts or when latency climbs well above its baseline.
+HealthGate tracks whether a backend is up (e.g. not restarting its JVM).
+Balancer spreads requests over several backends by least outstanding
+requests, ejects backends whose health check fails and probes them in the
+background until they can rejoin.
+"""
+
+import functools
+import os
+import random
+import threading
+import time
+
+RETRIES = int(os.getenv('PLANTUML_RETRIES', '4'))
+BACKOFF_BASE = 0.25
+BACKOFF_MAX = 8.0
+# So lange warten Requests auf ein gesundes Backend, danach schlagen sie sofort fehl
+HEALTH_TIMEOUT = float(os.getenv('PLANTUML_HEALTH_TIMEOUT', '60'))
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2^attempt))"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class AdaptiveLimiter:
+    """Concurrency limit for backend requests that adapts to latency and errors (AIMD)"""
+
+    def __init__(self, maximum, initial=None, minimum=1, latency_factor=2.0, adaptive=True, cond=None):
+        self.maximum = max(1, maximum)
+        self.minimum = min(minimum, self.maximum)
+        self.adaptive = adaptive
+        if not adaptive:
+            start = self.maximum
+        else:
+            # Vorsichtig starten, das Limit wächst mit den Antworten
+            start = min(self.maximum, 2) if initial is None else initial
+        self.limit = float(max(self.minimum, min(self.maximum, start)))
+        self.peak = self.limit
+        self.latency_factor = latency_factor
+        self.inflight = 0
+        self.ewma = None
+        self.baseline = None
+        self.decreases = 0
+        self._last_decrease = 0.0
+        # Balancer teilt eine Condition über alle Backends, damit jede Freigabe Wartende weckt
+        self._cond = cond or threading.Condition()
+
+    def has_capacity(self):
+        return self.inflight < int(self.limit)
+
+    def acquire(self):
+        with self._cond:
+            while not self.has_capacity():
+                self._cond.wait()
+            self.inflight += 1
+
+    def release(self, latency=None, ok=True):
+        """
+        Free a slot and feed back the outcome.
+        latency=None: no signal (request aborted on our side, e.g. cancelled)
+        ok=False: 5xx, timeout or connection failure
+        """
+        with self._cond:
+            self.inflight -= 1
+            if self.adaptive:
+                if not ok:
+                    self._decrease()
+                elif latency is not None:
+                    self._observe(latency)
+            self._cond.notify_all()
+
+    def _observe(self, latency):
+        self.ewma = latency if self.ewma is None else 0.8 * self.ewma + 0.2 * latency
+        # Baseline = kleinster geglätteter Wert, driftet langsam nach oben (Backend-Wechsel, größere Diagramme)
+        self.baseline = self.ewma if self.baseline is None else min(self.ewma, self.baseline * 1.01)
+        if self.ewma > self.baseline * self.latency_factor:
+            self._decrease()
+        elif self.inflight + 1 >= int(self.limit):
+            # Nur erhöhen, wenn das Limit auch ausgeschöpft wird: +1 pro Fenster von `limit` Antworten
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.peak = max(self.peak, self.limit)
+
+    def _decrease(self):
+        now = time.monotonic()
+        # Ein Schwung gleichzeitiger Fehler halbiert nur einmal
+        if now - self._last_decrease < max(self.ewma or 0.0, 0.1):
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit / 2)
+        self.decreases += 1
+        if self.baseline is not None and self.ewma is not None:
+            # Nach dem Halbieren neu einpendeln statt sofort wieder zu bremsen
+            self.ewma = self.baseline
+
+
+class HealthGate:
+    """
+    Up/down state of one backend.
+    After `threshold` consecutive failures the backend counts as down; it is
+    probed with growing intervals and the first successful probe brings it back.
+    """
+
+    def __init__(self, probe, threshold=3, interval=1.0, max_interval=15.0):
+        self.probe = probe
+        self.threshold = threshold
+        self.interval = interval
+        self.max_interval = max_interval
+        self.healthy = True
+        self.failures = 0
+        self.outages = 0
+        self.down_since = None
+        self.next_probe = 0.0
+        self._backoff = interval
+        self._lock = threading.Lock()
+
+    def record(self, ok):
+        """Feed back one request outcome. Returns True if this failure took the backend down"""
+        with self._lock:
+            if ok:
+                self.failures = 0
+                return False
+            self.failures += 1
+            if self.healthy and self.failures >= self.threshold:
+                self.healthy = False
+                self.outages += 1
+                self.down_since = time.monotonic()
+                self._backoff = self.interval
+                self.next_probe = self.down_since + self._backoff
+                return True
+            return False
+
+    def down_for(self):
+        return 0.0 if self.healthy else time.monotonic() - self.down_since
+
+    def probe_once(self):
+        """Run the probe now; returns True if the backend is back"""
+        try:
+            ok = bool(self.probe())
+        except Exception:
+            ok = False
+        with self._lock:
+            if ok:
+                self.healthy = True
+                self.failures = 0
+            else:
+                self._backoff = min(self.max_interval, self._backoff * 2)
+                self.next_probe = time.monotonic() + self._backoff
+        return ok
+
+
+class Backend:
+    """One render backend with its own AIMD limit, health state and counters"""
+
+    def __init__(self, url, limiter, health):
+        self.url = url
+        self.limiter = limiter
+        self.health = health
+        self.requests = 0
+        self.errors = 0
+        self.answered = 0
+        self.seconds = 0.0
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'healthy': self.health.healthy,
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.seconds / self.answered * 1000, 1) if self.answered else None,
+            'limit': int(self.limiter.limit),
+            'peak_limit': int(self.limiter.peak),
+            'ejections': self.health.outages,
+        }
+
+
+class Balancer:
+    """
+    Least-outstanding-requests balancing over one or more backends.
+    Down backends are skipped and probed by a background thread until they
+    answer again. If every backend has been down for longer than `timeout`,
+    acquire() fails fast instead of queueing callers.
+    """
+
+    def __init__(self, urls, maximum, probe, adaptive=True, threshold=3, timeout=HEALTH_TIMEOUT):
+        self._cond = threading.Condition()
+        self.backends = [
+            Backend(url, AdaptiveLimiter(maximum, adaptive=adaptive, cond=self._cond),
+                    HealthGate(functools.partial(probe, url), threshold=threshold))
+            for url in urls
+        ]
+        self.timeout = timeout
+        self._picks = 0
+        self._prober = None
+        self._closed = False
+
+    def acquire(self):
+        """Reserve a slot on the healthy backend with the fewest requests in flight. Raises TimeoutError"""
+        with self._cond:
+            while True:
+                ready = [b for b in self.backends if b.health.healthy and b.limiter.has_capacity()]
+                if ready:
+                    # Gleichstand: reihum, damit nicht immer das erste Backend gewinnt
+                    self._picks += 1
+                    n = len(self.backends)
+                    backend = min(ready, key=lambda b: (b.limiter.inflight, (self.backends.index(b) - self._picks) % n))
+                    backend.limiter.inflight += 1
+                    return backend
+                if not any(b.health.healthy for b in self.backends):
+                    down = min(b.health.down_for() for b in self.backends)
+                    if down > self.timeout:
+                        raise TimeoutError(f"backend unhealthy for {down:.0f}s")
+                self._cond.wait(timeout=0.5)
+
+    def release(self, backend, latency=None, ok=True):
+        """
+        ok=True:  backend answered (latency feeds the AIMD limit)
+        ok=False: transient failure, counts towards ejection
+        ok=None:  aborted on our side, no signal
+        """
+        with self._cond:
+            if ok is None:
+                backend.limiter.release()
+            else:
+                backend.limiter.release(latency, ok)
+                backend.requests += 1
+                if latency is not None:
+                    backend.answered += 1
+                    backend.seconds += latency
+                if not ok:
+                    backend.errors += 1
+                if backend.health.record(ok) and self._prober is None:
+                    self._prober = threading.Thread(target=self._probe_loop, daemon=True)
+                    self._prober.start()
+            self._cond.notify_all()
+
+    def _probe_loop(self):
+        while not self._closed:
+            with self._cond:
+                down = [b for b in self.backends if not b.health.healthy]
+                if not down:
+                    self._prober = None
+                    return
+                wait = min(b.health.next_probe for b in down) - time.monotonic()
+            if wait > 0:
+                time.sleep(min(wait, 0.5))
+                continue
+            for backend in down:
+                if time.monotonic() >= backend.health.next_probe and backend.health.probe_once():
+                    with self._cond:
+                        self._cond.notify_all()
+
+    def close(self):
+        self._closed = True
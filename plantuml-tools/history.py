@@ -0,0 +1,167 @@
+"""
+Render history
+Every backend render appends one JSON line (diagram, format, duration,
+output size, HTTP status) to a history file in the cache directory. batch
+uses it to start the most expensive diagrams first, `report` lists the
+slowest diagrams and flags render-time regressions.
+"""
+
+import json
+import os
+import statistics
+import threading
+import time
+from pathlib import Path
+
+from render_cache import CACHE_DIR, atomic_write
+
+HISTORY_FILE = Path(os.getenv('PLANTUML_HISTORY_FILE', CACHE_DIR / 'history.jsonl'))
+# Pro Diagramm/Format werden nur die letzten N Läufe aufbewahrt
+HISTORY_KEEP = 20
+COMPACT_LINES = 20000
+
+
+def history_key(path):
+    """Diagram path relative to the working directory (/workspace in the container), absolute otherwise"""
+    path = Path(path).resolve()
+    try:
+        return path.relative_to(Path.cwd()).as_posix()
+    except ValueError:
+        return path.as_posix()
+
+
+class RenderHistory:
+    """Append-only JSONL log of backend renders"""
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = Path(path)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._runs = None
+
+    def runs(self):
+        """{(diagram, format): [entry, ...]} oldest first"""
+        if self._runs is None:
+            self._runs = {}
+            lines = 0
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    for line in f:
+                        lines += 1
+                        try:
+                            entry = json.loads(line)
+                            key = (entry['diagram'], entry['format'])
+                        except (ValueError, KeyError, TypeError):
+                            continue
+                        self._runs.setdefault(key, []).append(entry)
+            except FileNotFoundError:
+                pass
+            if lines > COMPACT_LINES:
+                self._compact()
+        return self._runs
+
+    def _compact(self):
+        for key, entries in self._runs.items():
+            del entries[:-HISTORY_KEEP]
+        entries = sorted((e for runs in self._runs.values() for e in runs), key=lambda e: e.get('ts', 0))
+        atomic_write(self.path, ''.join(json.dumps(e, sort_keys=True) + '\n' for e in entries).encode('utf-8'))
+
+    def record(self, diagram, fmt, seconds, size, status):
+        """Buffer one render; thread-safe, written by flush()"""
+        entry = {
+            'ts': round(time.time(), 3),
+            'diagram': history_key(diagram),
+            'format': fmt,
+            'seconds': round(seconds, 4) if seconds is not None else None,
+            'bytes': size,
+            'status': status,
+        }
+        with self._lock:
+            self._pending.append(entry)
+            if self._runs is not None:
+                self._runs.setdefault((entry['diagram'], fmt), []).append(entry)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Einzelnes write im Append-Modus: parallele Läufe verschachteln keine halben Zeilen
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(e, sort_keys=True) + '\n' for e in pending))
+
+    def expected_seconds(self, diagram, formats):
+        """Median render time of the last successful runs summed over formats, None if never rendered"""
+        runs = self.runs()
+        key = history_key(diagram)
+        total = None
+        for fmt in formats:
+            times = [e['seconds'] for e in runs.get((key, fmt), [])[-5:]
+                     if e.get('status') == 200 and e.get('seconds') is not None]
+            if times:
+                total = (total or 0.0) + statistics.median(times)
+        return total
+
+    def cost_order(self, jobs):
+        """
+        Jobs sorted most expensive first (longest processing time first).
+        Diagrams without history are estimated from their file size using the
+        seconds-per-byte ratio of the known ones, so a new landscape is not
+        started last either.
+        """
+        known = {}
+        ratios = []
+        for source, targets in jobs:
+            expected = self.expected_seconds(source, [fmt for fmt, _ in targets])
+            if expected is not None:
+                known[source] = expected
+                ratios.append(expected / max(1, source.stat().st_size))
+        ratio = statistics.median(ratios) if ratios else 1e-6
+
+        def cost(job):
+            source = job[0]
+            return known[source] if source in known else source.stat().st_size * ratio
+
+        return sorted(jobs, key=cost, reverse=True)
+
+    def summary(self, top=10, threshold=1.5, min_delta=0.2):
+        """
+        slowest:     diagrams/formats by median render time of their recent runs
+        regressions: latest successful run took > threshold x the median of
+                     the earlier runs (and at least min_delta seconds longer)
+        failing:     latest run ended with an error
+        """
+        rows = []
+        regressions = []
+        failing = []
+        for (diagram, fmt), entries in self.runs().items():
+            ok = [e for e in entries if e.get('status') == 200 and e.get('seconds') is not None]
+            last = entries[-1]
+            if last.get('status') != 200:
+                failing.append({'diagram': diagram, 'format': fmt, 'status': last.get('status'), 'ts': last.get('ts')})
+            if not ok:
+                continue
+            recent = [e['seconds'] for e in ok[-5:]]
+            rows.append({
+                'diagram': diagram,
+                'format': fmt,
+                'median_s': round(statistics.median(recent), 4),
+                'last_s': ok[-1]['seconds'],
+                'bytes': ok[-1].get('bytes'),
+                'runs': len(entries),
+            })
+            if len(ok) >= 3:
+                baseline = statistics.median(e['seconds'] for e in ok[-(HISTORY_KEEP + 1):-1])
+                latest = ok[-1]['seconds']
+                if latest > baseline * threshold and latest - baseline >= min_delta:
+                    regressions.append({
+                        'diagram': diagram,
+                        'format': fmt,
+                        'baseline_s': round(baseline, 4),
+                        'latest_s': latest,
+                        'factor': round(latest / baseline, 2) if baseline else None,
+                    })
+        rows.sort(key=lambda r: r['median_s'], reverse=True)
+        regressions.sort(key=lambda r: r['latest_s'] - r['baseline_s'], reverse=True)
+        return {'slowest': rows[:top], 'regressions': regressions, 'failing': failing}
@@ -0,0 +1,139 @@
+"""
+PlantUML include handling
+Parses !include / !includesub / !include_many / !include_once directives
+and resolves the local ones relative to the including file.
+"""
+
+import hashlib
+import re
+from pathlib import Path
+
+# !include foo.puml, !includesub foo.puml!PART, !include_once "foo bar.puml"
+INCLUDE_RE = re.compile(
+    r'^\s*!(include|includesub|include_many|include_once|includeurl)\s+(.+?)\s*$',
+    re.MULTILINE
+)
+
+
+def normalize_source(text):
+    """Line endings, trailing whitespace and surrounding blank lines do not change the diagram"""
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    return '\n'.join(lines).strip('\n') + '\n'
+
+
+def is_remote(target):
+    return target.startswith(('http://', 'https://'))
+
+
+def parse_includes(text):
+    """
+    Returns the include targets of a diagram as list of (directive, target).
+    Quotes and !PART suffixes are stripped, stdlib includes (<C4/C4_Container>) are kept as-is.
+    """
+    includes = []
+    for match in INCLUDE_RE.finditer(text):
+        directive, target = match.group(1), match.group(2)
+        target = target.split("'", 1)[0].strip().strip('"')
+        if not target:
+            continue
+        if not is_remote(target) and not target.startswith('<') and '!' in target:
+            target = target.split('!', 1)[0]
+        includes.append((directive, target))
+    return includes
+
+
+def resolve_local(target, including_file):
+    """Map a local include target to a path on disk (or None if it is remote/stdlib/missing)"""
+    if is_remote(target) or target.startswith('<'):
+        return None
+    path = Path(target)
+    if not path.is_absolute():
+        path = Path(including_file).parent / path
+    return path.resolve() if path.is_file() else None
+
+
+def source_fingerprint(path):
+    """
+    sha256 over the normalized diagram text and everything it includes.
+    Local includes are followed transitively (content), remote and stdlib
+    includes only contribute their reference.
+    """
+    digest = hashlib.sha256()
+    seen = set()
+
+    def _feed(file_path):
+        file_path = Path(file_path).resolve()
+        if file_path in seen:
+            return
+        seen.add(file_path)
+        text = normalize_source(file_path.read_text())
+        digest.update(text.encode('utf-8'))
+        for _, target in parse_includes(text):
+            local = resolve_local(target, file_path)
+            digest.update(b'\0include\0' + target.encode('utf-8'))
+            if local is not None:
+                _feed(local)
+
+    _feed(path)
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    """sha256 of the normalized text of a single file (no includes)"""
+    return hashlib.sha256(normalize_source(Path(path).read_text()).encode('utf-8')).hexdigest()
+
+
+class IncludeGraph:
+    """
+    Dependency graph of local includes.
+    Edges point from a diagram to the files it includes; transitive
+    closures and reverse edges (dependents) are computed on demand.
+    """
+
+    def __init__(self):
+        self.edges = {}
+
+    def add(self, path):
+        """Parse a file (and, transitively, everything it includes) into the graph"""
+        path = Path(path).resolve()
+        if path in self.edges:
+            return
+        self.edges[path] = []
+        try:
+            text = path.read_text()
+        except (FileNotFoundError, UnicodeDecodeError):
+            return
+        for _, target in parse_includes(text):
+            local = resolve_local(target, path)
+            if local is not None:
+                self.edges[path].append(local)
+                self.add(local)
+
+    @classmethod
+    def build(cls, files):
+        graph = cls()
+        for path in files:
+            graph.add(path)
+        return graph
+
+    def deps(self, path):
+        """All files transitively included by path, in discovery order"""
+        result = []
+        seen = {Path(path).resolve()}
+        stack = list(reversed(self.edges.get(Path(path).resolve(), [])))
+        while stack:
+            dep = stack.pop()
+            if dep in seen:
+                continue
+            seen.add(dep)
+            result.append(dep)
+            stack.extend(reversed(self.edges.get(dep, [])))
+        return result
+
+    def dependents(self, path):
+        """All files that transitively include path"""
+        path = Path(path).resolve()
+        return [node for node in self.edges if node != path and path in self.deps(node)]
+
+    def remove(self, path):
+        self.edges.pop(Path(path).resolve(), None)
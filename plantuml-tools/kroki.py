@@ -0,0 +1,164 @@
+"""
+Kroki render path for non-PlantUML sources
+Mermaid (.mmd), Graphviz (.dot/.gv), D2, BPMN and the other Kroki diagram
+types are rendered through the Kroki backend of the stack with the same
+pooled session, flow control, cache and history as PlantUML diagrams.
+EngineRouter picks the client per source file, so one batch run renders
+both kinds in a single worker pool.
+"""
+
+import base64
+import hashlib
+import os
+import zlib
+
+import requests
+
+from render_client import RenderClient, RenderError, TransientRenderError, _check
+
+KROKI_URL = os.getenv('KROKI_URL', 'http://empc4_kroki_backend:8000')
+# Mehrere Kroki-Instanzen kommagetrennt, wie PLANTUML_URL
+KROKI_URLS = [url.strip().rstrip('/') for url in KROKI_URL.split(',') if url.strip()]
+
+# Dateiendung → Kroki-Diagrammtyp
+KROKI_TYPES = {
+    '.mmd': 'mermaid',
+    '.mermaid': 'mermaid',
+    '.dot': 'graphviz',
+    '.gv': 'graphviz',
+    '.d2': 'd2',
+    '.bpmn': 'bpmn',
+    '.dbml': 'dbml',
+    '.erd': 'erd',
+    '.ditaa': 'ditaa',
+    '.nomnoml': 'nomnoml',
+    '.bob': 'svgbob',
+    '.pikchr': 'pikchr',
+    '.wavedrom': 'wavedrom',
+    '.excalidraw': 'excalidraw',
+}
+# Von Kroki unterstützte Ausgabeformate je Typ (Auszug für png/svg)
+KROKI_FORMATS = {
+    'mermaid': ('svg', 'png'),
+    'graphviz': ('svg', 'png'),
+    'erd': ('svg', 'png'),
+    'ditaa': ('svg', 'png'),
+}
+DEFAULT_FORMATS = ('svg',)
+
+
+def diagram_type(path):
+    """Kroki diagram type for a source file, None for PlantUML/unknown files"""
+    return KROKI_TYPES.get(path.suffix.lower())
+
+
+def supported_formats(kind):
+    return KROKI_FORMATS.get(kind, DEFAULT_FORMATS)
+
+
+def encode(text):
+    """Kroki GET encoding: zlib (with header) + URL-safe base64"""
+    return base64.urlsafe_b64encode(zlib.compress(text.encode('utf-8'), 9)).decode('ascii')
+
+
+def decode(encoded):
+    return zlib.decompress(base64.urlsafe_b64decode(encoded.encode('ascii'))).decode('utf-8')
+
+
+def _check_kroki(response):
+    if response.status_code == 400:
+        # Kroki liefert die Fehlermeldung des Renderers (z.B. Mermaid-Parser) im Body
+        detail = response.text.strip().splitlines()[:1]
+        raise RenderError(f"400: {detail[0] if detail else response.reason}", 400)
+    _check(response)
+
+
+class KrokiClient(RenderClient):
+    """
+    RenderClient for the Kroki API (GET /<type>/<format>/<encoded>, POST
+    /<type>/<format>). The diagram type is not part of the render calls,
+    so render_job works on a per-type view from for_type().
+    """
+
+    def _probe(self, base_url):
+        """Same check as the compose healthcheck of kroki-backend: GET /health"""
+        return self.session.get(f"{base_url}/health", timeout=5).status_code < 500
+
+    def version(self):
+        """Fingerprint of the Kroki build and its companion services (part of the cache key)"""
+        try:
+            response = self.session.get(f"{self.base_urls[0]}/health", timeout=5)
+            response.raise_for_status()
+            info = response.json().get('version', {})
+        except (requests.RequestException, ValueError, AttributeError):
+            # Backend nicht erreichbar: eigener Namespace, damit nichts Falsches getroffen wird
+            return 'unknown'
+        return hashlib.sha256(repr(sorted(info.items())).encode('utf-8')).hexdigest()[:16]
+
+    def for_type(self, kind, version):
+        return KrokiDiagramClient(self, kind, version)
+
+    def _kroki_request(self, base_url, kind, text, encoded, fmt):
+        try:
+            if len(encoded) > self.post_threshold:
+                return self.session.post(
+                    f"{base_url}/{kind}/{fmt}",
+                    data=text.encode('utf-8'),
+                    headers={'Content-Type': 'text/plain; charset=utf-8'},
+                    timeout=self.timeout,
+                    stream=True,
+                )
+            return self.session.get(f"{base_url}/{kind}/{fmt}/{encoded}", timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise TransientRenderError(f"Connection failed: {e}") from e
+
+
+class KrokiDiagramClient:
+    """View of a KrokiClient bound to one diagram type, with the render_job interface"""
+
+    def __init__(self, client, kind, version):
+        self.client = client
+        self.kind = kind
+        self.base_url = client.base_url
+        # Typ und Kroki-Version im Cache-Key: gleiche Bytes als .dot und .mmd sind verschiedene Bilder
+        self.cache_salt = f'kroki-{kind}-{version}'
+
+    @staticmethod
+    def encode(text):
+        return encode(text)
+
+    @property
+    def last_seconds(self):
+        return self.client.last_seconds
+
+    def _request(self, text, encoded, fmt):
+        return lambda base_url: self.client._kroki_request(base_url, self.kind, text, encoded, fmt)
+
+    def render_text(self, text, fmt, encoded=None):
+        if encoded is None:
+            encoded = encode(text)
+        return self.client._fetch(self._request(text, encoded, fmt), check=_check_kroki)
+
+    def render_to_temp(self, text, encoded, fmt, out_file):
+        return self.client._fetch_to_temp(self._request(text, encoded, fmt), out_file, check=_check_kroki)
+
+
+class EngineRouter:
+    """
+    Routes PlantUML sources to the PlantUML client (server or local engine)
+    and Kroki sources to a per-type KrokiDiagramClient.
+    """
+
+    def __init__(self, plantuml, kroki):
+        self.plantuml = plantuml
+        self.kroki = kroki
+        self.kroki_version = kroki.version()
+        self._views = {}
+
+    def client_for(self, source):
+        kind = diagram_type(source)
+        if kind is None:
+            return self.plantuml
+        if kind not in self._views:
+            self._views[kind] = self.kroki.for_type(kind, self.kroki_version)
+        return self._views[kind]
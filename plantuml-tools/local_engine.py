@@ -0,0 +1,269 @@
+"""
+Local render engine: pool of PlantUML JVMs in pipe mode
+Keeps long-lived `java -jar plantuml.jar -pipe` processes (one output
+format each) and feeds diagrams over stdin, reading images back up to a
+delimiter line. Rendering needs neither the backend nor URL encoding.
+With the same plantuml.jar version as the server image the output bytes
+are identical, so both engines share the render cache.
+Drop-in replacement for RenderClient in render_job/run_jobs.
+"""
+
+import collections
+import os
+import select
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import plantuml_codec
+from render_cache import temp_file_for
+from render_client import RenderError, TransientRenderError
+
+PLANTUML_JAR = os.getenv('PLANTUML_JAR', '/opt/plantuml/plantuml.jar')
+PLANTUML_JAVA = os.getenv('PLANTUML_JAVA', 'java')
+# Jede JVM braucht einige hundert MB: Standard höchstens 4 Prozesse
+LOCAL_WORKERS = int(os.getenv('PLANTUML_LOCAL_WORKERS', str(min(4, os.cpu_count() or 1))))
+LOCAL_JAVA_OPTS = os.getenv('PLANTUML_LOCAL_JAVA_OPTS', '-Xmx1g').split()
+
+# Darf in keinem Bild vorkommen; PlantUML schreibt ihn als eigene Zeile nach jedem Bild
+DELIMITER = '___plantuml-tools-pipe-end-7f3a9c___'
+_MARKER = DELIMITER.encode('ascii') + b'\n'
+
+
+def first_diagram(text):
+    """
+    Only the first @start…@end block, like the server renders image index 0
+    (a second block would produce a second image and desync the pipe).
+    Text without @start is wrapped the way the server does it.
+    """
+    lines = text.replace('\r\n', '\n').split('\n')
+    start = next((i for i, line in enumerate(lines) if line.strip().startswith('@start')), None)
+    if start is None:
+        return '@startuml\n' + text.rstrip('\n') + '\n@enduml\n'
+    end = next((i for i in range(start, len(lines)) if lines[i].strip().startswith('@end')), None)
+    block = lines[start:end + 1] if end is not None else lines[start:] + ['@enduml']
+    return '\n'.join(block) + '\n'
+
+
+class PipeWorker:
+    """One `plantuml -pipe -t<format>` process"""
+
+    def __init__(self, command, fmt):
+        self.fmt = fmt
+        env = dict(os.environ)
+        # Gleiche Bildgrößen-Grenze wie das Backend (docker-compose.yml)
+        env.setdefault('PLANTUML_LIMIT_SIZE', '8192')
+        self.proc = subprocess.Popen(command + [f'-t{fmt}'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, env=env)
+        self._buffer = bytearray()
+        self.stderr_tail = collections.deque(maxlen=20)
+        threading.Thread(target=self._drain_stderr, daemon=True).start()
+
+    def _drain_stderr(self):
+        # JVM-Warnungen etc. - ohne Leser würde der Prozess bei vollem stderr-Puffer blockieren
+        for line in self.proc.stderr:
+            self.stderr_tail.append(line.decode('utf-8', errors='replace').rstrip())
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    def render(self, text, timeout):
+        self.proc.stdin.write(text.encode('utf-8'))
+        self.proc.stdin.flush()
+        return self._read_until_marker(timeout)
+
+    def _read_until_marker(self, timeout):
+        deadline = time.monotonic() + timeout
+        fd = self.proc.stdout.fileno()
+        searched = 0
+        while True:
+            pos = self._buffer.find(_MARKER, searched)
+            if pos >= 0:
+                data = bytes(self._buffer[:pos])
+                del self._buffer[:pos + len(_MARKER)]
+                return data
+            searched = max(0, len(self._buffer) - len(_MARKER))
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"no output after {timeout:.0f}s")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if ready:
+                chunk = os.read(fd, 64 * 1024)
+                if not chunk:
+                    raise EOFError('PlantUML process exited')
+                self._buffer += chunk
+
+    def close(self):
+        if self.alive():
+            try:
+                self.proc.stdin.close()
+                self.proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.proc.kill()
+
+
+class LocalEngine:
+    """
+    Pool of up to `workers` PipeWorkers shared by all render threads.
+    Workers are started lazily per format; if all slots are taken by another
+    format, an idle worker is replaced.
+    """
+
+    def __init__(self, workers=LOCAL_WORKERS, jar=PLANTUML_JAR, java=PLANTUML_JAVA, timeout=60,
+                 java_options=LOCAL_JAVA_OPTS):
+        if not Path(jar).is_file():
+            raise RenderError(f"PlantUML jar not found: {jar} (set PLANTUML_JAR)")
+        if shutil.which(java) is None:
+            raise RenderError(f"Java not found: {java} (set PLANTUML_JAVA)")
+        self.base_url = f"local:{Path(jar).resolve()}"
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.command = [java, *java_options, '-Djava.awt.headless=true', '-jar', str(jar),
+                        '-pipe', '-pipedelimitor', DELIMITER, '-pipeNoStderr', '-charset', 'UTF-8']
+        self._idle = []
+        self._running = 0
+        # Gestartete Worker je Format (frei + belegt)
+        self._formats = {}
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self.requests = 0
+        self.errors = 0
+        self.restarts = 0
+        self.seconds = 0.0
+        self.peak = 0
+
+    def _acquire(self, fmt):
+        victim = None
+        with self._cond:
+            while True:
+                for worker in self._idle:
+                    if worker.fmt == fmt:
+                        self._idle.remove(worker)
+                        return worker
+                if self._running < self.workers:
+                    self._running += 1
+                    self.peak = max(self.peak, self._running)
+                    break
+                if self._idle and not self._formats.get(fmt):
+                    # Alle Slots mit anderem Format belegt: ältesten freien Worker ersetzen.
+                    # Läuft schon ein Worker für fmt, lieber auf ihn warten als JVMs neu zu starten.
+                    victim = self._idle.pop(0)
+                    self._formats[victim.fmt] -= 1
+                    break
+                self._cond.wait()
+            self._formats[fmt] = self._formats.get(fmt, 0) + 1
+        if victim is not None:
+            victim.close()
+        try:
+            return PipeWorker(self.command, fmt)
+        except OSError as e:
+            self._discard(None, fmt)
+            raise RenderError(f"Could not start PlantUML: {e}") from e
+
+    def _release(self, worker):
+        with self._cond:
+            self._idle.append(worker)
+            self._cond.notify_all()
+
+    def _discard(self, worker, fmt=None):
+        if worker is not None:
+            worker.proc.kill()
+        with self._cond:
+            self._formats[worker.fmt if worker is not None else fmt] -= 1
+            self._running -= 1
+            self._cond.notify_all()
+
+    def _count(self, requests=0, errors=0, restarts=0, seconds=0.0):
+        # Render-Threads zählen parallel: nur unter dem Pool-Lock
+        with self._cond:
+            self.requests += requests
+            self.errors += errors
+            self.restarts += restarts
+            self.seconds += seconds
+
+    def _render(self, text, fmt):
+        text = first_diagram(text)
+        for attempt in range(2):
+            worker = self._acquire(fmt)
+            start = time.monotonic()
+            try:
+                data = worker.render(text, self.timeout)
+            except TimeoutError as e:
+                self._discard(worker)
+                self._count(errors=1)
+                raise TransientRenderError(f"Local PlantUML timed out: {e}") from e
+            except (EOFError, OSError) as e:
+                # Prozess abgestürzt (z.B. OOM): einmal mit frischem Worker wiederholen
+                self._discard(worker)
+                self._count(restarts=1, errors=1 if attempt else 0)
+                if attempt:
+                    detail = '; '.join(list(worker.stderr_tail)[-3:])
+                    raise RenderError(f"Local PlantUML failed: {e}{': ' + detail if detail else ''}") from e
+                continue
+            elapsed = time.monotonic() - start
+            self._release(worker)
+            self._count(requests=1, seconds=elapsed)
+            self._local.seconds = elapsed
+            if data.startswith(b'ERROR\n'):
+                # -pipeNoStderr: "ERROR", Zeilennummer, Meldung, danach das Fehlerbild (Server: HTTP 400)
+                _, line, message = (data.split(b'\n', 3) + [b'', b''])[:3]
+                self._count(errors=1)
+                raise RenderError(f"400: syntax error in line {line.decode(errors='replace')}: "
+                                  f"{message.decode(errors='replace')}", 400)
+            return data
+
+    @property
+    def last_seconds(self):
+        return getattr(self._local, 'seconds', None)
+
+    def render_encoded(self, encoded, fmt):
+        return self._render(plantuml_codec.decode(encoded), fmt)
+
+    def render_text(self, text, fmt, encoded=None):
+        return self._render(text, fmt)
+
+    def render_to_temp(self, text, encoded, fmt, out_file):
+        data = self._render(text, fmt)
+        f, tmp = temp_file_for(out_file)
+        try:
+            with f:
+                f.write(data)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return tmp
+
+    def stats(self):
+        """Same shape as RenderClient.stats() so batch can print either"""
+        backend = {
+            'url': self.base_url,
+            'healthy': True,
+            'requests': self.requests,
+            'errors': self.errors,
+            'avg_ms': round(self.seconds / self.requests * 1000, 1) if self.requests else None,
+            'limit': self.workers,
+            'peak_limit': self.peak,
+            'ejections': 0,
+        }
+        return {
+            'limit': self.workers,
+            'peak_limit': self.peak,
+            'decreases': 0,
+            'retries': self.restarts,
+            'outages': 0,
+            'backends': [backend],
+        }
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
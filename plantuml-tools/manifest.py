@@ -0,0 +1,76 @@
+"""
+Incremental build manifest
+Stored next to the batch outputs. Records per diagram the hash of its own
+text, the hashes of all transitive local includes and the rendered formats,
+so that the next run can skip diagrams where nothing changed.
+"""
+
+import json
+from pathlib import Path
+
+from includes import file_hash
+from render_cache import atomic_write
+
+MANIFEST_NAME = '.plantuml-manifest.json'
+MANIFEST_VERSION = 1
+
+
+class Manifest:
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = {}
+        try:
+            data = json.loads(self.path.read_text())
+            if data.get('version') == MANIFEST_VERSION:
+                self.entries = data.get('files', {})
+        except (FileNotFoundError, ValueError):
+            pass
+
+    @classmethod
+    def for_output_dir(cls, out_dir):
+        return cls(Path(out_dir) / MANIFEST_NAME)
+
+    def save(self):
+        atomic_write(self.path, json.dumps({
+            'version': MANIFEST_VERSION,
+            'files': self.entries,
+        }, indent=2, sort_keys=True).encode('utf-8'))
+
+    def record(self, key, source, deps, targets, hash_of=file_hash):
+        self.entries[key] = {
+            'hash': hash_of(source),
+            'deps': {str(dep): hash_of(dep) for dep in deps if dep.exists()},
+            'outputs': {fmt: str(out_file) for fmt, out_file in targets},
+        }
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+    def rebuild_reason(self, key, source, deps, targets, hash_of=file_hash):
+        """
+        Why source needs a rebuild, or None if all outputs are up to date.
+        hash_of is passed in so one run hashes every shared include only once.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return 'new (not in manifest)'
+        if entry.get('hash') != hash_of(source):
+            return 'source changed'
+        old_deps = entry.get('deps', {})
+        for dep in deps:
+            old = old_deps.get(str(dep))
+            if old is None:
+                return f'include added: {dep.name}'
+            if old != hash_of(dep):
+                return f'include changed: {dep.name}'
+        removed = set(old_deps) - {str(dep) for dep in deps}
+        if removed:
+            return f'include removed: {Path(sorted(removed)[0]).name}'
+        outputs = entry.get('outputs', {})
+        for fmt, out_file in targets:
+            if fmt not in outputs:
+                return f'format {fmt} not rendered yet'
+            if not Path(out_file).exists():
+                return f'output missing: {Path(out_file).name}'
+        return None
@@ -0,0 +1,135 @@
+"""
+Output optimization for rendered diagrams
+SVG: drop comments (except the embedded diagram source), indentation
+between tags and trailing zeros in numeric attribute values.
+PNG: re-deflate the image data at maximum compression; pixels, filters
+and all metadata chunks (including the embedded PlantUML source) stay as
+they are.
+Pure stdlib, runs in a process pool next to the network-bound render
+threads.
+"""
+
+import re
+import struct
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Teil des Cache-Keys: Änderungen an den Regeln invalidieren optimierte Cache-Einträge
+OPTIMIZE_VERSION = 1
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+_COMMENT_RE = re.compile(rb'<!--(.*?)-->', re.S)
+_INDENT_RE = re.compile(rb'>[ \t\r]*\n\s*<')
+_TAG_RE = re.compile(rb'<[A-Za-z][^>]*>')
+# Zahlen in Attributwerten: 12.0 → 12, 12.50 → 12.5 (Textinhalt bleibt unangetastet)
+_ZEROS_RE = re.compile(rb'(?<=[\s,"(])(-?\d+)(?:\.0+|(\.\d*?[1-9])0+)(?=[\s,")]|px)')
+
+
+def _keep_comment(match):
+    # <!--SRC=[...]--> enthält den encodierten Quelltext (PlantUML kann das SVG wieder öffnen)
+    return match.group(0) if match.group(1).startswith(b'SRC=') else b''
+
+
+def minify_svg(data):
+    data = _COMMENT_RE.sub(_keep_comment, data)
+    data = _INDENT_RE.sub(b'><', data)
+    data = _TAG_RE.sub(lambda m: _ZEROS_RE.sub(lambda n: n.group(1) + (n.group(2) or b''), m.group(0)), data)
+    return data.strip() + b'\n'
+
+
+def _png_chunks(data):
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _png_chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff)
+
+
+def recompress_png(data):
+    """Lossless: same scanlines and chunks, only the IDAT stream is deflated again at level 9"""
+    if not data.startswith(PNG_SIGNATURE):
+        return data
+    chunks = list(_png_chunks(data))
+    idat = b''.join(body for kind, body in chunks if kind == b'IDAT')
+    try:
+        raw = zlib.decompress(idat)
+    except zlib.error:
+        return data
+    best = idat
+    for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+        candidate = compressor.compress(raw) + compressor.flush()
+        if len(candidate) < len(best):
+            best = candidate
+    if best is idat:
+        return data
+    out = [PNG_SIGNATURE]
+    for kind, body in chunks:
+        if kind == b'IDAT':
+            if best is not None:
+                # Alle IDAT-Chunks werden zu einem zusammengefasst
+                out.append(_png_chunk(b'IDAT', best))
+                best = None
+            continue
+        out.append(_png_chunk(kind, body))
+    return b''.join(out)
+
+
+OPTIMIZERS = {'svg': minify_svg, 'png': recompress_png}
+
+
+def optimize_file(path, fmt):
+    """Optimize a file in place if that makes it smaller. Returns (bytes before, bytes after)"""
+    path = Path(path)
+    data = path.read_bytes()
+    optimizer = OPTIMIZERS.get(fmt)
+    if optimizer is None:
+        return len(data), len(data)
+    optimized = optimizer(data)
+    if len(optimized) >= len(data):
+        return len(data), len(data)
+    # Nur auf privaten Temp-Dateien aufgerufen, daher direktes Überschreiben
+    path.write_bytes(optimized)
+    return len(data), len(optimized)
+
+
+class Optimizer:
+    """
+    Process pool shared by all render threads: a thread hands over its
+    finished temp file and waits, while the other threads keep the backend busy.
+    """
+
+    def __init__(self, workers=None):
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.files = 0
+        self.before = 0
+        self.after = 0
+        self._lock = threading.Lock()
+
+    def optimize(self, path, fmt):
+        before, after = self.pool.submit(optimize_file, str(path), fmt).result()
+        with self._lock:
+            self.files += 1
+            self.before += before
+            self.after += after
+        return before, after
+
+    @property
+    def saved(self):
+        return self.before - self.after
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
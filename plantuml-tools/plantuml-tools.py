@@ -3,19 +3,58 @@
 PlantUML Tools - Batch processing and encoding utilities
 Usage:
     plantuml-tools encode <file>           # Encode PlantUML file for URL
+    plantuml-tools decode <string|url>     # Decode back to PlantUML source
     plantuml-tools render <file> [--out]   # Render diagram to PNG/SVG
     plantuml-tools batch <dir>             # Render all .puml files in directory
+    plantuml-tools batch <dir> -j 8 -f png -f svg   # Parallel, multiple formats
+    plantuml-tools batch <dir> -i --explain     # Only changed diagrams (incl. !include deps)
+    plantuml-tools batch <dir> --optimize  # Minify SVG / recompress PNG (process pool)
+    plantuml-tools batch <dir> -r --affected-by reverse_proxy   # Only diagrams showing a C4 element
+    plantuml-tools batch <dir> --kroki -f svg   # Also Mermaid/Graphviz/D2/... sources via Kroki
+    plantuml-tools watch <dir> [-r]        # Re-render on save (debounced)
+    plantuml-tools batch <dir> --engine local   # Offline via pooled PlantUML -pipe JVMs (PLANTUML_JAR)
+    plantuml-tools index [-d dir] show <element>|search <text>   # C4 element index
+    plantuml-tools vendor [paths] [--update]    # Pin remote !include URLs locally
+    plantuml-tools bench [-c dir] [-n 1 -n 8] [--stub]   # Latency/throughput report (JSON)
+    plantuml-tools warmup [--wait 120] [-c dir]   # Warm the backend JVM until latency settles
+    plantuml-tools cache stats|prune       # Inspect / evict the render cache
+    plantuml-tools report [--top 20]       # Slowest diagrams + render-time regressions
 """
 
+import functools
+import json
 import sys
+import threading
+import time
 import click
 import requests
 from pathlib import Path
-from plantuml import PlantUML, deflate_and_encode
+from concurrent.futures import ThreadPoolExecutor
+import plantuml_codec
+from bench import build_corpus, run_bench
+from c4index import C4Index
+from history import RenderHistory
+from includes import IncludeGraph, file_hash
+from kroki import KROKI_TYPES, KROKI_URLS, EngineRouter, KrokiClient, diagram_type, supported_formats
+from local_engine import LOCAL_WORKERS, LocalEngine
+from manifest import Manifest
+from optimize import Optimizer
+from render_cache import RenderCache, VERSION_PROBE
+from render_client import RenderCancelled, RenderClient, RenderError, describe_results, render_job, run_jobs
+from stub_backend import StubBackend
+from vendor import INCLUDE_MODE, INCLUDE_MODES, VendorError, VendorStore
+from warmup import default_corpus, run_warmup, wait_ready
+from watcher import Debouncer, Watcher
 
 # PlantUML Server URL (from environment or default)
 import os
 PLANTUML_URL = os.getenv('PLANTUML_URL', 'http://empc4_plantuml_backend:8080')
+# Mehrere Backends (Replicas) kommagetrennt: http://plantuml-1:8080,http://plantuml-2:8080
+PLANTUML_URLS = [url.strip().rstrip('/') for url in PLANTUML_URL.split(',') if url.strip()]
+BACKEND_URLS = [f"{url}/uml" for url in PLANTUML_URLS]
+# server: HTTP-Backend(s), local: eigener Pool von PlantUML-JVMs im -pipe-Modus (PLANTUML_JAR)
+ENGINES = ('server', 'local')
+ENGINE = os.getenv('PLANTUML_ENGINE', 'server')
 
 
 @click.group()
@@ -28,11 +67,10 @@ def cli():
 @click.argument('file', type=click.Path(exists=True))
 def encode(file):
     """Encode a PlantUML file for URL usage"""
-    content = Path(file).read_text()
-    encoded = deflate_and_encode(content)
+    encoded = plantuml_codec.encode_file(file)
     
     # PlantUML läuft auf /uml/ Context
-    base_url = f"{PLANTUML_URL}/uml"
+    base_url = BACKEND_URLS[0]
     
     click.echo(f"\nEncoded string:")
     click.echo(encoded)
@@ -42,17 +80,54 @@ def encode(file):
     click.echo(f"{base_url}/svg/{encoded}")
 
 
+def _open_client(engine, jobs=1, flow_control=True):
+    """RenderClient for the backend(s) or LocalEngine - both render the same bytes"""
+    if engine == 'local':
+        try:
+            return LocalEngine(workers=min(jobs, LOCAL_WORKERS))
+        except RenderError as e:
+            click.echo(f"✗ {e}", err=True)
+            sys.exit(1)
+    return RenderClient(BACKEND_URLS, pool_size=jobs, flow_control=flow_control)
+
+
+def _open_cache(client, no_cache):
+    """Returns (cache, backend_version) or (None, None) when caching is disabled"""
+    if no_cache:
+        return None, None
+    cache = RenderCache()
+    return cache, cache.backend_version(client, plantuml_codec.encode(VERSION_PROBE))
+
+
+@cli.command()
+@click.argument('encoded')
+@click.option('--out', '-o', type=click.Path(), help='Write the decoded source to a file instead of stdout')
+def decode(encoded, out):
+    """Decode an encoded string or PlantUML URL back to source"""
+    try:
+        text = plantuml_codec.decode(encoded)
+    except plantuml_codec.DecodeError as e:
+        click.echo(f"✗ {e}", err=True)
+        sys.exit(1)
+    
+    if out:
+        Path(out).write_text(text)
+        click.echo(f"✓ Decoded source written to {out}")
+    else:
+        click.echo(text)
+
+
 @cli.command()
 @click.argument('file', type=click.Path(exists=True))
 @click.option('--format', '-f', default='png', type=click.Choice(['png', 'svg', 'txt']), help='Output format')
 @click.option('--out', '-o', type=click.Path(), help='Output file (default: same name with new extension)')
-def render(file, format, out):
+@click.option('--no-cache', is_flag=True, help='Always render via backend, bypass the render cache')
+@click.option('--includes', 'include_mode', default=INCLUDE_MODE, show_default=True, type=click.Choice(INCLUDE_MODES), help='How vendored remote !include URLs are resolved')
+@click.option('--optimize', is_flag=True, help='Minify SVG / losslessly recompress PNG before writing')
+@click.option('--engine', default=ENGINE, show_default=True, type=click.Choice(ENGINES), help='Render via the PlantUML server or local pipe-mode JVMs')
+def render(file, format, out, no_cache, include_mode, optimize, engine):
     """Render a PlantUML diagram"""
     file_path = Path(file)
-    content = file_path.read_text()
-    
-    # Create PlantUML instance with /uml base path
-    plantuml = PlantUML(url=f"{PLANTUML_URL}/uml")
     
     # Determine output filename
     if not out:
@@ -62,29 +137,76 @@ def render(file, format, out):
     
     click.echo(f"Rendering {file_path.name} → {out.name} ({format})...")
     
+    optimizer = Optimizer(workers=1) if optimize else None
     try:
-        # Render diagram
-        if format == 'txt':
-            result = plantuml.get_url(content).replace('/png/', '/txt/')
-            response = requests.get(result)
-            out.write_text(response.text)
-        else:
-            result = plantuml.processes_file(str(file_path), outfile=str(out))
+        with _open_client(engine) as client:
+            cache, backend_version = _open_cache(client, no_cache)
+            results = render_job(client, file_path, [(format, out)], cache=cache, backend_version=backend_version,
+                                 vendor=VendorStore(), include_mode=include_mode, optimizer=optimizer)
             
-        click.echo(f"✓ Successfully rendered: {out}")
+        click.echo(f"✓ Successfully rendered: {out}{describe_results(results)}")
         
     except Exception as e:
         click.echo(f"✗ Error rendering: {e}", err=True)
         sys.exit(1)
+    finally:
+        if optimizer is not None:
+            optimizer.close()
+
+
+def _open_index(directory):
+    """C4 index of a directory, brought up to date (only changed files are parsed)"""
+    c4 = C4Index(directory)
+    parsed, removed = c4.update()
+    if parsed or removed or not c4.path.exists():
+        c4.save()
+    return c4
+
+
+def _deps_for(puml_file, graph, vendor_store, include_mode):
+    """Local includes plus the vendor lock file if the diagram uses pinned remote includes"""
+    deps = graph.deps(puml_file)
+    if include_mode != 'off' and vendor_store.pin_digest(puml_file.read_text()):
+        deps.append(vendor_store.lock_path.resolve())
+    return deps
+
+
+def _record_history(history, puml_file, targets, results, error):
+    """Backend renders go into the history; cache hits cost nothing and are left out"""
+    if error is not None:
+        status = getattr(error, 'status', None) or 'error'
+        for fmt, _ in targets:
+            history.record(puml_file, fmt, None, None, status)
+        return
+    for result in results:
+        if not result.cached:
+            history.record(puml_file, result.fmt, result.seconds, result.size, 200)
+
+
+def _targets_for(puml_file, dir_path, out_dir, formats):
+    """Output paths (one per format) for a diagram below dir_path"""
+    rel_path = puml_file.relative_to(dir_path)
+    return [(fmt, out_dir / rel_path.with_suffix(f'.{fmt}')) for fmt in formats]
 
 
 @cli.command()
 @click.argument('directory', type=click.Path(exists=True))
-@click.option('--format', '-f', default='png', type=click.Choice(['png', 'svg']), help='Output format')
+@click.option('--format', '-f', 'formats', default=['png'], multiple=True, type=click.Choice(['png', 'svg', 'txt']), help='Output format (repeatable: -f png -f svg)')
 @click.option('--out-dir', '-o', type=click.Path(), help='Output directory (default: same as input)')
 @click.option('--recursive', '-r', is_flag=True, help='Process subdirectories')
-def batch(directory, format, out_dir, recursive):
-    """Render all .puml files in a directory"""
+@click.option('--jobs', '-j', default=8, show_default=True, type=click.IntRange(min=1), help='Parallel render workers (upper bound, in-flight requests adapt to the backend)')
+@click.option('--fixed-jobs', is_flag=True, help='Keep exactly --jobs requests in flight instead of adapting to latency/errors')
+@click.option('--no-cache', is_flag=True, help='Always render via backend, bypass the render cache')
+@click.option('--incremental', '-i', is_flag=True, help='Only re-render diagrams whose text or (transitive) includes changed')
+@click.option('--explain', is_flag=True, help='With --incremental: print why each file is (not) rebuilt')
+@click.option('--includes', 'include_mode', default=INCLUDE_MODE, show_default=True, type=click.Choice(INCLUDE_MODES), help='How vendored remote !include URLs are resolved')
+@click.option('--optimize', is_flag=True, help='Minify SVG / losslessly recompress PNG in a process pool while rendering')
+@click.option('--affected-by', 'affected_by', multiple=True, metavar='ELEMENT', help='Only diagrams that show this C4 element id (repeatable, uses the C4 index)')
+@click.option('--engine', default=ENGINE, show_default=True, type=click.Choice(ENGINES), help='Render via the PlantUML server or local pipe-mode JVMs')
+@click.option('--kroki', is_flag=True, help=f"Also render {', '.join(sorted(KROKI_TYPES))} sources via Kroki (KROKI_URL)")
+def batch(directory, formats, out_dir, recursive, jobs, fixed_jobs, no_cache, incremental, explain, include_mode, optimize,
+          affected_by=(), engine=ENGINE, kroki=False):
+    """Render all .puml files (and with --kroki Mermaid/Graphviz/... sources) in a directory"""
     dir_path = Path(directory)
     
     if not out_dir:
@@ -95,60 +217,537 @@ def batch(directory, format, out_dir, recursive):
     
     # Find all .puml files
     pattern = '**/*.puml' if recursive else '*.puml'
-    puml_files = list(dir_path.glob(pattern))
+    puml_files = sorted(dir_path.glob(pattern))
+    if kroki:
+        # Mermaid, Graphviz & Co. laufen im selben Worker-Pool über das Kroki-Backend
+        puml_files = sorted(puml_files + [f for f in dir_path.glob('**/*' if recursive else '*')
+                                          if diagram_type(f) is not None and f.is_file()])
     
     if not puml_files:
         click.echo(f"No .puml files found in {directory}")
         return
     
-    click.echo(f"Found {len(puml_files)} PlantUML file(s)")
+    if affected_by:
+        c4 = _open_index(dir_path)
+        involved = set()
+        for element in affected_by:
+            diagrams = c4.diagrams_for(element)
+            if not diagrams:
+                click.echo(f"  ⚠ Element '{element}' is not used in any diagram below {dir_path}")
+            involved.update(diagrams)
+        puml_files = [f for f in puml_files if c4.key(f) in involved]
+        click.echo(f"Affected by {', '.join(affected_by)}: {len(puml_files)} diagram(s)")
+        if not puml_files:
+            return
+    
+    # -f png -f png soll nicht doppelt rendern
+    formats = list(dict.fromkeys(formats))
+    kroki_sources = sum(1 for f in puml_files if diagram_type(f) is not None)
+    found = f"{len(puml_files) - kroki_sources} PlantUML + {kroki_sources} Kroki" if kroki_sources else f"{len(puml_files)} PlantUML"
+    click.echo(f"Found {found} file(s), formats: {', '.join(formats)}, jobs: {jobs}")
+    
+    render_jobs = []
+    for puml_file in puml_files:
+        kind = diagram_type(puml_file)
+        file_formats = formats if kind is None else [fmt for fmt in formats if fmt in supported_formats(kind)]
+        if not file_formats:
+            click.echo(f"  ⚠ {puml_file.name}: Kroki renders {kind} only as {', '.join(supported_formats(kind))}, skipped")
+            continue
+        render_jobs.append((puml_file, _targets_for(puml_file, dir_path, out_dir, file_formats)))
+    kroki_files = sum(1 for puml_file, _ in render_jobs if diagram_type(puml_file) is not None)
+    
+    vendor_store = VendorStore()
+    reasons = {}
+    if incremental:
+        graph = IncludeGraph.build(puml_files)
+        manifest = Manifest.for_output_dir(out_dir)
+        hash_of = functools.lru_cache(maxsize=None)(file_hash)
+        pending = []
+        for puml_file, targets in render_jobs:
+            key = str(puml_file.relative_to(dir_path))
+            deps = _deps_for(puml_file, graph, vendor_store, include_mode)
+            reason = manifest.rebuild_reason(key, puml_file, deps, targets, hash_of=hash_of)
+            if reason is None:
+                if explain:
+                    click.echo(f"  {puml_file.name}: up to date")
+                continue
+            reasons[puml_file] = reason
+            pending.append((puml_file, targets))
+        click.echo(f"Incremental: {len(pending)} to rebuild, {len(render_jobs) - len(pending)} up to date")
+        render_jobs = pending
+        if not render_jobs:
+            return
     
-    plantuml = PlantUML(url=f"{PLANTUML_URL}/uml")
     success = 0
     failed = 0
+    # Jobs, die das Backend erreicht haben (nicht nur Cache-Treffer) - nur dann lief der Limiter
+    backend_jobs = 0
+    history = RenderHistory()
+    # Teuerste Diagramme zuerst starten, damit kein großes Landscape-Diagramm die Laufzeit am Ende verlängert
+    order = history.cost_order(render_jobs) if jobs > 1 and len(render_jobs) > 1 else None
     
-    for puml_file in puml_files:
-        try:
-            # Determine output path
-            rel_path = puml_file.relative_to(dir_path)
-            out_file = out_dir / rel_path.with_suffix(f'.{format}')
-            out_file.parent.mkdir(parents=True, exist_ok=True)
-            
-            click.echo(f"  {puml_file.name} → {out_file.name}...", nl=False)
-            
-            # Render
-            plantuml.processes_file(str(puml_file), outfile=str(out_file))
-            
-            click.echo(" ✓")
-            success += 1
-            
-        except Exception as e:
-            click.echo(f" ✗ Error: {e}")
-            failed += 1
+    optimizer = Optimizer() if optimize else None
+    kroki_client = KrokiClient(KROKI_URLS, pool_size=jobs, flow_control=not fixed_jobs) if kroki_files else None
+    with _open_client(engine, jobs, flow_control=not fixed_jobs) as client:
+        cache, backend_version = _open_cache(client, no_cache)
+        targets_by_file = dict(render_jobs)
+        router = EngineRouter(client, kroki_client) if kroki_client is not None else client
+        for puml_file, results, error in run_jobs(router, render_jobs, workers=jobs, order=order,
+                                                   cache=cache, backend_version=backend_version,
+                                                   vendor=vendor_store, include_mode=include_mode,
+                                                   optimizer=optimizer):
+            targets = targets_by_file[puml_file]
+            _record_history(history, puml_file, targets, results, error)
+            outputs = ', '.join(out_file.name for _, out_file in targets)
+            why = f" [{reasons[puml_file]}]" if explain and puml_file in reasons else ''
+            if error is not None or any(not result.cached for result in results):
+                backend_jobs += 1
+            if error is None:
+                click.echo(f"  {puml_file.name} → {outputs} ✓{describe_results(results)}{why}")
+                success += 1
+                if incremental:
+                    manifest.record(str(puml_file.relative_to(dir_path)), puml_file,
+                                    _deps_for(puml_file, graph, vendor_store, include_mode), targets, hash_of=hash_of)
+            else:
+                click.echo(f"  {puml_file.name} → {outputs} ✗ Error: {error}{why}")
+                failed += 1
+                if incremental:
+                    manifest.forget(str(puml_file.relative_to(dir_path)))
+    
+    history.flush()
+    if kroki_client is not None:
+        kroki_client.close()
+    if optimizer is not None:
+        optimizer.close()
+    if incremental:
+        manifest.save()
     
     click.echo(f"\nCompleted: {success} successful, {failed} failed")
+    flow = client.stats()
+    if engine == 'local':
+        click.echo(f"Local engine: {flow['peak_limit']}/{flow['limit']} JVM(s), {flow['retries']} restart(s)")
+    elif not fixed_jobs and jobs > 1 and backend_jobs:
+        click.echo(f"Concurrency: limit {flow['limit']}/{jobs * len(flow['backends'])} (peak {flow['peak_limit']}), "
+                   f"{flow['decreases']} backoff(s)")
+    if engine == 'server' and (flow['retries'] or flow['outages']):
+        click.echo(f"Backend: {flow['retries']} retried request(s), {flow['outages']} outage(s)")
+    if len(flow['backends']) > 1:
+        for backend in flow['backends']:
+            avg = f"{backend['avg_ms']:.0f} ms" if backend['avg_ms'] is not None else '-'
+            state = '✓' if backend['healthy'] else '✗'
+            click.echo(f"  {state} {backend['url']}: {backend['requests']} req, {backend['errors']} err, "
+                       f"avg {avg}, limit {backend['limit']}, {backend['ejections']} ejection(s)")
+    if kroki_client is not None:
+        for backend in kroki_client.stats()['backends']:
+            avg = f"{backend['avg_ms']:.0f} ms" if backend['avg_ms'] is not None else '-'
+            click.echo(f"Kroki: {kroki_files} source(s), {backend['requests']} req, {backend['errors']} err, "
+                       f"avg {avg} ({backend['url']})")
+    if optimizer is not None and optimizer.files:
+        percent = optimizer.saved / optimizer.before * 100 if optimizer.before else 0
+        click.echo(f"Optimized: {optimizer.files} file(s), {optimizer.before / 1024:.1f} KB → "
+                   f"{optimizer.after / 1024:.1f} KB (-{optimizer.saved / 1024:.1f} KB, -{percent:.0f}%)")
+    if cache is not None:
+        click.echo(f"Cache: {cache.hits} hits, {cache.misses} misses")
+        cache.prune()
 
 
 @cli.command()
-def test():
-    """Test connection to PlantUML server"""
-    click.echo(f"Testing connection to {PLANTUML_URL}...")
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('--format', '-f', 'formats', default=['png'], multiple=True, type=click.Choice(['png', 'svg', 'txt']), help='Output format (repeatable: -f png -f svg)')
+@click.option('--out-dir', '-o', type=click.Path(), help='Output directory (default: same as input)')
+@click.option('--recursive', '-r', is_flag=True, help='Render diagrams in subdirectories too')
+@click.option('--jobs', '-j', default=2, show_default=True, type=click.IntRange(min=1), help='Parallel render workers')
+@click.option('--debounce', default=0.3, show_default=True, type=click.FloatRange(min=0), help='Quiet period in seconds before changes are rendered')
+@click.option('--poll', 'force_polling', is_flag=True, help='Use mtime polling instead of inotify (e.g. for network/Docker Desktop mounts)')
+@click.option('--no-cache', is_flag=True, help='Always render via backend, bypass the render cache')
+@click.option('--includes', 'include_mode', default=INCLUDE_MODE, show_default=True, type=click.Choice(INCLUDE_MODES), help='How vendored remote !include URLs are resolved')
+@click.option('--optimize', is_flag=True, help='Minify SVG / losslessly recompress PNG before writing')
+@click.option('--engine', default=ENGINE, show_default=True, type=click.Choice(ENGINES), help='Render via the PlantUML server or local pipe-mode JVMs')
+@click.pass_context
+def watch(ctx, directory, formats, out_dir, recursive, jobs, debounce, force_polling, no_cache, include_mode, optimize,
+          engine):
+    """Re-render changed .puml files and their dependents on every save"""
+    dir_path = Path(directory).resolve()
+    out_dir = Path(out_dir).resolve() if out_dir else dir_path
+    formats = list(dict.fromkeys(formats))
+    
+    # Startzustand über die normale batch-Logik herstellen (nur Geändertes)
+    ctx.invoke(batch, directory=str(dir_path), formats=formats, out_dir=str(out_dir), recursive=recursive,
+               jobs=jobs, fixed_jobs=False, no_cache=no_cache, incremental=True, explain=False, include_mode=include_mode,
+               optimize=optimize, engine=engine)
+    
+    pattern = '**/*.puml' if recursive else '*.puml'
+    graph = IncludeGraph.build(dir_path.glob(pattern))
+    manifest = Manifest.for_output_dir(out_dir)
+    manifest_lock = threading.Lock()
+    vendor_store = VendorStore()
+    history = RenderHistory()
+    generation = {}
+    
+    def is_diagram(path):
+        if path.suffix != '.puml' or not path.is_file():
+            return False
+        return recursive or path.parent == dir_path
+    
+    def submit(puml_file):
+        gen = generation[puml_file] = generation.get(puml_file, 0) + 1
+        targets = _targets_for(puml_file, dir_path, out_dir, formats)
+        stale = lambda: generation.get(puml_file) != gen
+        
+        def _render():
+            try:
+                results = render_job(client, puml_file, targets, cache=cache,
+                                     backend_version=backend_version, cancelled=stale,
+                                     vendor=vendor_store, include_mode=include_mode, optimizer=optimizer)
+            except RenderCancelled:
+                click.echo(f"  {puml_file.name}: superseded by newer edit, skipped")
+                return
+            except Exception as e:
+                click.echo(f"  {puml_file.name} ✗ Error: {e}")
+                _record_history(history, puml_file, targets, [], e)
+                history.flush()
+                with manifest_lock:
+                    manifest.forget(str(puml_file.relative_to(dir_path)))
+                    manifest.save()
+                return
+            outputs = ', '.join(out_file.name for _, out_file in targets)
+            click.echo(f"  {puml_file.name} → {outputs} ✓{describe_results(results)}")
+            _record_history(history, puml_file, targets, results, None)
+            history.flush()
+            with manifest_lock:
+                manifest.record(str(puml_file.relative_to(dir_path)), puml_file,
+                                _deps_for(puml_file, graph, vendor_store, include_mode), targets)
+                manifest.save()
+        
+        pool.submit(_render)
+    
+    watcher = Watcher(dir_path, Debouncer(debounce), force_polling=force_polling)
+    click.echo(f"\nWatching {dir_path} ({watcher.backend}, debounce {debounce}s) - Ctrl+C to stop")
+    
+    with _open_client(engine, jobs) as client, \
+            ThreadPoolExecutor(max_workers=jobs) as pool:
+        optimizer = Optimizer(workers=jobs) if optimize else None
+        cache, backend_version = _open_cache(client, no_cache)
+        watcher.start()
+        try:
+            for changed in watcher.changes():
+                affected = set()
+                for path in changed:
+                    # Kanten der geänderten Datei neu einlesen (Includes können sich geändert haben)
+                    known = path in graph.edges
+                    graph.remove(path)
+                    if known or is_diagram(path):
+                        graph.add(path)
+                    if is_diagram(path):
+                        affected.add(path)
+                    affected.update(dep for dep in graph.dependents(path) if is_diagram(dep))
+                if not affected:
+                    continue
+                click.echo(f"[{time.strftime('%H:%M:%S')}] {len(changed)} change(s) → rendering {len(affected)} diagram(s)")
+                for puml_file in sorted(affected):
+                    submit(puml_file)
+        except KeyboardInterrupt:
+            click.echo("\nStopping watch...")
+        finally:
+            watcher.stop()
+            if optimizer is not None:
+                # Erst nach dem Render-Pool schließen, laufende Renders brauchen ihn noch
+                pool.shutdown(wait=True)
+                optimizer.close()
+
+
+@cli.command()
+@click.argument('paths', nargs=-1, type=click.Path(exists=True))
+@click.option('--update', is_flag=True, help='Re-fetch already pinned URLs and update their pins')
+def vendor(paths, update):
+    """Fetch and pin remote !include URLs into the local vendor cache"""
+    store = VendorStore()
+    files = []
+    for path in (Path(p) for p in (paths or ['.'])):
+        files.extend(sorted(path.rglob('*.puml')) if path.is_dir() else [path])
     
+    urls = list(dict.fromkeys(url for f in files for url in store.remote_targets(f.read_text())))
+    if update:
+        urls = list(dict.fromkeys(urls + list(store.lock)))
+    if not urls:
+        click.echo("No remote !include URLs found")
+        return
+    
+    click.echo(f"Vendoring {len(urls)} remote include(s) into {store.root}...")
+    failed = 0
+    with requests.Session() as session:
+        for url in urls:
+            try:
+                changed = store.fetch(url, session, update=update)
+                note = f" ({len(changed)} file(s) pinned)" if changed else " (pinned, unchanged)"
+                click.echo(f"  ✓ {url}{note}")
+            except VendorError as e:
+                click.echo(f"  ✗ {e}", err=True)
+                failed += 1
+    store.save()
+    
+    click.echo(f"\nLock file: {store.lock_path} ({len(store.lock)} pinned URL(s))")
+    if failed:
+        sys.exit(1)
+
+
+@cli.group(invoke_without_command=True)
+@click.option('--dir', '-d', 'directory', default='.', show_default=True, type=click.Path(exists=True, file_okay=False), help='Root of the indexed diagrams')
+@click.pass_context
+def index(ctx, directory):
+    """C4 element index: elements, relations and the diagrams that show them"""
+    c4 = C4Index(directory)
+    parsed, removed = c4.update()
+    if parsed or removed or not c4.path.exists():
+        c4.save()
+    ctx.obj = c4
+    if ctx.invoked_subcommand is None:
+        elements = c4.elements()
+        relations = sum(len(entry['relations']) for entry in c4.files.values())
+        click.echo(f"✓ {c4.path}: {len(c4.files)} file(s), {len(elements)} element(s), {relations} relation(s) "
+                   f"({parsed} parsed, {removed} removed)")
+
+
+@index.command('show')
+@click.argument('element')
+@click.option('--json', 'as_json', is_flag=True, help='Print as JSON')
+@click.pass_obj
+def index_show(c4, element, as_json):
+    """Labels, diagrams and relations of one element id"""
+    info = c4.element(element)
+    if info is None:
+        click.echo(f"✗ Unknown element: {element}", err=True)
+        matches = c4.search(element)
+        if matches:
+            click.echo(f"  Did you mean: {', '.join(matches[:5])}", err=True)
+        sys.exit(1)
+    if as_json:
+        click.echo(json.dumps(info, indent=2, ensure_ascii=False))
+        return
+    click.echo(f"{element} ({', '.join(info['macros']) or 'only in relations'}): {', '.join(info['labels'])}")
+    click.echo(f"  Declared in: {', '.join(info['declared_in']) or '-'}")
+    click.echo(f"  Diagrams ({len(info['diagrams'])}):")
+    for diagram in info['diagrams']:
+        click.echo(f"    {diagram}")
+    click.echo(f"  Relations ({len(info['relations'])}):")
+    for rel in info['relations']:
+        label = f" \"{rel['label']}\"" if rel['label'] else ''
+        click.echo(f"    {rel['from']} → {rel['to']}{label}  [{rel['file']}]")
+
+
+@index.command('search')
+@click.argument('text')
+@click.pass_obj
+def index_search(c4, text):
+    """Element ids whose id or label contains TEXT"""
+    elements = c4.elements()
+    matches = c4.search(text)
+    for alias in matches:
+        labels = sorted({decl['label'] for _, decl in elements[alias] if decl['label']})
+        click.echo(f"  {alias}: {', '.join(labels)} ({len(c4.diagrams_for(alias))} diagram(s))")
+    if not matches:
+        click.echo(f"No elements matching '{text}'")
+
+
+@cli.group()
+def cache():
+    """Inspect and maintain the local render cache"""
+    pass
+
+
+@cache.command('stats')
+def cache_stats():
+    """Show size and entry count of the render cache"""
+    info = RenderCache().stats()
+    click.echo(f"Cache directory: {info['path']}")
+    click.echo(f"  Entries: {info['entries']}")
+    click.echo(f"  Size:    {info['bytes'] / 1024 / 1024:.1f} MB of {info['max_bytes'] / 1024 / 1024:.0f} MB")
+    if info['oldest'] is not None:
+        click.echo(f"  Oldest:  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['oldest']))}")
+        click.echo(f"  Newest:  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(info['newest']))}")
+
+
+@cache.command('prune')
+@click.option('--max-size', type=click.FloatRange(min=0), help='Target size in MB (default: PLANTUML_CACHE_MAX_MB, 0 clears the cache)')
+def cache_prune(max_size):
+    """Evict least recently used entries until the cache fits its size cap"""
+    render_cache = RenderCache()
+    max_bytes = None if max_size is None else int(max_size * 1024 * 1024)
+    removed, freed = render_cache.prune(max_bytes)
+    click.echo(f"✓ Removed {removed} entries, freed {freed / 1024 / 1024:.1f} MB")
+
+
+@cli.command()
+@click.option('--top', default=10, show_default=True, type=click.IntRange(min=1), help='Number of slowest diagrams to list')
+@click.option('--threshold', default=1.5, show_default=True, type=click.FloatRange(min=1), help='Flag a regression when the latest render took this many times the earlier median')
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON')
+@click.option('--fail-on-regression', is_flag=True, help='Exit with status 1 if regressions were found (CI)')
+def report(top, threshold, as_json, fail_on_regression):
+    """Slowest diagrams and render-time regressions from the render history"""
+    history = RenderHistory()
+    summary = history.summary(top=top, threshold=threshold)
+    if as_json:
+        click.echo(json.dumps(summary, indent=2))
+    elif not summary['slowest'] and not summary['failing']:
+        click.echo(f"No render history yet ({history.path})")
+    else:
+        click.echo(f"Slowest diagrams (median of recent renders, {history.path}):")
+        for row in summary['slowest']:
+            size = f"{row['bytes'] / 1024:.1f} KB" if row['bytes'] is not None else '-'
+            click.echo(f"  {row['median_s']:7.2f}s  {row['format']:<4} {row['diagram']}  ({size}, {row['runs']} run(s))")
+        click.echo(f"\nRegressions (latest vs. earlier median, threshold {threshold}x):")
+        if not summary['regressions']:
+            click.echo("  ✓ none")
+        for row in summary['regressions']:
+            click.echo(f"  ✗ {row['diagram']} [{row['format']}]: {row['baseline_s']:.2f}s → {row['latest_s']:.2f}s ({row['factor']}x)")
+        if summary['failing']:
+            click.echo("\nFailing on last run:")
+            for row in summary['failing']:
+                click.echo(f"  ✗ {row['diagram']} [{row['format']}]: {row['status']}")
+    if fail_on_regression and summary['regressions']:
+        sys.exit(1)
+
+
+@cli.command()
+@click.option('--corpus', '-c', 'corpus_paths', multiple=True, type=click.Path(exists=True), help='.puml file or directory to replay (repeatable)')
+@click.option('--synthetic', default='10,50,200', show_default=True, help='Comma separated sizes (elements) of synthetic diagrams, empty for none')
+@click.option('--concurrency', '-n', 'levels', default=[1, 4, 8], multiple=True, type=click.IntRange(min=1), show_default=True, help='Concurrency level (repeatable)')
+@click.option('--rounds', default=3, show_default=True, type=click.IntRange(min=1), help='How often the corpus is replayed per level')
+@click.option('--format', '-f', 'fmt', default='svg', type=click.Choice(['png', 'svg', 'txt']), help='Output format to request')
+@click.option('--out', '-o', type=click.Path(), help='Write the JSON report to a file')
+@click.option('--json', 'as_json', is_flag=True, help='Print only the JSON report')
+@click.option('--stub', is_flag=True, help='Run against a local stub backend (offline, for CI/tests)')
+def bench(corpus_paths, synthetic, levels, rounds, fmt, out, as_json, stub):
+    """Measure backend throughput and latency percentiles"""
+    sizes = [int(n) for n in synthetic.split(',') if n.strip()]
+    corpus = build_corpus(corpus_paths, sizes)
+    if not corpus:
+        click.echo("✗ Empty corpus: pass --corpus and/or --synthetic", err=True)
+        sys.exit(1)
+    levels = sorted(set(levels))
+    
+    stub_backend = StubBackend().start() if stub else None
+    base_url = f"{stub_backend.url}/uml" if stub else ','.join(BACKEND_URLS)
     try:
-        # PlantUML läuft auf /uml/ Context, teste mit einem einfachen Diagramm
-        # Nutze den /uml/png/ Endpoint mit einem minimalen encoded Diagramm
-        test_url = f"{PLANTUML_URL}/uml/png/SyfFKj2rKt3CoKnELR1Io4ZDoSa70000"
-        response = requests.get(test_url, timeout=5)
-        if response.status_code == 200:
-            click.echo("✓ PlantUML server is reachable")
-            click.echo(f"  Status: {response.status_code}")
-            click.echo(f"  Content-Type: {response.headers.get('Content-Type')}")
-            click.echo(f"  Image size: {len(response.content)} bytes")
+        if not as_json:
+            click.echo(f"Benchmarking {base_url}: {len(corpus)} diagram(s) × {rounds} round(s), concurrency {levels}")
+        report = run_bench(base_url, corpus, levels, rounds=rounds, fmt=fmt)
+    finally:
+        if stub_backend is not None:
+            stub_backend.stop()
+    
+    report_json = json.dumps(report, indent=2)
+    if out:
+        Path(out).write_text(report_json + '\n')
+    if as_json:
+        click.echo(report_json)
+        return
+    
+    click.echo(f"\n{'Conc':>5} {'Req':>6} {'Err%':>6} {'RPS':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for level in report['levels']:
+        lat = level['latency_ms'] or {'p50': '-', 'p95': '-', 'p99': '-'}
+        click.echo(f"{level['concurrency']:>5} {level['requests']:>6} {level['error_rate'] * 100:>5.1f}% "
+                   f"{level['throughput_rps'] or 0:>8} {lat['p50']:>9} {lat['p95']:>9} {lat['p99']:>9}")
+    if out:
+        click.echo(f"\n✓ Report written to {out}")
+
+
+@cli.command()
+@click.option('--corpus', '-c', 'corpus_paths', multiple=True, type=click.Path(exists=True), help='Additional .puml file or directory to replay (repeatable)')
+@click.option('--format', '-f', 'formats', default=['png', 'svg'], multiple=True, type=click.Choice(['png', 'svg', 'txt']), show_default=True, help='Formats to render (repeatable)')
+@click.option('--concurrency', '-n', default=2, show_default=True, type=click.IntRange(min=1), help='Parallel requests per round')
+@click.option('--tolerance', default=0.1, show_default=True, type=click.FloatRange(min=0), help='Max. relative change of the round p50 that counts as settled')
+@click.option('--stable', default=2, show_default=True, type=click.IntRange(min=1), help='Settled rounds in a row required')
+@click.option('--max-rounds', default=20, show_default=True, type=click.IntRange(min=1))
+@click.option('--timeout', default=300, show_default=True, type=click.FloatRange(min=0), help='Give up after this many seconds per backend')
+@click.option('--wait', 'wait', default=0, show_default=True, type=click.FloatRange(min=0), help='Wait up to this many seconds for the backend to come up first')
+@click.option('--out', '-o', type=click.Path(), help='Write the JSON report to a file')
+@click.option('--json', 'as_json', is_flag=True, help='Print only the JSON report')
+def warmup(corpus_paths, formats, concurrency, tolerance, stable, max_rounds, timeout, wait, out, as_json):
+    """Warm up the backend JVM(s) until render latency settles (exit 1 if it does not)"""
+    corpus = default_corpus() + build_corpus(corpus_paths)
+    formats = list(dict.fromkeys(formats))
+    reports = []
+    ok = True
+    for base_url in BACKEND_URLS:
+        echo = (lambda *a, **k: None) if as_json else click.echo
+        if wait:
+            waited = wait_ready(base_url, wait)
+            if waited is None:
+                echo(f"✗ {base_url} not reachable after {wait:.0f}s", err=True)
+                reports.append({'backend': base_url, 'settled': False, 'error': 'unreachable'})
+                ok = False
+                continue
+            echo(f"{base_url} is up after {waited:.1f}s")
+        echo(f"Warming up {base_url}: {len(corpus)} diagram(s) × {', '.join(formats)}, concurrency {concurrency}")
+
+        def show(entry):
+            latency = entry['latency_ms']
+            if latency is None:
+                echo(f"  round {entry['round']:>2}: all {entry['requests']} request(s) failed: {', '.join(entry['error_types'])}")
+                return
+            change = f", Δ {entry['change'] * 100:.0f}%" if entry.get('change') is not None else ''
+            errors = f", {entry['errors']} error(s)" if entry['errors'] else ''
+            echo(f"  round {entry['round']:>2}: p50 {latency['p50']:8.1f} ms  p95 {latency['p95']:8.1f} ms{change}{errors}")
+
+        report = run_warmup(base_url, corpus, formats, concurrency=concurrency, tolerance=tolerance, stable=stable,
+                            max_rounds=max_rounds, timeout=timeout, on_round=show)
+        reports.append(report)
+        if report['settled'] and not report['curve'][-1]['errors']:
+            echo(f"✓ Warm after {report['settled_after_rounds']} round(s) ({report['duration_s']:.1f}s): "
+                 f"p50 {report['cold_p50_ms']:.1f} → {report['warm_p50_ms']:.1f} ms ({report['speedup']}x)")
         else:
-            click.echo(f"✗ Server returned status {response.status_code}", err=True)
-            sys.exit(1)
-    except Exception as e:
-        click.echo(f"✗ Connection failed: {e}", err=True)
+            echo(f"✗ Latency did not settle within {len(report['curve'])} round(s)", err=True)
+            ok = False
+    result = {'backends': reports, 'ready': ok}
+    if out:
+        Path(out).write_text(json.dumps(result, indent=2) + '\n')
+    if as_json:
+        click.echo(json.dumps(result, indent=2))
+    if not ok:
+        sys.exit(1)
+
+
+@cli.command('stub-server')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', default=8080, show_default=True, type=int)
+@click.option('--latency-ms', default=2.0, show_default=True, type=float, help='Base latency per request')
+@click.option('--latency-per-kb-ms', default=0.2, show_default=True, type=float, help='Additional latency per KB of source')
+@click.option('--error-rate', default=0.0, show_default=True, type=click.FloatRange(0, 1), help='Fraction of requests answered with 503')
+def stub_server(host, port, latency_ms, latency_per_kb_ms, error_rate):
+    """Run a local stub of the PlantUML server API (offline tests)"""
+    stub_backend = StubBackend(host, port, latency_ms, latency_per_kb_ms, error_rate).start()
+    click.echo(f"PlantUML stub backend on {stub_backend.url}/uml (Kroki API on {stub_backend.url}) - Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub_backend.stop()
+
+
+@cli.command()
+def test():
+    """Test connection to PlantUML server(s)"""
+    failed = False
+    for server_url in PLANTUML_URLS:
+        click.echo(f"Testing connection to {server_url}...")
+        try:
+            # PlantUML läuft auf /uml/ Context, teste mit einem einfachen Diagramm
+            # Nutze den /uml/png/ Endpoint mit einem minimalen encoded Diagramm
+            test_url = f"{server_url}/uml/png/SyfFKj2rKt3CoKnELR1Io4ZDoSa70000"
+            response = requests.get(test_url, timeout=5)
+            if response.status_code == 200:
+                click.echo("✓ PlantUML server is reachable")
+                click.echo(f"  Status: {response.status_code}")
+                click.echo(f"  Content-Type: {response.headers.get('Content-Type')}")
+                click.echo(f"  Image size: {len(response.content)} bytes")
+            else:
+                click.echo(f"✗ Server returned status {response.status_code}", err=True)
+                failed = True
+        except Exception as e:
+            click.echo(f"✗ Connection failed: {e}", err=True)
+            failed = True
+    if failed:
         sys.exit(1)
 
 
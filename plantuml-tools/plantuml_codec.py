@@ -0,0 +1,91 @@
+"""
+PlantUML text encoding (deflate + PlantUML base64) without dependencies
+Produces byte-identical strings to plantuml.deflate_and_encode, but uses a
+raw-deflate compressor (wbits=-15) instead of slicing the zlib header and
+checksum off, and a translation table built once at import time.
+Also provides the matching decode().
+"""
+
+import base64
+import string
+import zlib
+
+PLANTUML_ALPHABET = string.digits + string.ascii_uppercase + string.ascii_lowercase + '-_'
+BASE64_ALPHABET = string.ascii_uppercase + string.ascii_lowercase + string.digits + '+/'
+
+# Vorberechnete Übersetzungstabellen (einmal pro Prozess)
+_TO_PLANTUML = bytes.maketrans(BASE64_ALPHABET.encode('ascii'), PLANTUML_ALPHABET.encode('ascii'))
+_FROM_PLANTUML = bytes.maketrans(PLANTUML_ALPHABET.encode('ascii'), BASE64_ALPHABET.encode('ascii'))
+
+# Gleiches Level wie zlib.compress() in der plantuml Library → identische Ausgabe
+COMPRESS_LEVEL = zlib.Z_DEFAULT_COMPRESSION
+
+
+class DecodeError(ValueError):
+    """String is not a valid PlantUML encoding."""
+    pass
+
+
+def iter_encode(chunks, level=COMPRESS_LEVEL):
+    """
+    Streaming encoder: takes an iterable of str/bytes chunks and yields
+    encoded string pieces. Deflate runs incrementally; base64 is emitted
+    in multiples of 3 input bytes so pieces concatenate to encode(text).
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    pending = b''
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        pending += compressor.compress(chunk)
+        cut = len(pending) - len(pending) % 3
+        if cut:
+            yield base64.b64encode(pending[:cut]).translate(_TO_PLANTUML).decode('ascii')
+            pending = pending[cut:]
+    pending += compressor.flush()
+    if pending:
+        yield base64.b64encode(pending).translate(_TO_PLANTUML).decode('ascii')
+
+
+def encode(text, level=COMPRESS_LEVEL):
+    """Encode PlantUML source for /uml/<format>/<encoded> URLs"""
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    data = compressor.compress(text) + compressor.flush()
+    return base64.b64encode(data).translate(_TO_PLANTUML).decode('ascii')
+
+
+def encode_file(path, chunk_size=64 * 1024):
+    """
+    Encode a file without reading it into memory at once. Text mode like
+    Path.read_text(), so CRLF files encode the same as encode(read_text()).
+    """
+    with open(path, encoding='utf-8') as f:
+        return ''.join(iter_encode(iter(lambda: f.read(chunk_size), '')))
+
+
+def decode(encoded):
+    """
+    Decode a PlantUML encoded string (or a full server URL) back to source text.
+    Accepts strings with or without '=' padding.
+    """
+    encoded = encoded.strip()
+    if '/' in encoded:
+        # http://host/uml/png/SyfFKj2r... → nur das letzte Segment
+        encoded = encoded.rstrip('/').rsplit('/', 1)[-1]
+    if encoded.startswith('~h'):
+        # "~h" Prefix: Quelltext ist nur hex-encodiert (unkomprimiert)
+        try:
+            return bytes.fromhex(encoded[2:]).decode('utf-8')
+        except ValueError as e:
+            raise DecodeError(f'Invalid hex encoding: {e}') from e
+    raw = encoded.rstrip('=').encode('ascii', errors='replace')
+    if raw.translate(None, PLANTUML_ALPHABET.encode('ascii')):
+        raise DecodeError('Invalid character in encoded diagram')
+    raw += b'=' * (-len(raw) % 4)
+    try:
+        data = base64.b64decode(raw.translate(_FROM_PLANTUML))
+        return zlib.decompress(data, -15).decode('utf-8')
+    except (ValueError, zlib.error) as e:
+        raise DecodeError(f'Not a valid PlantUML encoding: {e}') from e
@@ -0,0 +1,186 @@
+"""
+Content-addressed render cache
+Rendered files are stored under a sha256 of (source fingerprint, format,
+backend version). Entries are touched on every hit, eviction removes the
+least recently used entries until the cache fits its size cap.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+DEFAULT_CACHE_DIR = Path(os.getenv('XDG_CACHE_HOME', Path.home() / '.cache')) / 'plantuml-tools'
+CACHE_DIR = Path(os.getenv('PLANTUML_CACHE_DIR', DEFAULT_CACHE_DIR))
+CACHE_MAX_MB = int(os.getenv('PLANTUML_CACHE_MAX_MB', '512'))
+CHUNK_SIZE = 64 * 1024
+
+# mkstemp legt Dateien mit 0600 an - Ausgaben müssen für nginx/MkDocs lesbar bleiben
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+# Backend-Version wird nicht bei jedem Lauf neu abgefragt
+VERSION_TTL = 3600
+VERSION_PROBE = '@startuml\nAlice -> Bob : %version()\n@enduml\n'
+
+
+def temp_file_for(path):
+    """Open a temp file next to path (same filesystem, so os.replace is atomic). Returns (file, tmp path)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.fchmod(fd, FILE_MODE)
+    return os.fdopen(fd, 'wb'), Path(tmp)
+
+
+def atomic_write(path, data):
+    """Write bytes via temp file + rename so readers never see a partial file"""
+    f, tmp = temp_file_for(path)
+    try:
+        with f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def files_equal(a, b):
+    """Chunked byte comparison, never loads a whole diagram into memory"""
+    try:
+        if Path(a).stat().st_size != Path(b).stat().st_size:
+            return False
+    except FileNotFoundError:
+        return False
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
+        while True:
+            chunk_a = fa.read(CHUNK_SIZE)
+            if chunk_a != fb.read(CHUNK_SIZE):
+                return False
+            if not chunk_a:
+                return True
+
+
+def replace_if_changed(tmp, path):
+    """Move a finished temp file over path, or drop it if path already has these bytes"""
+    if files_equal(tmp, path):
+        Path(tmp).unlink(missing_ok=True)
+        return False
+    os.replace(tmp, path)
+    return True
+
+
+def copy_if_changed(src, path):
+    """Atomically copy src to path unless path already has the same bytes"""
+    if files_equal(src, path):
+        return False
+    f, tmp = temp_file_for(path)
+    try:
+        with f, open(src, 'rb') as source:
+            shutil.copyfileobj(source, f, CHUNK_SIZE)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return True
+
+
+class RenderCache:
+    """On-disk LRU cache for rendered diagrams"""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.objects = self.root / 'objects'
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(fingerprint, fmt, backend_version):
+        return hashlib.sha256(f'{fingerprint}\0{fmt}\0{backend_version}'.encode('utf-8')).hexdigest()
+
+    def _path(self, key, fmt):
+        return self.objects / key[:2] / f'{key}.{fmt}'
+
+    def get_path(self, key, fmt):
+        """Path of a cached render (touched for LRU) or None"""
+        path = self._path(key, fmt)
+        try:
+            # mtime dient als LRU-Zeitstempel (atime ist auf noatime-Mounts unbrauchbar)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return path
+
+    def put_file(self, key, fmt, src):
+        copy_if_changed(src, self._path(key, fmt))
+
+    def _entries(self):
+        if not self.objects.exists():
+            return []
+        entries = []
+        for path in self.objects.glob('*/*'):
+            if path.name.endswith('.tmp'):
+                continue
+            st = path.stat()
+            entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def stats(self):
+        entries = self._entries()
+        return {
+            'path': str(self.root),
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+            'oldest': min((mtime for mtime, _, _ in entries), default=None),
+            'newest': max((mtime for mtime, _, _ in entries), default=None),
+        }
+
+    def prune(self, max_bytes=None):
+        """Evict least recently used entries until the cache fits max_bytes. Returns (removed, freed bytes)"""
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        removed = freed = 0
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            freed += size
+            removed += 1
+        return removed, freed
+
+    def backend_version(self, client, encoded_probe):
+        """
+        Fingerprint of the PlantUML backend build, cached for VERSION_TTL seconds
+        so that warm runs do not need a round trip. PLANTUML_BACKEND_VERSION pins it.
+        """
+        pinned = os.getenv('PLANTUML_BACKEND_VERSION')
+        if pinned:
+            return pinned
+        version_file = self.root / 'backend-version.json'
+        try:
+            info = json.loads(version_file.read_text())
+            if info.get('url') == client.base_url and time.time() - info.get('checked_at', 0) < VERSION_TTL:
+                return info['version']
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        try:
+            version = hashlib.sha256(client.render_encoded(encoded_probe, 'txt')).hexdigest()[:16]
+        except Exception:
+            # Server nicht erreichbar: eigener Namespace, damit nichts Falsches getroffen wird
+            return 'unknown'
+        atomic_write(version_file, json.dumps({
+            'url': client.base_url,
+            'version': version,
+            'checked_at': time.time(),
+        }).encode('utf-8'))
+        return version
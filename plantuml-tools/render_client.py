@@ -0,0 +1,348 @@
+"""
+Render client for the PlantUML backend
+Shares one pooled keep-alive HTTP session across all worker threads of a
+batch run, so the Jetty backend is not hit with a fresh TCP connection
+per diagram and per output format. Requests go through the flow control
+in flow_control.py, so a struggling backend is not hammered further.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import plantuml_codec
+from flow_control import RETRIES, Balancer, backoff_delay
+from includes import source_fingerprint
+from optimize import OPTIMIZE_VERSION
+from render_cache import CHUNK_SIZE, copy_if_changed, replace_if_changed, temp_file_for
+
+# Ab dieser Länge des encodierten Diagramms wird per POST gerendert statt per GET-URL
+# (Jetty requestHeaderSize, Proxies und Logs vertragen keine beliebig langen URLs)
+POST_THRESHOLD = int(os.getenv('PLANTUML_POST_THRESHOLD', '4096'))
+
+
+class RenderError(Exception):
+    """Backend rejected a diagram or could not be reached."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        # HTTP-Status der Backend-Antwort, None bei Verbindungsfehlern
+        self.status = status
+
+
+class TransientRenderError(RenderError):
+    """Timeout, connection failure or 5xx - worth retrying after a backoff."""
+    pass
+
+
+class RenderCancelled(Exception):
+    """A newer edit made this render stale before its outputs were written."""
+    pass
+
+
+# Überlastung/Neustart des Backends (JVM OOM → 500, Jetty/Traefik → 502-504)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def _check(response):
+    if response.status_code in RETRY_STATUS:
+        raise TransientRenderError(f"{response.status_code}: {response.reason}", response.status_code)
+    if response.status_code != 200:
+        raise RenderError(f"{response.status_code}: {response.reason}", response.status_code)
+
+
+class RenderClient:
+    """
+    Thread-safe PlantUML server client on top of a pooled requests.Session
+    base_url may list several backends (comma separated or a list); requests
+    go to the healthy one with the fewest requests in flight. Every call runs
+    under that backend's AdaptiveLimiter (in-flight cap between 1 and
+    pool_size) and is retried with jittered backoff on transient errors.
+    """
+
+    def __init__(self, base_url, pool_size=8, timeout=60, post_threshold=POST_THRESHOLD,
+                 retries=RETRIES, flow_control=True):
+        # base_url zeigt auf den /uml Context, z.B. http://empc4_plantuml_backend:8080/uml
+        urls = base_url.split(',') if isinstance(base_url, str) else base_url
+        self.base_urls = [url.strip().rstrip('/') for url in urls if url.strip()]
+        self.base_url = ','.join(self.base_urls)
+        self.timeout = timeout
+        self.post_threshold = post_threshold
+        self.retries = retries
+        self.retried = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.base_urls), pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # flow_control=False: festes Limit = pool_size, keine Ejection (Benchmarks)
+        self.balancer = Balancer(self.base_urls, pool_size, self._probe, adaptive=flow_control,
+                                 threshold=3 if flow_control else float('inf'))
+        self._local = threading.local()
+
+    def _probe(self, base_url):
+        """Same check as the compose healthcheck of the backend: GET /uml/"""
+        return self.session.get(f"{base_url}/", timeout=5).status_code < 500
+
+    def _call(self, attempt):
+        """
+        Run attempt(base_url) on the least loaded healthy backend, retrying
+        transient errors with full-jitter backoff (usually on another backend)
+        """
+        for n in range(self.retries + 1):
+            try:
+                backend = self.balancer.acquire()
+            except TimeoutError as e:
+                raise RenderError(f"Backend unavailable: {e}") from e
+            start = time.monotonic()
+            try:
+                result = attempt(backend.url)
+            except TransientRenderError:
+                self.balancer.release(backend, ok=False)
+                if n == self.retries:
+                    raise
+                self.retried += 1
+                time.sleep(backoff_delay(n))
+                continue
+            except RenderError:
+                # Backend hat geantwortet (z.B. 400 Syntaxfehler) - kein Überlastsignal
+                self.balancer.release(backend, time.monotonic() - start)
+                raise
+            except BaseException:
+                self.balancer.release(backend, ok=None)
+                raise
+            elapsed = time.monotonic() - start
+            self.balancer.release(backend, elapsed)
+            self._local.seconds = elapsed
+            return result
+
+    @property
+    def last_seconds(self):
+        """Duration of the calling thread's last successful request (without queueing and retries)"""
+        return getattr(self._local, 'seconds', None)
+
+    def stats(self):
+        """Flow control counters for the summary lines of batch runs (totals + per backend)"""
+        backends = [backend.stats() for backend in self.balancer.backends]
+        return {
+            'limit': sum(b['limit'] for b in backends),
+            'peak_limit': sum(b['peak_limit'] for b in backends),
+            'decreases': sum(backend.limiter.decreases for backend in self.balancer.backends),
+            'retries': self.retried,
+            'outages': sum(b['ejections'] for b in backends),
+            'backends': backends,
+        }
+
+    def url_for(self, encoded, fmt, base_url=None):
+        return f"{base_url or self.base_urls[0]}/{fmt}/{encoded}"
+
+    def render_encoded(self, encoded, fmt):
+        """Fetch one already encoded diagram in the given format, returns bytes"""
+        def attempt(base_url):
+            try:
+                response = self.session.get(self.url_for(encoded, fmt, base_url), timeout=self.timeout)
+            except requests.RequestException as e:
+                raise TransientRenderError(f"Connection failed: {e}") from e
+            _check(response)
+            return response.content
+        return self._call(attempt)
+
+    def _request(self, base_url, text, encoded, fmt):
+        """GET with the encoded URL, or POST of the raw text for large diagrams (streamed response)"""
+        try:
+            if len(encoded) > self.post_threshold:
+                return self.session.post(
+                    f"{base_url}/{fmt}",
+                    data=text.encode('utf-8'),
+                    headers={'Content-Type': 'text/plain; charset=utf-8'},
+                    timeout=self.timeout,
+                    stream=True,
+                )
+            return self.session.get(self.url_for(encoded, fmt, base_url), timeout=self.timeout, stream=True)
+        except requests.RequestException as e:
+            raise TransientRenderError(f"Connection failed: {e}") from e
+
+    def render_text(self, text, fmt, encoded=None):
+        """Render diagram source into bytes (GET or POST depending on size)"""
+        if encoded is None:
+            encoded = plantuml_codec.encode(text)
+        return self._fetch(lambda base_url: self._request(base_url, text, encoded, fmt))
+
+    def render_to_temp(self, text, encoded, fmt, out_file):
+        """
+        Render into a temp file next to out_file, streaming the body in chunks.
+        The caller moves it into place (os.replace), so readers never see a partial file.
+        """
+        return self._fetch_to_temp(lambda base_url: self._request(base_url, text, encoded, fmt), out_file)
+
+    def _fetch(self, request, check=_check):
+        """Body of request(base_url) as bytes, with balancing and retries"""
+        def attempt(base_url):
+            response = request(base_url)
+            with response:
+                check(response)
+                try:
+                    return response.content
+                except requests.RequestException as e:
+                    raise TransientRenderError(f"Connection failed: {e}") from e
+        return self._call(attempt)
+
+    def _fetch_to_temp(self, request, out_file, check=_check):
+        """Stream the body of request(base_url) into a temp file next to out_file"""
+        def attempt(base_url):
+            response = request(base_url)
+            with response:
+                check(response)
+                f, tmp = temp_file_for(out_file)
+                try:
+                    with f:
+                        for chunk in response.iter_content(CHUNK_SIZE):
+                            f.write(chunk)
+                except BaseException as e:
+                    tmp.unlink(missing_ok=True)
+                    if isinstance(e, requests.RequestException):
+                        raise TransientRenderError(f"Connection failed: {e}") from e
+                    raise
+            return tmp
+        return self._call(attempt)
+
+    def close(self):
+        self.balancer.close()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TargetResult:
+    """
+    Outcome of one output file: served from cache and/or skipped because unchanged
+    seconds/size are set for backend renders (request time, bytes as rendered),
+    saved for outputs that went through the optimizer.
+    """
+    __slots__ = ('fmt', 'out_file', 'cached', 'written', 'seconds', 'size', 'saved')
+
+    def __init__(self, fmt, out_file, cached, written, seconds=None, size=None, saved=None):
+        self.fmt = fmt
+        self.out_file = out_file
+        self.cached = cached
+        self.written = written
+        self.seconds = seconds
+        self.size = size
+        self.saved = saved
+
+
+def render_job(client, source, targets, cache=None, backend_version=None, cancelled=None,
+               vendor=None, include_mode='off', optimizer=None):
+    """
+    Render one .puml file (or Kroki source) into all requested formats.
+    The diagram is deflate-encoded at most once and reused for every format;
+    with a cache, hits are served without any HTTP call.
+    client: RenderClient/LocalEngine, or a router with client_for(source)
+    targets: list of (format, output path)
+    cancelled: optional callable, checked before every backend call and write
+    vendor/include_mode: resolve pinned remote !include URLs before encoding
+    optimizer: optional Optimizer, applied before outputs are cached and written
+    Returns a list of TargetResult.
+    """
+    if hasattr(client, 'client_for'):
+        client = client.client_for(source)
+    text = source.read_text()
+    fingerprint = source_fingerprint(source) if cache is not None else None
+    salt = getattr(client, 'cache_salt', None)
+    if salt is not None and fingerprint is not None:
+        fingerprint = hashlib.sha256(f'{fingerprint}\0{salt}'.encode('utf-8')).hexdigest()
+    if vendor is not None and include_mode != 'off':
+        if fingerprint is not None:
+            # Gepinnte Versionen der Remote-Includes gehören zum Cache-Key
+            fingerprint = hashlib.sha256(f'{fingerprint}\0{include_mode}\0{vendor.pin_digest(text)}'.encode('utf-8')).hexdigest()
+        text = vendor.preprocess(text, include_mode)
+    if optimizer is not None and fingerprint is not None:
+        # Optimierte Bytes liegen unter eigenem Key, Cache-Treffer sind damit schon optimiert
+        fingerprint = hashlib.sha256(f'{fingerprint}\0optimize-{OPTIMIZE_VERSION}'.encode('utf-8')).hexdigest()
+    encoded = None
+    results = []
+    for fmt, out_file in targets:
+        cached_path = None
+        if cache is not None:
+            key = cache.key(fingerprint, fmt, backend_version)
+            cached_path = cache.get_path(key, fmt)
+        if cached_path is not None:
+            if cancelled is not None and cancelled():
+                raise RenderCancelled(source)
+            written = copy_if_changed(cached_path, out_file)
+            results.append(TargetResult(fmt, out_file, True, written))
+            continue
+        if cancelled is not None and cancelled():
+            raise RenderCancelled(source)
+        if encoded is None:
+            encoded = getattr(client, 'encode', plantuml_codec.encode)(text)
+        tmp = client.render_to_temp(text, encoded, fmt, out_file)
+        seconds, size = client.last_seconds, tmp.stat().st_size
+        saved = None
+        try:
+            if optimizer is not None:
+                before, after = optimizer.optimize(tmp, fmt)
+                saved = before - after
+            if cache is not None:
+                # Auch veraltete Renders sind unter ihrem Inhalts-Hash gültig
+                cache.put_file(key, fmt, tmp)
+            if cancelled is not None and cancelled():
+                raise RenderCancelled(source)
+            written = replace_if_changed(tmp, out_file)
+        finally:
+            tmp.unlink(missing_ok=True)
+        results.append(TargetResult(fmt, out_file, False, written, seconds, size, saved))
+    return results
+
+
+def run_jobs(client, jobs, workers=1, order=None, **render_opts):
+    """
+    Render (source, targets) jobs on a bounded thread pool.
+    Yields (source, results, error) in input order - error is None on success -
+    so progress and failures are reported in the same order as the file list.
+    order: the same jobs in the order they should be started (e.g. most
+    expensive first); defaults to the input order.
+    """
+    def _run(job):
+        source, targets = job
+        try:
+            return source, render_job(client, source, targets, **render_opts), None
+        except Exception as e:
+            return source, [], e
+
+    if workers <= 1:
+        for job in jobs:
+            yield _run(job)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        if order is None:
+            # Executor.map liefert die Ergebnisse in Eingabereihenfolge
+            yield from pool.map(_run, jobs)
+            return
+        futures = {job[0]: pool.submit(_run, job) for job in order}
+        for source, _ in jobs:
+            yield futures[source].result()
+
+
+def describe_results(results):
+    """Short status suffix for progress lines, e.g. ' (-3.2 KB optimized, 1 cached, 2 unchanged)'"""
+    cached = sum(1 for r in results if r.cached)
+    unchanged = sum(1 for r in results if not r.written)
+    saved = sum(r.saved for r in results if r.saved)
+    notes = []
+    if saved:
+        notes.append(f"-{saved / 1024:.1f} KB optimized")
+    if cached:
+        notes.append(f"{cached} cached")
+    if unchanged:
+        notes.append(f"{unchanged} unchanged")
+    return f" ({', '.join(notes)})" if notes else ''
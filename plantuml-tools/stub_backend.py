@@ -0,0 +1,176 @@
+"""
+Local stub of the PlantUML server HTTP API
+Answers GET /uml/<format>/<encoded> and POST /uml/<format> like
+plantuml-server (and the Kroki routes /<type>/<format>[/<encoded>] and
+/health), but without a JVM: the diagram is decoded and turned into
+a small deterministic SVG/PNG/TXT. Latency grows with diagram size and
+errors can be injected, so bench/warmup and the render client can be
+exercised offline.
+"""
+
+import hashlib
+import random
+import struct
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import kroki
+import plantuml_codec
+
+STUB_VERSION = 'stub-1'
+KROKI_KINDS = set(kroki.KROKI_TYPES.values())
+KROKI_HEALTH = ('{"status": "pass", "version": {"kroki": {"number": "%s"}}}' % STUB_VERSION).encode('utf-8')
+
+
+def _png(text):
+    """Valid 1x1 PNG with the source hash in a tEXt chunk (deterministic per diagram)"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    digest = hashlib.sha256(text.encode('utf-8')).hexdigest().encode('ascii')
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b'tEXt', b'Comment\x00' + digest)
+            + chunk(b'IDAT', zlib.compress(b'\x00\xff\xff\xff'))
+            + chunk(b'IEND', b''))
+
+
+def render_stub(text, fmt):
+    """(content type, body) for a decoded diagram"""
+    text = text.replace('%version()', STUB_VERSION)
+    lines = [line for line in text.split('\n') if line.strip() and not line.startswith('@')]
+    if fmt == 'svg':
+        body = ''.join(f'<text x="0" y="{i * 16 + 16}">{line.strip()[:80]}</text>'
+                       for i, line in enumerate(lines[:200]))
+        svg = (f'<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
+               f'<svg xmlns="http://www.w3.org/2000/svg" width="640" height="{len(lines) * 16 + 32}">'
+               f'<g>{body}</g></svg>')
+        return 'image/svg+xml', svg.encode('utf-8')
+    if fmt == 'txt':
+        return 'text/plain;charset=UTF-8', '\n'.join(lines).encode('utf-8') + b'\n'
+    return 'image/png', _png(text)
+
+
+class StubBackend:
+    """
+    Threaded stub server. Usage:
+        with StubBackend(latency_ms=5) as stub:
+            client = RenderClient(f"{stub.url}/uml")
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency_ms=2.0, latency_per_kb_ms=0.2, error_rate=0.0, seed=None,
+                 fail_first=0):
+        self.latency_ms = latency_ms
+        self.latency_per_kb_ms = latency_per_kb_ms
+        self.error_rate = error_rate
+        # Die ersten N Render-Requests schlagen mit 503 fehl (deterministisch, für Retry-Tests)
+        self.fail_first = fail_first
+        # {(Methode, Format)}: Anzahl Render-Requests, z.B. ('POST', 'svg')
+        self.methods = {}
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Header und Body getrennt geschrieben + Nagle = 40ms Delayed-ACK pro Request
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _respond(self, fmt, text):
+                with stub.lock:
+                    stub.requests += 1
+                    key = (self.command, fmt)
+                    stub.methods[key] = stub.methods.get(key, 0) + 1
+                    fail = stub.requests <= stub.fail_first or (stub.error_rate and stub.random.random() < stub.error_rate)
+                # Rechenzeit des Backends simulieren: Grundlatenz + Anteil pro KB Quelltext
+                time.sleep((stub.latency_ms + stub.latency_per_kb_ms * len(text) / 1024) / 1000)
+                if fail:
+                    self._send(503, 'text/plain', b'stub: injected error\n')
+                    return
+                content_type, body = render_stub(text, fmt)
+                self._send(200, content_type, body)
+
+            def _parts(self):
+                parts = [p for p in self.path.split('?', 1)[0].split('/') if p]
+                return parts[1:] if parts and parts[0] == 'uml' else parts
+
+            def do_HEAD(self):
+                self.do_GET()
+
+            def do_GET(self):
+                parts = self._parts()
+                if not parts:
+                    self._send(200, 'text/html', b'<html><body>PlantUML stub</body></html>')
+                    return
+                if parts == ['health']:
+                    self._send(200, 'application/json', KROKI_HEALTH)
+                    return
+                if len(parts) == 3 and parts[0] in KROKI_KINDS:
+                    try:
+                        text = kroki.decode(parts[2])
+                    except (ValueError, zlib.error):
+                        self._send(400, 'text/plain', b'bad encoding\n')
+                        return
+                    self._respond(parts[1], text)
+                    return
+                if len(parts) != 2 or parts[0] not in ('png', 'svg', 'txt'):
+                    self._send(404, 'text/plain', b'not found\n')
+                    return
+                try:
+                    text = plantuml_codec.decode(parts[1])
+                except plantuml_codec.DecodeError:
+                    self._send(400, 'text/plain', b'bad encoding\n')
+                    return
+                self._respond(parts[0], text)
+
+            def do_POST(self):
+                parts = self._parts()
+                length = int(self.headers.get('Content-Length', 0))
+                text = self.rfile.read(length).decode('utf-8', errors='replace')
+                if len(parts) == 2 and parts[0] in KROKI_KINDS:
+                    self._respond(parts[1], text)
+                    return
+                if len(parts) != 1 or parts[0] not in ('png', 'svg', 'txt'):
+                    self._send(404, 'text/plain', b'not found\n')
+                    return
+                self._respond(parts[0], text)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
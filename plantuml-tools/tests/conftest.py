@@ -0,0 +1,27 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Module liegen flach neben plantuml-tools.py (kein Paket)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import render_client
+from stub_backend import StubBackend
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # Retries ohne Wartezeit, sonst dauert jeder Retry-Test Sekunden
+    monkeypatch.setattr(render_client, 'backoff_delay', lambda attempt: 0)
+
+
+@pytest.fixture
+def stub():
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0) as backend:
+        yield backend
+
+
+def write_diagram(path, body='Alice -> Bob : hello'):
+    path.write_text(f'@startuml\n{body}\n@enduml\n')
+    return path
@@ -0,0 +1,39 @@
+from bench import build_corpus, percentile, run_bench, synthetic_diagram
+from stub_backend import StubBackend
+
+
+def test_synthetic_diagram_is_not_a_star():
+    text = synthetic_diagram(200)
+    callers = {line.split()[0] for line in text.splitlines() if line.endswith(': calls')}
+    assert len(callers) > 20
+    assert text == synthetic_diagram(200)
+
+
+def test_percentile_nearest_rank():
+    values = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
+    assert percentile(values, 50) == 5
+    assert percentile(values, 95) == 10
+    assert percentile([], 50) is None
+
+
+def test_run_bench_against_stub():
+    corpus = build_corpus(synthetic_sizes=(5, 30))
+    with StubBackend(latency_ms=1, latency_per_kb_ms=0) as stub:
+        report = run_bench(f'{stub.url}/uml', corpus, levels=[1, 4], rounds=2, warmup=0)
+        assert stub.requests == 2 * len(corpus) * 2
+    assert [level['concurrency'] for level in report['levels']] == [1, 4]
+    for level in report['levels']:
+        assert level['requests'] == len(corpus) * 2
+        assert level['errors'] == 0
+        assert set(level['latency_ms']) == {'p50', 'p95', 'p99', 'mean', 'max'}
+        assert set(level['per_diagram_p50_ms']) == {'synthetic-5', 'synthetic-30'}
+
+
+def test_run_bench_counts_errors():
+    corpus = build_corpus(synthetic_sizes=(5,))
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0, error_rate=1.0) as stub:
+        report = run_bench(f'{stub.url}/uml', corpus, levels=[2], rounds=3, warmup=0)
+    [level] = report['levels']
+    assert level['errors'] == 3
+    assert level['error_rate'] == 1.0
+    assert level['latency_ms'] is None
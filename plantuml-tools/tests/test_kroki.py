@@ -0,0 +1,72 @@
+import pytest
+import requests
+from conftest import write_diagram
+from kroki import EngineRouter, KrokiClient, _check_kroki
+from render_client import RenderClient, RenderError, run_jobs
+from stub_backend import StubBackend
+
+
+@pytest.fixture
+def backends():
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0) as plantuml, \
+            StubBackend(latency_ms=0, latency_per_kb_ms=0) as kroki:
+        yield plantuml, kroki
+
+
+def _jobs(tmp_path):
+    puml = write_diagram(tmp_path / 'a.puml')
+    mermaid = tmp_path / 'b.mmd'
+    mermaid.write_text('graph TD\n  A --> B\n')
+    return [(puml, [('svg', tmp_path / 'out' / 'a.svg')]),
+            (mermaid, [('svg', tmp_path / 'out' / 'b.svg')])]
+
+
+def test_router_sends_each_source_to_its_engine(backends, tmp_path):
+    plantuml_stub, kroki_stub = backends
+    jobs = _jobs(tmp_path)
+    with RenderClient(f'{plantuml_stub.url}/uml') as plantuml, KrokiClient(kroki_stub.url) as kroki:
+        router = EngineRouter(plantuml, kroki)
+        assert router.client_for(jobs[0][0]) is plantuml
+        view = router.client_for(jobs[1][0])
+        assert view.kind == 'mermaid'
+        assert view.cache_salt == f'kroki-mermaid-{router.kroki_version}'
+        # Eine View pro Typ
+        assert router.client_for(jobs[1][0]) is view
+        results = list(run_jobs(router, jobs, workers=2))
+    assert all(error is None for _, _, error in results)
+    assert plantuml_stub.methods == {('GET', 'svg'): 1}
+    assert kroki_stub.methods == {('GET', 'svg'): 1}
+    assert b'A --> B' in (tmp_path / 'out' / 'b.svg').read_bytes()
+
+
+def test_kroki_failure_does_not_affect_plantuml_sources(tmp_path):
+    jobs = _jobs(tmp_path)
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0) as plantuml_stub, \
+            StubBackend(latency_ms=0, latency_per_kb_ms=0, error_rate=1.0) as kroki_stub, \
+            RenderClient(f'{plantuml_stub.url}/uml') as plantuml, \
+            KrokiClient(kroki_stub.url, retries=0) as kroki:
+        results = dict((source.suffix, error) for source, _, error in run_jobs(EngineRouter(plantuml, kroki), jobs))
+    assert results['.puml'] is None
+    assert isinstance(results['.mmd'], RenderError)
+    assert (tmp_path / 'out' / 'a.svg').exists()
+    assert not (tmp_path / 'out' / 'b.svg').exists()
+
+
+def test_unreachable_kroki_uses_unknown_version(stub):
+    # Port des gestoppten Stubs ist frei: Verbindung wird sofort abgelehnt
+    closed = StubBackend()
+    url = closed.url
+    closed.server.server_close()
+    with RenderClient(f'{stub.url}/uml') as plantuml, KrokiClient(url) as kroki:
+        assert EngineRouter(plantuml, kroki).kroki_version == 'unknown'
+
+
+def test_kroki_syntax_error_carries_renderer_message():
+    response = requests.Response()
+    response.status_code = 400
+    response.reason = 'Bad Request'
+    response._content = b'Error 400: Parse error on line 2:\n...\n'
+    with pytest.raises(RenderError) as excinfo:
+        _check_kroki(response)
+    assert excinfo.value.status == 400
+    assert 'Parse error on line 2' in str(excinfo.value)
@@ -0,0 +1,76 @@
+import plantuml_codec
+import pytest
+from conftest import write_diagram
+from render_client import RenderClient, RenderError, TransientRenderError, render_job, run_jobs
+from stub_backend import StubBackend
+
+
+def test_small_diagram_uses_get(stub):
+    with RenderClient(f'{stub.url}/uml', post_threshold=4096) as client:
+        svg = client.render_text('@startuml\nA -> B\n@enduml\n', 'svg')
+    assert svg.startswith(b'<?xml')
+    assert stub.methods == {('GET', 'svg'): 1}
+
+
+def test_large_diagram_is_posted_above_threshold(stub):
+    text = '@startuml\n' + ''.join(f'Service{i} -> Service{i + 1} : call {i}\n' for i in range(400)) + '@enduml\n'
+    assert len(plantuml_codec.encode(text)) > 512
+    with RenderClient(f'{stub.url}/uml', post_threshold=512) as client:
+        txt = client.render_text(text, 'txt')
+    assert stub.methods == {('POST', 'txt'): 1}
+    assert b'Service399 -> Service400' in txt
+
+
+def test_transient_errors_are_retried():
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0, fail_first=2) as stub, \
+            RenderClient(f'{stub.url}/uml', retries=3) as client:
+        client.render_text('@startuml\nA -> B\n@enduml\n', 'svg')
+        assert stub.requests == 3
+        assert client.stats()['retries'] == 2
+
+
+def test_retries_exhausted_raise_transient_error():
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0, error_rate=1.0) as stub, \
+            RenderClient(f'{stub.url}/uml', retries=1) as client:
+        with pytest.raises(TransientRenderError):
+            client.render_text('@startuml\nA -> B\n@enduml\n', 'svg')
+        assert stub.requests == 2
+
+
+def test_run_jobs_yields_results_in_input_order(tmp_path):
+    # Große Diagramme zuerst: sie brauchen im Stub länger, trotzdem bleibt die Reihenfolge erhalten
+    sources = [write_diagram(tmp_path / f'd{i}.puml', 'A -> B\n' * (200 - i * 20)) for i in range(8)]
+    jobs = [(source, [('svg', tmp_path / 'out' / f'{source.stem}.svg')]) for source in sources]
+    with StubBackend(latency_ms=1, latency_per_kb_ms=20) as stub, \
+            RenderClient(f'{stub.url}/uml', pool_size=4) as client:
+        results = list(run_jobs(client, jobs, workers=4))
+    assert [source for source, _, _ in results] == sources
+    assert all(error is None for _, _, error in results)
+    assert all((tmp_path / 'out' / f'{source.stem}.svg').read_bytes().startswith(b'<?xml') for source in sources)
+
+
+def test_render_job_replaces_output_atomically(stub, tmp_path):
+    source = write_diagram(tmp_path / 'a.puml')
+    out_file = tmp_path / 'out' / 'a.svg'
+    with RenderClient(f'{stub.url}/uml') as client:
+        [result] = render_job(client, source, [('svg', out_file)])
+        assert result.written and not result.cached
+        # Gleiche Bytes: Datei bleibt unangetastet
+        [again] = render_job(client, source, [('svg', out_file)])
+        assert not again.written
+    assert out_file.read_bytes().startswith(b'<?xml')
+    assert [path.name for path in out_file.parent.iterdir()] == ['a.svg']
+
+
+def test_failed_render_keeps_previous_output(tmp_path):
+    source = write_diagram(tmp_path / 'a.puml')
+    out_file = tmp_path / 'out' / 'a.svg'
+    out_file.parent.mkdir()
+    out_file.write_bytes(b'previous')
+    with StubBackend(latency_ms=0, latency_per_kb_ms=0, error_rate=1.0) as stub, \
+            RenderClient(f'{stub.url}/uml', retries=0) as client:
+        with pytest.raises(RenderError):
+            render_job(client, source, [('svg', out_file)])
+    assert out_file.read_bytes() == b'previous'
+    # Kein halbfertiger Temp-File neben der Ausgabe
+    assert [path.name for path in out_file.parent.iterdir()] == ['a.svg']
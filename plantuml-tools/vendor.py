@@ -0,0 +1,234 @@
+"""
+Vendoring of remote !include URLs
+Remote includes (e.g. the C4-PlantUML stdlib on raw.githubusercontent.com)
+are fetched once into a local mirror tree and pinned by sha256 in a lock
+file. Before rendering, pinned URLs are either inlined into the diagram or
+rewritten to the mirror path as seen by the backend (/repo mount), so the
+backend no longer downloads them on every render.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from includes import INCLUDE_RE, is_remote
+from render_cache import atomic_write
+
+VENDOR_DIR = Path(os.getenv('PLANTUML_VENDOR_DIR', '.vendor/plantuml'))
+# Pfad des Mirror-Verzeichnisses aus Sicht des Backends (read-only /repo Mount)
+VENDOR_BACKEND_PATH = os.getenv('PLANTUML_VENDOR_BACKEND_PATH', '/repo/.vendor/plantuml')
+INCLUDE_MODE = os.getenv('PLANTUML_INCLUDE_MODE', 'inline')
+INCLUDE_MODES = ['inline', 'rewrite', 'off']
+
+LOCK_NAME = 'vendor.lock.json'
+
+
+class VendorError(Exception):
+    """Remote include could not be fetched or does not match its pin."""
+    pass
+
+
+def _split_part(target):
+    """'url!PART' → ('url', 'PART'); the URL itself never contains '!'"""
+    if '!' in target:
+        url, part = target.split('!', 1)
+        return url, part
+    return target, None
+
+
+def _extract_sub(text, part):
+    """Content between !startsub PART and !endsub"""
+    lines = []
+    inside = False
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if stripped == f'!startsub {part}':
+            inside = True
+        elif stripped == '!endsub' and inside:
+            inside = False
+        elif inside:
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def _diagram_body(text):
+    """Included files may carry their own @startuml/@enduml - only the body is inlined"""
+    lines = text.split('\n')
+    starts = [i for i, line in enumerate(lines) if line.strip().startswith('@startuml')]
+    if not starts:
+        return text
+    body = lines[starts[0] + 1:]
+    ends = [i for i, line in enumerate(body) if line.strip().startswith('@enduml')]
+    return '\n'.join(body[:ends[0]] if ends else body)
+
+
+def _strip_comments(text):
+    """Full-line ' comments and blank lines only cost URL length"""
+    return '\n'.join(
+        line for line in text.split('\n')
+        if line.strip() and not line.lstrip().startswith("'")
+    )
+
+
+class VendorStore:
+    """Mirror tree + lock file for remote includes"""
+
+    def __init__(self, root=VENDOR_DIR, backend_path=VENDOR_BACKEND_PATH):
+        self.root = Path(root)
+        self.backend_path = backend_path.rstrip('/')
+        self.lock_path = self.root / LOCK_NAME
+        try:
+            self.lock = json.loads(self.lock_path.read_text())
+        except (FileNotFoundError, ValueError):
+            self.lock = {}
+        self._texts = {}
+
+    def save(self):
+        atomic_write(self.lock_path, json.dumps(self.lock, indent=2, sort_keys=True).encode('utf-8'))
+
+    @staticmethod
+    def _relpath(url):
+        parsed = urlparse(url)
+        return Path(parsed.netloc) / parsed.path.lstrip('/')
+
+    def is_pinned(self, url):
+        return url in self.lock
+
+    def read(self, url):
+        """Pinned content of a vendored URL (verified against the lock, memoized per sha)"""
+        entry = self.lock[url]
+        text = self._texts.get(entry['sha256'])
+        if text is None:
+            data = (self.root / entry['path']).read_bytes()
+            if hashlib.sha256(data).hexdigest() != entry['sha256']:
+                raise VendorError(f"Vendored copy of {url} does not match its pin, run 'vendor --update'")
+            text = self._texts[entry['sha256']] = data.decode('utf-8')
+        return text
+
+    def fetch(self, url, session, update=False):
+        """
+        Fetch url and everything it includes (relative includes are resolved
+        against the URL) into the mirror. Returns the list of newly pinned URLs.
+        """
+        pinned = []
+        queue = [url]
+        seen = set()
+        while queue:
+            current = queue.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            if current in self.lock and not update:
+                text = self.read(current)
+            else:
+                try:
+                    response = session.get(current, timeout=30)
+                except requests.RequestException as e:
+                    raise VendorError(f"{current}: {e}") from e
+                if response.status_code != 200:
+                    raise VendorError(f"{current}: {response.status_code} {response.reason}")
+                data = response.content
+                relpath = self._relpath(current)
+                atomic_write(self.root / relpath, data)
+                sha = hashlib.sha256(data).hexdigest()
+                if self.lock.get(current, {}).get('sha256') != sha:
+                    pinned.append(current)
+                self.lock[current] = {
+                    'path': relpath.as_posix(),
+                    'sha256': sha,
+                    'fetched_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                }
+                text = data.decode('utf-8')
+            for nested in self.remote_targets(text, base_url=current):
+                queue.append(nested)
+        return pinned
+
+    @staticmethod
+    def remote_targets(text, base_url=None):
+        """Absolute URLs of all remote includes in text (relative ones only inside vendored files)"""
+        urls = []
+        for match in INCLUDE_RE.finditer(text):
+            target = match.group(2).split("'", 1)[0].strip().strip('"')
+            if not target or target.startswith('<'):
+                continue
+            url, _ = _split_part(target)
+            if is_remote(url):
+                urls.append(url)
+            elif base_url is not None:
+                urls.append(urljoin(base_url, url))
+        return urls
+
+    def pin_digest(self, text):
+        """Digest over the pins of all vendored URLs a diagram uses (part of the render cache key)"""
+        digest = hashlib.sha256()
+        seen = set()
+        queue = [url for url in self.remote_targets(text) if self.is_pinned(url)]
+        while queue:
+            url = queue.pop()
+            if url in seen or not self.is_pinned(url):
+                continue
+            seen.add(url)
+            digest.update(f"{url}\0{self.lock[url]['sha256']}\0".encode('utf-8'))
+            queue.extend(self.remote_targets(self.read(url), base_url=url))
+        return digest.hexdigest() if seen else ''
+
+    def preprocess(self, text, mode=INCLUDE_MODE):
+        """
+        Resolve pinned remote includes in a diagram.
+        inline:  replace the directive with the (comment-stripped) vendored content
+        rewrite: point the directive at the mirror path below the backend's /repo mount
+        off:     leave the text alone
+        URLs that are not vendored stay remote in every mode.
+        """
+        if mode == 'off' or not self.lock:
+            return text
+        if mode == 'rewrite':
+            return INCLUDE_RE.sub(self._rewrite_match, text)
+        return self._inline(text, base_url=None, seen=set())
+
+    def _rewrite_match(self, match):
+        directive, raw = match.group(1), match.group(2)
+        target = raw.split("'", 1)[0].strip().strip('"')
+        url, part = _split_part(target)
+        if not is_remote(url) or not self.is_pinned(url):
+            return match.group(0)
+        path = f"{self.backend_path}/{self.lock[url]['path']}"
+        if part:
+            path += f'!{part}'
+        # !includeurl akzeptiert keine Dateipfade
+        directive = 'include' if directive == 'includeurl' else directive
+        return f'!{directive} {path}'
+
+    def _inline(self, text, base_url, seen):
+        out = []
+        for line in text.split('\n'):
+            match = INCLUDE_RE.match(line)
+            if match is None:
+                out.append(line)
+                continue
+            directive, raw = match.group(1), match.group(2)
+            target = raw.split("'", 1)[0].strip().strip('"')
+            url, part = _split_part(target)
+            if not is_remote(url) and base_url is not None and not url.startswith('<'):
+                url = urljoin(base_url, url)
+            if not is_remote(url) or not self.is_pinned(url):
+                out.append(line)
+                continue
+            if directive == 'include_many':
+                key = (url, part, len(seen))
+            else:
+                # C4-Stdlib wird genau einmal eingebunden, wie !include_once
+                key = (url, part)
+            if key in seen:
+                continue
+            seen.add(key)
+            content = _diagram_body(self.read(url))
+            if part or directive == 'includesub':
+                content = _extract_sub(content, part)
+            out.append(_strip_comments(self._inline(content, base_url=url, seen=seen)))
+        return '\n'.join(out)
@@ -0,0 +1,178 @@
+"""
+JVM warm-up for the PlantUML backend
+A freshly started plantuml-server passes its health check long before the
+JIT has compiled the layout code and the C4 stdlib is parsed. warmup
+replays a representative corpus round by round until the median latency
+of a round stops changing, and records the curve so deploys can be gated
+on a warm backend.
+"""
+
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import plantuml_codec
+from bench import latency_summary, synthetic_diagram, timed_render
+from render_client import RenderClient
+
+# Stdlib-Includes (<C4/...>) liegen im Server-JAR, kein Netzwerkzugriff nötig
+C4_CONTEXT = '''@startuml
+!include <C4/C4_Context>
+Person(user, "User", "Architect")
+System(stack, "Visualization Stack", "Docs, diagrams, whiteboard")
+System_Ext(git, "Git Hosting", "Source of truth")
+Rel(user, stack, "Uses", "HTTPS")
+Rel(stack, git, "Pulls from", "SSH")
+SHOW_LEGEND()
+@enduml
+'''
+
+C4_CONTAINER = '''@startuml
+!include <C4/C4_Container>
+Person(user, "User")
+System_Boundary(stack, "Stack") {
+    Container(proxy, "Reverse Proxy", "Traefik", "Routing")
+    Container(plantuml, "PlantUML Server", "Java, Jetty", "Rendering")
+    Container(docs, "Docs", "MkDocs", "Documentation")
+    ContainerDb(repo, "Repository", "Filesystem", "Diagrams and docs")
+}
+Rel(user, proxy, "Uses", "HTTP")
+Rel(proxy, plantuml, "Routes to")
+Rel(proxy, docs, "Routes to")
+Rel(plantuml, repo, "Reads")
+Rel(docs, repo, "Reads")
+SHOW_LEGEND()
+@enduml
+'''
+
+C4_COMPONENT = '''@startuml
+!include <C4/C4_Component>
+Container_Boundary(proxy, "Reverse Proxy") {
+    Component(entry, "Entrypoints", "HTTP", "Ports 80/443")
+    Component(router, "Router", "HTTP Router", "PathPrefix rules")
+    Component(mw, "Middlewares", "HTTP", "StripPrefix, Auth")
+    Component(lb, "Load Balancer", "Service LB", "Backends")
+}
+Container_Ext(backend, "Backend Services", "Docker")
+Rel(entry, router, "Forwards")
+Rel(router, mw, "Applies")
+Rel(mw, lb, "Passes")
+Rel(lb, backend, "Forwards to", "Docker network")
+@enduml
+'''
+
+SEQUENCE = '''@startuml
+actor User
+participant Proxy
+participant PlantUML
+database Repo
+User -> Proxy : GET /plantuml/png/...
+activate Proxy
+Proxy -> PlantUML : forward
+activate PlantUML
+PlantUML -> Repo : !include
+Repo --> PlantUML : source
+PlantUML --> Proxy : image/png
+deactivate PlantUML
+Proxy --> User : 200 OK
+deactivate Proxy
+alt cache hit
+  Proxy --> User : 304
+else miss
+  Proxy -> PlantUML : render
+end
+@enduml
+'''
+
+
+def default_corpus():
+    """C4 context/container/component, a sequence diagram and large synthetic graphs"""
+    return [
+        ('c4-context', C4_CONTEXT),
+        ('c4-container', C4_CONTAINER),
+        ('c4-component', C4_COMPONENT),
+        ('sequence', SEQUENCE),
+        ('synthetic-50', synthetic_diagram(50)),
+        ('synthetic-200', synthetic_diagram(200)),
+    ]
+
+
+def wait_ready(base_url, timeout):
+    """Poll GET /uml/ until the backend answers. Returns seconds waited or None on timeout"""
+    start = time.monotonic()
+    while True:
+        try:
+            if requests.get(f"{base_url}/", timeout=5).status_code < 500:
+                return time.monotonic() - start
+        except requests.RequestException:
+            pass
+        if time.monotonic() - start > timeout:
+            return None
+        time.sleep(1)
+
+
+def run_warmup(base_url, corpus, formats=('png', 'svg'), concurrency=2, tolerance=0.1, stable=2,
+               min_rounds=3, max_rounds=20, timeout=300, on_round=None):
+    """
+    Replay corpus × formats per round until the round p50 changed by at most
+    `tolerance` (relative) for `stable` rounds in a row. Returns a report dict
+    with the per-round curve; on_round(entry) is called after every round.
+    """
+    work = [(name, text, plantuml_codec.encode(text), fmt) for name, text in corpus for fmt in formats]
+    curve = []
+    settled_after = None
+    calm = 0
+    start = time.monotonic()
+    # Ohne Flow Control: gemessen wird das Backend, nicht der Client
+    with RenderClient(base_url, pool_size=concurrency, retries=1, flow_control=False) as client, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for round_no in range(1, max_rounds + 1):
+            round_start = time.perf_counter()
+            results = list(pool.map(lambda item: timed_render(client, *item), work))
+            latencies = [seconds for _, seconds, error, _ in results if error is None]
+            errors = sorted({error for _, _, error, _ in results if error is not None})
+            summary = latency_summary(latencies)
+            entry = {
+                'round': round_no,
+                'duration_s': round(time.perf_counter() - round_start, 3),
+                'requests': len(results),
+                'errors': len(results) - len(latencies),
+                'error_types': errors,
+                'latency_ms': summary,
+                'per_diagram_ms': {
+                    name: round(statistics.median(s for n, s, e, _ in results if n == name and e is None) * 1000, 2)
+                    for name in dict.fromkeys(n for n, _, e, _ in results if e is None)
+                },
+            }
+            if curve and summary and curve[-1]['latency_ms']:
+                previous = curve[-1]['latency_ms']['p50']
+                entry['change'] = round(abs(summary['p50'] - previous) / previous, 3) if previous else None
+                calm = calm + 1 if entry['change'] is not None and entry['change'] <= tolerance else 0
+            curve.append(entry)
+            if on_round is not None:
+                on_round(entry)
+            if summary is None:
+                break
+            if round_no >= min_rounds and calm >= stable:
+                settled_after = round_no
+                break
+            if time.monotonic() - start > timeout:
+                break
+    first = curve[0]['latency_ms'] if curve else None
+    last = curve[-1]['latency_ms'] if curve else None
+    return {
+        'backend': base_url,
+        'formats': list(formats),
+        'corpus': [name for name, _ in corpus],
+        'concurrency': concurrency,
+        'tolerance': tolerance,
+        'settled': settled_after is not None,
+        'settled_after_rounds': settled_after,
+        'duration_s': round(time.monotonic() - start, 3),
+        'cold_p50_ms': first['p50'] if first else None,
+        'warm_p50_ms': last['p50'] if last else None,
+        'speedup': round(first['p50'] / last['p50'], 2) if first and last and last['p50'] else None,
+        'curve': curve,
+    }
@@ -0,0 +1,130 @@
+"""
+Filesystem watching for plantuml-tools watch
+Uses inotify/FSEvents via watchdog when installed, otherwise falls back to
+mtime polling. Events are coalesced by a debounce window, so an editor
+save storm (temp file, rename, chmod, ...) results in one render.
+"""
+
+import os
+import threading
+import time
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+
+class Debouncer:
+    """Collects changed paths and releases them once no new event arrived for `window` seconds"""
+
+    def __init__(self, window=0.3):
+        self.window = window
+        self.pending = set()
+        self.last_event = 0.0
+        self.cond = threading.Condition()
+
+    def add(self, path):
+        with self.cond:
+            self.pending.add(Path(path).resolve())
+            self.last_event = time.monotonic()
+            self.cond.notify()
+
+    def wait_batch(self, stop):
+        """Blocks until a quiet window passed after at least one event (or stop is set)"""
+        with self.cond:
+            while not stop.is_set():
+                if not self.pending:
+                    self.cond.wait(timeout=0.5)
+                    continue
+                remaining = self.last_event + self.window - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(timeout=remaining)
+                    continue
+                batch, self.pending = self.pending, set()
+                return batch
+            return set()
+
+
+# Nur schreibende Events - opened/closed_no_write entstehen auch durch unsere eigenen Renders
+WRITE_EVENTS = {'created', 'modified', 'moved', 'deleted', 'closed'}
+
+
+if Observer is not None:
+    class _Handler(FileSystemEventHandler):
+        def __init__(self, debouncer):
+            self.debouncer = debouncer
+
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in WRITE_EVENTS:
+                return
+            self.debouncer.add(event.src_path)
+            # Editoren speichern oft atomar: temp-Datei schreiben, dann umbenennen
+            dest = getattr(event, 'dest_path', None)
+            if dest:
+                self.debouncer.add(dest)
+
+
+class Watcher:
+    """
+    Feeds filesystem changes below `directory` into a Debouncer.
+    Always watches recursively - shared includes often live in subdirectories
+    even when only the top-level diagrams are rendered.
+    """
+
+    def __init__(self, directory, debouncer, poll_interval=1.0, force_polling=False):
+        self.directory = Path(directory)
+        self.debouncer = debouncer
+        self.poll_interval = poll_interval
+        self.use_polling = force_polling or Observer is None
+        self.stop_event = threading.Event()
+        self._observer = None
+        self._thread = None
+
+    @property
+    def backend(self):
+        return 'polling' if self.use_polling else 'inotify (watchdog)'
+
+    def start(self):
+        if self.use_polling:
+            self._thread = threading.Thread(target=self._poll, daemon=True)
+            self._thread.start()
+        else:
+            self._observer = Observer()
+            self._observer.schedule(_Handler(self.debouncer), str(self.directory), recursive=True)
+            self._observer.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+
+    def _snapshot(self):
+        snapshot = {}
+        for path in self.directory.rglob('*'):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _poll(self):
+        previous = self._snapshot()
+        while not self.stop_event.wait(self.poll_interval):
+            current = self._snapshot()
+            for path in current.keys() | previous.keys():
+                if current.get(path) != previous.get(path):
+                    self.debouncer.add(path)
+            previous = current
+
+    def changes(self):
+        """Yields debounced sets of changed paths until stop() is called"""
+        while not self.stop_event.is_set():
+            batch = self.debouncer.wait_batch(self.stop_event)
+            if batch:
+                yield {path for path in batch if not os.path.basename(path).startswith('.')}
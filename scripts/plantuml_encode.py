@@ -2,38 +2,155 @@
 """
 Local PlantUML encoding utility
 Usage: python scripts/plantuml_encode.py <file.puml>
+       python scripts/plantuml_encode.py --decode <encoded|url>
+       python scripts/plantuml_encode.py <directory> [--manifest urls.json] [--base-url URL]
+
+Directory mode encodes every .puml below the directory on all CPU cores and
+writes a JSON (or JSONL) manifest with hash, encoded string and PNG/SVG/TXT
+URLs per diagram. Files whose hash did not change since the last manifest
+are taken over without re-encoding.
 """
 
+import argparse
+import hashlib
+import json
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-try:
-    from plantuml import deflate_and_encode
-except ImportError:
-    print("Error: plantuml library not installed!")
-    print("Install with: pip install plantuml")
-    sys.exit(1)
+# Encoder liegt bei plantuml-tools (keine externen Abhängigkeiten)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'plantuml-tools'))
+from plantuml_codec import DecodeError, decode, encode_file
+
+DEFAULT_BASE_URL = os.getenv('PLANTUML_PUBLIC_URL', 'http://arch.local/plantuml')
+FORMATS = ('png', 'svg', 'txt')
+
+
+def _encode_file(path):
+    """Worker: encode one file (runs in a separate process)"""
+    return path, encode_file(path)
+
+
+def _urls(base_url, encoded):
+    return {fmt: f"{base_url}/{fmt}/{encoded}" for fmt in FORMATS}
+
+
+def load_manifest(path):
+    """Previous manifest entries by relative path (JSON or JSONL), empty if missing/broken"""
+    try:
+        text = Path(path).read_text()
+    except FileNotFoundError:
+        return {}
+    try:
+        if Path(path).suffix == '.jsonl':
+            entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            entries = json.loads(text).get('diagrams', [])
+    except (ValueError, AttributeError):
+        return {}
+    return {entry['path']: entry for entry in entries if 'path' in entry}
+
+
+def write_manifest(path, entries, base_url):
+    path = Path(path)
+    if path.suffix == '.jsonl':
+        content = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+    else:
+        content = json.dumps({
+            'base_url': base_url,
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'count': len(entries),
+            'diagrams': entries,
+        }, indent=2, ensure_ascii=False) + '\n'
+    tmp = path.with_name(f'.{path.name}.tmp')
+    tmp.write_text(content)
+    os.replace(tmp, path)
+
+
+def encode_directory(directory, manifest_path, base_url, jobs, full=False):
+    directory = Path(directory)
+    base_url = base_url.rstrip('/')
+    files = sorted(directory.rglob('*.puml'))
+    previous = {} if full else load_manifest(manifest_path)
+
+    entries = {}
+    todo = []
+    for file_path in files:
+        rel = file_path.relative_to(directory).as_posix()
+        digest = hashlib.sha256(file_path.read_bytes()).hexdigest()
+        old = previous.get(rel)
+        if old is not None and old.get('sha256') == digest and 'encoded' in old:
+            # Unverändert: Encoding übernehmen, nur URLs ggf. an neue Base-URL anpassen
+            entries[rel] = {'path': rel, 'sha256': digest, 'encoded': old['encoded'],
+                            'urls': _urls(base_url, old['encoded'])}
+        else:
+            entries[rel] = {'path': rel, 'sha256': digest}
+            todo.append(str(file_path))
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            chunksize = max(1, len(todo) // (jobs * 4))
+            for path, encoded in pool.map(_encode_file, todo, chunksize=chunksize):
+                rel = Path(path).relative_to(directory).as_posix()
+                entries[rel]['encoded'] = encoded
+                entries[rel]['urls'] = _urls(base_url, encoded)
+
+    write_manifest(manifest_path, [entries[rel] for rel in sorted(entries)], base_url)
+    removed = len(set(previous) - set(entries))
+    return len(files), len(todo), removed
+
+
+def encode_single(file_path, base_url):
+    encoded = encode_file(file_path)
+    base_url = base_url.rstrip('/')
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python scripts/plantuml_encode.py <file.puml>")
-        sys.exit(1)
-    
-    file_path = Path(sys.argv[1])
-    
-    if not file_path.exists():
-        print(f"Error: File not found: {file_path}")
-        sys.exit(1)
-    
-    content = file_path.read_text()
-    encoded = deflate_and_encode(content)
-    
     print(f"\nFile: {file_path.name}")
     print(f"Encoded: {encoded}")
     print(f"\nURLs:")
-    print(f"  PNG: http://arch.local/plantuml/png/{encoded}")
-    print(f"  SVG: http://arch.local/plantuml/svg/{encoded}")
-    print(f"  TXT: http://arch.local/plantuml/txt/{encoded}")
+    print(f"  PNG: {base_url}/png/{encoded}")
+    print(f"  SVG: {base_url}/svg/{encoded}")
+    print(f"  TXT: {base_url}/txt/{encoded}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="PlantUML Encoding: einzelne Datei, Decode oder URL-Manifest für ein Verzeichnis",
+    )
+    parser.add_argument('path', help="Datei (.puml), Verzeichnis oder mit --decode ein encodierter String/URL")
+    parser.add_argument('--decode', action='store_true', help="path als encodierten String/URL decodieren")
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL,
+                        help=f"Basis-URL für generierte Links (default: $PLANTUML_PUBLIC_URL oder {DEFAULT_BASE_URL})")
+    parser.add_argument('--manifest', '-m', help="Manifest-Datei (.json oder .jsonl, default: <dir>/plantuml-urls.json)")
+    parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help="Parallele Prozesse (default: alle Kerne)")
+    parser.add_argument('--full', action='store_true', help="Alle Dateien neu encodieren, vorhandenes Manifest ignorieren")
+    args = parser.parse_args()
+
+    if args.decode:
+        try:
+            print(decode(args.path), end='')
+        except DecodeError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        return
+
+    path = Path(args.path)
+
+    if not path.exists():
+        print(f"Error: File not found: {path}")
+        sys.exit(1)
+
+    if path.is_dir():
+        manifest_path = Path(args.manifest) if args.manifest else path / 'plantuml-urls.json'
+        start = time.perf_counter()
+        total, encoded, removed = encode_directory(path, manifest_path, args.base_url, max(1, args.jobs), args.full)
+        print(f"Manifest: {manifest_path}")
+        print(f"  {total} diagram(s), {encoded} encoded, {total - encoded} unchanged, {removed} removed "
+              f"({time.perf_counter() - start:.2f}s)")
+        return
+
+    encode_single(path, args.base_url)
 
 if __name__ == "__main__":
     main()